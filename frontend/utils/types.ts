@@ -19,7 +19,10 @@ export interface Connection {
   port: number,
   role: string,
   password: string,
-  database_name: string
+  database_name: string,
+  pool_min_size: number,
+  pool_max_size: number,
+  pool_timeout: number
 }
 
 export interface Collection {
@@ -48,6 +51,13 @@ export interface CollectionDetail extends Collection {
   crs: Array<string>,
   storage_crs: string,
   storage_crs_coordinate_epoch: number,
+  number_matched: 'exact' | 'estimated' | 'omitted',
+  feature_engine: 'gdal' | 'postgis',
+  coordinate_precision: number | null,
+  materialized_crs: Array<string>,
+  materialized_crs_ready: Array<string>,
+  generalization: Array<number | string>,
+  generalization_ready: Array<number>,
 }
 
 export interface Namespace {
@@ -0,0 +1,459 @@
+"""
+Benchmark of the items endpoint of a running MapSage server.
+
+Reports per collection:
+    - Time to first byte, total time, size and peak server RSS of a large page (streamed, if the limit reaches APP_FEATURES_STREAMING_LIMIT,
+      run once more against a server with APP_FEATURES_STREAMING_LIMIT=0 for the built page)
+    - Size of a page with the default coordinate precision compared to the full precision
+    - Latency of the first and of repeated requests of a page (response, fragment and count caches)
+    - Latency of a page in another CRS compared to the default CRS (if --crs is given)
+    - Median and 95th percentile of the latency of pages with different bounding boxes (same statement, different filter values)
+The cache hit ratios of the server are printed at the end. To compare the feature engines, register the same layer as two collections
+(GDAL and PostGIS engine) and pass both ids.
+
+Local benchmarks of the server modules (they need the environment of the server, e.g. GDAL, and run without server):
+    - Resolution of CRSs and transformations without and with the registry of gdal_utils (--crs-resolution)
+    - Encoding of point, line and polygon geometries with the WKB encoder (wkb_utils), OGR's ExportToJson and the GDAL GeoJSON driver (--encoder)
+    - Building a collections document of --json-fields collections (default 5000) as the former static.collections.generate_object did,
+      with the JSON fields decoded on every read (as before CoreModel memoized them) and memoized (--json-fields)
+    - Planning and execution time of the bounding box count query of a PostgreSQL table with rendered literals (as GDAL runs it) and as prepared
+      statement (as the PostGIS engine runs it), from EXPLAIN ANALYZE (--explain)
+
+Usage:
+    python scripts/benchmark_items.py <collection id> [<collection id> ...] [--url http://localhost:8000/features] [--pid <server pid>]
+    python scripts/benchmark_items.py --crs-resolution [--crs <CRS URI>]
+    python scripts/benchmark_items.py --encoder [--encoder-features 10000]
+    python scripts/benchmark_items.py --json-fields [5000]
+    python scripts/benchmark_items.py --explain "<connection string>" --layer <schema.table> [--geometry-column geom]
+"""
+
+import argparse
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from typing import Optional
+import uuid
+
+import httpx
+import orjson
+
+FULL_PRECISION = 15
+# Number of requests or queries with different bounding boxes, of which the percentiles are taken
+BBOX_SAMPLES = 20
+CRS84 = "http://www.opengis.net/def/crs/OGC/1.3/CRS84"
+CRS_RESOLUTION_DEFAULTS = [
+    "http://www.opengis.net/def/crs/EPSG/0/4326",
+    "http://www.opengis.net/def/crs/EPSG/0/3857",
+    "http://www.opengis.net/def/crs/EPSG/0/25832",
+]
+
+# Vertices of the generated lines and polygon rings, decimal places of the encoded coordinates (default of degrees)
+ENCODER_VERTICES = 50
+ENCODER_PRECISION = 7
+
+# The local benchmarks import the server modules from the root directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def add_server_path() -> None:
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+def read_rss(pid: int) -> Optional[int]:
+    """Resident set size of a process in bytes (Linux only)"""
+
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+    return None
+
+class RSSSampler(object):
+    """Samples the RSS of the server process while a request runs, to catch the peak of pages, which are built in memory as a whole"""
+
+    __slots__ = ("pid", "baseline", "peak", "_stop", "_thread")
+
+    def __init__(self, pid: Optional[int], interval: float = 0.005):
+        self.pid = pid
+        self.baseline = read_rss(pid) if pid is not None else None
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, args=(interval,), daemon=True)
+
+    def _sample(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            rss = read_rss(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self) -> "RSSSampler":
+        if self.pid is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.pid is not None:
+            self._stop.set()
+            self._thread.join()
+        return False
+
+def fetch(client: httpx.Client, url: str, params: dict, pid: Optional[int] = None) -> dict:
+    """Request a page and measure the time to the first byte of the body, the total time, the size and the peak RSS of the server"""
+
+    with RSSSampler(pid) as sampler:
+        started_at = time.perf_counter()
+        with client.stream("GET", url, params=params) as response:
+            response.raise_for_status()
+            first_byte = None
+            size = 0
+            for chunk in response.iter_raw():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started_at
+                size += len(chunk)
+            total = time.perf_counter() - started_at
+            streamed = "content-length" not in response.headers
+
+    return {
+        "ttfb": first_byte if first_byte is not None else total,
+        "total": total,
+        "size": size,
+        "streamed": streamed,
+        "rss_peak": sampler.peak,
+        "rss_growth": sampler.peak - sampler.baseline if sampler.peak is not None and sampler.baseline is not None else None,
+    }
+
+def format_bytes(size: Optional[int]) -> str:
+    if size is None:
+        return "n/a"
+
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} GiB"
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f} ms"
+
+def format_us(seconds: float) -> str:
+    return f"{seconds * 1000000:.1f} µs"
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def get_random_bboxes(extent: list[float], count: int) -> list[list[float]]:
+    """Bounding boxes with a tenth of the width and height of the extent (xmin, ymin, xmax, ymax), the same ones on every run"""
+
+    generator = random.Random(0)
+    xmin, ymin, xmax, ymax = extent
+    width, height = (xmax - xmin) / 10, (ymax - ymin) / 10
+    bboxes = []
+    for _ in range(count):
+        x, y = generator.uniform(xmin, xmax - width), generator.uniform(ymin, ymax - height)
+        bboxes.append([x, y, x + width, y + height])
+
+    return bboxes
+
+def time_call(func, *args) -> float:
+    started_at = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started_at
+
+def benchmark_large_page(client: httpx.Client, items_url: str, limit: int, pid: Optional[int]) -> None:
+    result = fetch(client, items_url, {"limit": limit}, pid)
+    print(f"  Large page (limit={limit}, {'streamed' if result['streamed'] else 'built'})")
+    print(f"    time to first byte: {format_ms(result['ttfb'])}, total: {format_ms(result['total'])}, size: {format_bytes(result['size'])}")
+    if pid is not None:
+        print(f"    server RSS peak: {format_bytes(result['rss_peak'])} (+{format_bytes(result['rss_growth'])} during the request)")
+
+def benchmark_precision(client: httpx.Client, items_url: str, limit: int) -> None:
+    default_size = fetch(client, items_url, {"limit": limit})["size"]
+    full_size = fetch(client, items_url, {"limit": limit, "coordinate-precision": FULL_PRECISION})["size"]
+    savings = 1 - default_size / full_size if full_size > 0 else 0.0
+    print(f"  Coordinate precision (limit={limit})")
+    print(f"    default: {format_bytes(default_size)}, full ({FULL_PRECISION} decimal places): {format_bytes(full_size)}, saved: {savings:.1%}")
+
+def benchmark_repeated(client: httpx.Client, items_url: str, limit: int, repeat: int) -> None:
+    # The page is only uncached on its first request since the start of the server or the expiry of the cached response
+    first = fetch(client, items_url, {"limit": limit})["total"]
+    repeated = [fetch(client, items_url, {"limit": limit})["total"] for _ in range(repeat)]
+    # A shifted page misses the response cache, but its features are (mostly) in the fragment cache
+    shifted = fetch(client, items_url, {"limit": limit, "offset": 1})["total"]
+    print(f"  Repeated requests (limit={limit})")
+    print(f"    first: {format_ms(first)}, repeated (median of {repeat}): {format_ms(statistics.median(repeated))}, shifted by one feature: {format_ms(shifted)}")
+
+def benchmark_crs(client: httpx.Client, items_url: str, limit: int, crs: str, repeat: int) -> None:
+    # Different offsets, so the pages aren't answered from the response cache
+    default_times = [fetch(client, items_url, {"limit": limit, "offset": 2 + index})["total"] for index in range(repeat)]
+    crs_times = [fetch(client, items_url, {"limit": limit, "offset": 2 + index, "crs": crs})["total"] for index in range(repeat)]
+    print(f"  Reprojection (limit={limit}, median of {repeat})")
+    print(f"    default CRS: {format_ms(statistics.median(default_times))}, {crs}: {format_ms(statistics.median(crs_times))}")
+
+def benchmark_bbox(client: httpx.Client, collection_url: str, items_url: str, limit: int) -> None:
+    response = client.get(collection_url, headers={"Accept": "application/json"})
+    response.raise_for_status()
+    bbox = response.json()["extent"]["spatial"]["bbox"][0]
+    # 2D or 3D bounding box of the extent
+    extent = [bbox[0], bbox[1], bbox[len(bbox) // 2], bbox[len(bbox) // 2 + 1]]
+
+    # Every bounding box misses the response cache, but the statement of the page query is the same
+    times = [fetch(client, items_url, {"limit": limit, "bbox": ",".join(str(value) for value in bbox)})["total"] for bbox in get_random_bboxes(extent, BBOX_SAMPLES)]
+    print(f"  Bounding boxes (limit={limit}, {BBOX_SAMPLES} different bounding boxes)")
+    print(f"    median: {format_ms(statistics.median(times))}, p95: {format_ms(percentile(times, 95))}")
+
+def benchmark_crs_resolution(crs_list: list[str], repeat: int) -> None:
+    add_server_path()
+    from osgeo import osr
+    from server.utils import gdal_utils
+
+    def resolve_uncached(crs: str) -> None:
+        # As every request did before the registry: Resolve both CRSs from their URIs and create the transformation
+        source = osr.SpatialReference(gdal_utils._resolve_wkt(CRS84))
+        target = osr.SpatialReference(gdal_utils._resolve_wkt(crs))
+        osr.CoordinateTransformation(source, target)
+
+    registry = gdal_utils.SpatialRefRegistry()
+    print(f"CRS resolution (transformation from CRS84, median of {repeat})")
+    for crs in crs_list:
+        uncached = statistics.median(time_call(resolve_uncached, crs) for _ in range(repeat))
+        first = time_call(registry.get_transformation, CRS84, crs)
+        cached = statistics.median(time_call(registry.get_transformation, CRS84, crs) for _ in range(repeat))
+        print(f"  {crs}")
+        print(f"    uncached: {format_us(uncached)}, registry (first): {format_us(first)}, registry (cached): {format_us(cached)}")
+
+def create_encoder_layers(count: int):
+    """Memory dataset with a point, a line and a polygon layer of random geometries (the same ones on every run)"""
+
+    from osgeo import gdal, ogr
+
+    generator = random.Random(0)
+
+    def get_positions(vertices: int) -> str:
+        x, y = generator.uniform(-180, 170), generator.uniform(-80, 70)
+        return ", ".join(f"{x + generator.uniform(0, 10)} {y + generator.uniform(0, 10)}" for _ in range(vertices))
+
+    def get_polygon() -> str:
+        ring = get_positions(ENCODER_VERTICES - 1)
+        return f"POLYGON (({ring}, {ring.split(', ', 1)[0]}))"
+
+    layers = [
+        ("point", ogr.wkbPoint, lambda: f"POINT ({get_positions(1)})"),
+        ("line", ogr.wkbLineString, lambda: f"LINESTRING ({get_positions(ENCODER_VERTICES)})"),
+        ("polygon", ogr.wkbPolygon, get_polygon),
+    ]
+
+    dataset = gdal.GetDriverByName("Memory").Create("", 0, 0, 0, gdal.GDT_Unknown)
+    for name, geometry_type, get_wkt in layers:
+        layer = dataset.CreateLayer(name, geom_type=geometry_type)
+        for _ in range(count):
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetGeometry(ogr.CreateGeometryFromWkt(get_wkt()))
+            layer.CreateFeature(feature)
+
+    return dataset, [name for name, _, _ in layers]
+
+def benchmark_encoder(count: int, repeat: int) -> None:
+    add_server_path()
+    from osgeo import gdal
+    from server.utils import wkb_utils
+
+    if wkb_utils.numpy is None:
+        print("Encoder: NumPy is not installed, the WKB encoder isn't used")
+        return
+
+    dataset, layer_names = create_encoder_layers(count)
+    options = [f"COORDINATE_PRECISION={ENCODER_PRECISION}"]
+
+    def encode_wkb(geometries: list) -> None:
+        # As feature.encode_geometries: One pass over the WKB of the batch
+        wkb_utils.encode_geometries([geometry.ExportToIsoWkb() for geometry in geometries], ENCODER_PRECISION)
+
+    def encode_json(geometries: list) -> None:
+        [geometry.ExportToJson(options=options).encode("utf-8") for geometry in geometries]
+
+    def encode_driver(layer_name: str) -> None:
+        translate_options = gdal.VectorTranslateOptions(format="GeoJSON", layers=[layer_name], layerCreationOptions=options)
+        gdal.VectorTranslate("/vsimem/benchmark_encoder.geojson", dataset, options=translate_options)
+        gdal.Unlink("/vsimem/benchmark_encoder.geojson")
+
+    print(f"Encoder ({count} geometries per layer, {ENCODER_PRECISION} decimal places, median of {repeat})")
+    for layer_name in layer_names:
+        layer = dataset.GetLayerByName(layer_name)
+        geometries = [feature.GetGeometryRef().Clone() for feature in layer]
+        wkb_time = statistics.median(time_call(encode_wkb, geometries) for _ in range(repeat))
+        json_time = statistics.median(time_call(encode_json, geometries) for _ in range(repeat))
+        driver_time = statistics.median(time_call(encode_driver, layer_name) for _ in range(repeat))
+        print(f"  {layer_name}")
+        print(f"    WKB encoder: {format_ms(wkb_time)}, ExportToJson: {format_ms(json_time)}, GeoJSON driver (whole features): {format_ms(driver_time)}")
+
+def create_collection_tables(count: int) -> list:
+    add_server_path()
+    from server.database import models
+
+    crs_list = ["http://www.opengis.net/def/crs/OGC/1.3/CRS84"] + CRS_RESOLUTION_DEFAULTS
+    collections = []
+    for index in range(count):
+        collection = models.CollectionTable(
+            id=f"collection_{index}",
+            layer_name=f"public.layer_{index}",
+            title=f"Collection {index}",
+            links_json=[],
+            extent_json={"spatial": {"bbox": [[5.8, 47.2, 15.1, 55.1]], "crs": crs_list[0]}, "temporal": {"interval": [[None, None]]}},
+            crs_json=crs_list[:2 + index % 3],
+            dataset_uuid=uuid.uuid4(),
+        )
+        collection.pre_render()
+        collections.append(collection)
+
+    return collections
+
+def build_collections_document(collections: list, read) -> bytes:
+    """The collections document as the former static.collections.generate_object built it, reading the JSON fields with read(collection, name)"""
+
+    shared_crs = set.intersection(*(set(read(collection, "crs_json")) for collection in collections))
+    documents = []
+    for collection in collections:
+        specific_crs = [crs for crs in read(collection, "crs_json") if crs not in shared_crs]
+        if len(shared_crs) > 0:
+            specific_crs.insert(0, "#/crs")
+        documents.append({"id": collection.id, "title": collection.title, "links": read(collection, "links_json"), "extent": read(collection, "extent_json"), "crs": specific_crs})
+
+    return orjson.dumps({"collections": documents, "crs": sorted(shared_crs)})
+
+def benchmark_json_fields(count: int, repeat: int) -> None:
+    def read_decoded(collection, name: str):
+        # The stored string, decoded on every read
+        return orjson.loads(collection.__dict__[name])
+
+    decoded = statistics.median(time_call(build_collections_document, create_collection_tables(count), read_decoded) for _ in range(repeat))
+    memoized_first = []
+    memoized_repeated = []
+    for _ in range(repeat):
+        collections = create_collection_tables(count)
+        memoized_first.append(time_call(build_collections_document, collections, getattr))
+        memoized_repeated.append(time_call(build_collections_document, collections, getattr))
+
+    print(f"JSON fields (collections document of {count} collections, median of {repeat})")
+    print(f"  decoded on every read: {format_ms(decoded)}, memoized (first build): {format_ms(statistics.median(memoized_first))}, "
+          f"memoized (repeated build): {format_ms(statistics.median(memoized_repeated))}")
+
+def benchmark_planning(conninfo: str, layer_name: str, geometry_column: str) -> None:
+    add_server_path()
+    import psycopg
+    from server.ogc_apis.features.implementation.dynamic import postgis_query
+
+    schema, table = layer_name.split(".", 1)
+    relation = f"{postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(table)}"
+    geometry = postgis_query.quote_identifier(geometry_column)
+    statement_name = "mapsage_benchmark"
+
+    def explain(connection: psycopg.Connection, statement: str) -> tuple[float, float]:
+        plan = connection.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement).fetchone()[0]
+        if isinstance(plan, str):
+            plan = orjson.loads(plan)
+        # Milliseconds
+        return plan[0]["Planning Time"] / 1000, plan[0]["Execution Time"] / 1000
+
+    with psycopg.connect(conninfo, autocommit=True) as connection:
+        srid = connection.execute("SELECT Find_SRID(%s, %s, %s)", (schema, table, geometry_column)).fetchone()[0]
+        extent = connection.execute(f"SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (SELECT ST_Extent({geometry}) AS e FROM {relation}) AS extent").fetchone()
+        filters = [postgis_query.compile_bbox_filter(postgis_query.CompiledFilter(), geometry_column, srid, bbox, srid, False) for bbox in get_random_bboxes(list(extent), BBOX_SAMPLES)]
+        query = f"SELECT count(*) FROM {relation}"
+
+        # As GDAL runs the filter: The values are rendered into the statement, so every query is planned
+        rendered_times = [explain(connection, query + compiled.render()) for compiled in filters]
+
+        # As the PostGIS engine runs the filter (prepare=True). PostgreSQL plans the first executions with the values and then switches to
+        # the generic plan, if that isn't more expensive (plan_cache_mode=auto).
+        placeholders = iter(range(1, len(filters[0].params) + 1))
+        connection.execute(f"PREPARE {statement_name} AS " + re.sub("%s", lambda _: f"${next(placeholders)}", query + filters[0].where))
+        try:
+            prepared_times = [explain(connection, f"EXECUTE {statement_name} ({', '.join(postgis_query.quote_literal(param) for param in compiled.params)})") for compiled in filters]
+        finally:
+            connection.execute(f"DEALLOCATE {statement_name}")
+
+    print(f"Bounding box count query of {layer_name} ({BBOX_SAMPLES} different bounding boxes, EXPLAIN ANALYZE)")
+    for label, times in (("rendered literals (GDAL)", rendered_times), ("prepared statement (PostGIS engine)", prepared_times)):
+        planning = [planning_time for planning_time, _ in times]
+        execution = [execution_time for _, execution_time in times]
+        print(f"  {label}")
+        print(f"    planning median: {format_ms(statistics.median(planning))}, p95: {format_ms(percentile(planning, 95))}; "
+              f"execution median: {format_ms(statistics.median(execution))}, p95: {format_ms(percentile(execution, 95))}")
+
+def print_cache_stats(client: httpx.Client, base_url: str) -> None:
+    # The metrics are served next to the mounted APIs
+    metrics_url = base_url.rstrip("/").rsplit("/", 1)[0] + "/metrics"
+    try:
+        response = client.get(metrics_url)
+        response.raise_for_status()
+    except httpx.HTTPError as error:
+        print(f"Metrics not available at {metrics_url}: {error}")
+        return
+
+    print("Cache hit ratios")
+    for line in response.text.splitlines():
+        if line.startswith("mapsage_cache_hit_ratio"):
+            print(f"  {line}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark of the items endpoint of a running MapSage server")
+    parser.add_argument("collections", nargs="*", help="Ids of the collections to benchmark")
+    parser.add_argument("--url", default=os.getenv("MAPSAGE_URL", "http://localhost:8000/features"), help="URL of the features API")
+    parser.add_argument("--pid", type=int, help="Process id of the server, to sample its RSS (Linux only)")
+    parser.add_argument("--large-limit", type=int, default=100000, help="Limit of the large page")
+    parser.add_argument("--limit", type=int, default=1000, help="Limit of the other pages")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of repetitions of timed requests")
+    parser.add_argument("--crs", help="CRS to compare the reprojected pages with the default CRS (e.g. http://www.opengis.net/def/crs/EPSG/0/25832)")
+    parser.add_argument("--crs-resolution", action="store_true", help="Benchmark the resolution of CRSs (of --crs or some common ones) locally")
+    parser.add_argument("--encoder", action="store_true", help="Benchmark the encoders of the geometries locally")
+    parser.add_argument("--encoder-features", type=int, default=10000, help="Number of geometries per layer of the encoder benchmark")
+    parser.add_argument("--json-fields", type=int, nargs="?", const=5000, metavar="COLLECTIONS", help="Benchmark the decoding of the JSON fields of the collection tables locally")
+    parser.add_argument("--explain", metavar="CONNECTION", help="Benchmark the planning of the bounding box filter locally in this PostgreSQL database (libpq connection string)")
+    parser.add_argument("--layer", help="Table (schema.table) of the planning benchmark")
+    parser.add_argument("--geometry-column", default="geom", help="Geometry column of the table of the planning benchmark")
+    args = parser.parse_args()
+    if args.explain is not None and args.layer is None:
+        parser.error("--explain requires --layer")
+
+    if args.crs_resolution:
+        benchmark_crs_resolution([args.crs] if args.crs is not None else CRS_RESOLUTION_DEFAULTS, max(args.repeat, 100))
+    if args.encoder:
+        benchmark_encoder(args.encoder_features, args.repeat)
+    if args.json_fields is not None:
+        benchmark_json_fields(args.json_fields, args.repeat)
+    if args.explain is not None:
+        benchmark_planning(args.explain, args.layer, args.geometry_column)
+
+    if not args.collections:
+        return 0
+
+    headers = {"Accept": "application/geo+json"}
+    with httpx.Client(base_url=args.url.rstrip("/") + "/", headers=headers, timeout=600) as client:
+        for collection_id in args.collections:
+            items_url = f"collections/{collection_id}/items"
+            print(f"Collection '{collection_id}'")
+            benchmark_large_page(client, items_url, args.large_limit, args.pid)
+            benchmark_precision(client, items_url, args.limit)
+            benchmark_repeated(client, items_url, args.limit, args.repeat)
+            if args.crs is not None:
+                benchmark_crs(client, items_url, args.limit, args.crs, args.repeat)
+            benchmark_bbox(client, f"collections/{collection_id}", items_url, args.limit)
+
+        print_cache_stats(client, args.url)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
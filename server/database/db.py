@@ -1,6 +1,9 @@
 from contextlib import contextmanager
+import enum
 import os
 import logging
+import sqlite3
+import threading
 from typing import Callable, Union
 from uuid import UUID
 
@@ -8,7 +11,8 @@ from sqlalchemy import Engine, text, exc
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlmodel import SQLModel, Session, create_engine, select
 
-from server.database.models import CoreModel, GeneralOption, KeyValueBase, PreRenderedJson, TableBase, License
+from server.database.models import CollectionTable, CoreModel, GeneralOption, KeyValueBase, PreRenderedJson, TableBase, License
+from server.ogc_apis.features.implementation.pre_render_helper import BASE_URL_PLACEHOLDER
 
 # local logger
 _LOGGER = logging.getLogger("database")
@@ -46,6 +50,36 @@ class SetupSqliteDatabase():
             License.get_default_licenses,
         ]
 
+    @classmethod
+    def add_missing_columns(cls, sqlite_engine: Engine) -> None:
+        """
+        Add columns of the table models, which don't exist in the tables of an already existing database.\n
+        create_all only creates missing tables, so new (optional) columns of a model would otherwise break older databases.
+        """
+        
+        with sqlite_engine.begin() as connection:
+            for table in SQLModel.metadata.sorted_tables:
+                existing_columns = {row[1] for row in connection.execute(text(f'PRAGMA table_info("{table.name}")'))}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    
+                    column_type = column.type.compile(dialect=sqlite_engine.dialect)
+                    statement = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                    
+                    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                    if isinstance(default, enum.Enum):
+                        default = default.value
+                    if isinstance(default, bool):
+                        default = int(default)
+                    if isinstance(default, str):
+                        statement += " DEFAULT '" + default.replace("'", "''") + "'"
+                    elif isinstance(default, (int, float)):
+                        statement += f" DEFAULT {default}"
+                    
+                    _LOGGER.info(msg=f"Adding missing column [{column.name}] to table [{table.name}]")
+                    connection.execute(text(statement))
+    
     # TODO: Check all avialabe collections on startup, to see if they are still available
     @classmethod
     def setup(cls, sqlite_engine: Engine, reset_db: bool) -> None:
@@ -75,6 +109,15 @@ class SetupSqliteDatabase():
         _LOGGER.info(msg="Creating database tables")
 
         SQLModel.metadata.create_all(sqlite_engine)
+        cls.add_missing_columns(sqlite_engine)
+        
+        # Collections pre-rendered with the base URL of a request (before the base URL placeholder) are rendered again on their next request
+        with Session(sqlite_engine) as session:
+            session.exec(
+                text(f"UPDATE {CollectionTable.__tablename__} SET pre_rendered_json = NULL WHERE pre_rendered_json NOT LIKE :placeholder")
+                .bindparams(placeholder=f"%{BASE_URL_PLACEHOLDER}%")
+            )
+            session.commit()
         
         # Retrieve the default options from the General class
         default_options = GeneralOption.get_default_options()
@@ -115,6 +158,10 @@ class Database():
     debug_mode = os.getenv("APP_DEBUG_MODE", "False") == "True"
     sqlite_file_name = "data.db"
     sqlite_engine: Engine = init_sqlite_engine(sqlite_file_name, debug_mode)
+    
+    # Dedicated connection, which only reads the data version
+    _data_version_connection: sqlite3.Connection = None
+    _data_version_lock = threading.Lock()
 
     def __init__(self):
         raise RuntimeError("Database class cannot be instantiated")
@@ -131,6 +178,20 @@ class Database():
         
         return cls.sqlite_engine
 
+    @classmethod
+    def get_data_version(cls) -> int:
+        """
+        Get the `PRAGMA data_version` of the SQLite database. It changes whenever another connection (of any process) committed changes,
+        so in-memory copies of the database content can check cheaply, whether they are outdated.
+        """
+        
+        with cls._data_version_lock:
+            if cls._data_version_connection is None:
+                database_file = cls.get_sqlite_engine().url.database
+                cls._data_version_connection = sqlite3.connect(database_file, check_same_thread=False, isolation_level=None)
+            
+            return cls._data_version_connection.execute("PRAGMA data_version").fetchone()[0]
+    
     @classmethod
     def get_sqlite_session(cls):
         if cls.sqlite_engine is None:
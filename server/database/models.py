@@ -4,7 +4,7 @@ import uuid as unique_id
 
 import orjson
 from pydantic import field_validator
-from sqlalchemy import Column, ForeignKey, String
+from sqlalchemy import Column, ForeignKey, String, event
 from sqlmodel import Field, Relationship, SQLModel, Enum
 from sqlalchemy.orm import declared_attr
 from sqlalchemy.dialects.postgresql import UUID as pg_uuid
@@ -12,6 +12,7 @@ from sqlalchemy import engine
 
 from server.ogc_apis.features.models import collection as features_api_collection
 from server.ogc_apis.features.implementation import pre_render_helper
+from server.utils import cache_utils
 from server.utils.string_utils import camel_to_snake
 from server.ogc_apis import ogc_api_config
 
@@ -31,20 +32,38 @@ class CoreModel(SQLModel):
     
     # Overwrite __setattr__ to automatically convert list and dict to json strings, when directly setting the attribute
     def __setattr__(self, name, value):
-        if 'json' in name.lower() and value is not None and not isinstance(value, str):
-            if isinstance(value, (list, dict)):
-                value = orjson.dumps(value).decode("utf-8")
-            else:
-                raise ValueError("JSON field must be a string, list or dictionary")
+        if 'json' in name.lower():
+            if value is not None and not isinstance(value, str):
+                if isinstance(value, (list, dict)):
+                    value = orjson.dumps(value).decode("utf-8")
+                else:
+                    raise ValueError("JSON field must be a string, list or dictionary")
+            
+            _drop_decoded_json(self, name)
         
         super().__setattr__(name, value)
     
     # Overwrite __getattribute__ to automatically convert json strings to list or dict, when accessing the attribute
+    # The decoded value is memoized per instance together with the string it was decoded from, so it is only decoded again, if the string changed
+    # (e.g. set, refreshed or expired). It is frozen (see cache_utils.freeze), since every read returns the same object.
     def __getattribute__(self, name):
         if 'json' in name.lower():
             value = super().__getattribute__(name)
-            if value is not None:
-                return orjson.loads(value)
+            if not isinstance(value, str):
+                return value
+            
+            instance_dict = super().__getattribute__("__dict__")
+            decoded_fields = instance_dict.get("_decoded_fields", None)
+            if decoded_fields is None:
+                decoded_fields = {}
+                instance_dict["_decoded_fields"] = decoded_fields
+            
+            decoded = decoded_fields.get(name, None)
+            if decoded is None or decoded[0] is not value:
+                decoded = (value, cache_utils.freeze(orjson.loads(value)))
+                decoded_fields[name] = decoded
+            
+            return decoded[1]
         
         return super().__getattribute__(name)
     
@@ -76,6 +95,28 @@ class CoreModel(SQLModel):
         validate_json_field.__name__ = f"validate_{field_name}"
         return validate_json_field
 
+def _drop_decoded_json(instance: Optional[CoreModel], name: Optional[str] = None) -> None:
+    # The events of instances, which are already garbage collected, are called without instance
+    if instance is None:
+        return
+    
+    decoded_fields = instance.__dict__.get("_decoded_fields", None)
+    if decoded_fields is None:
+        return
+    
+    if name is None:
+        decoded_fields.clear()
+    else:
+        decoded_fields.pop(name, None)
+
+@event.listens_for(CoreModel, "refresh", propagate=True)
+def _on_refresh(instance: CoreModel, context, attrs) -> None:
+    _drop_decoded_json(instance)
+
+@event.listens_for(CoreModel, "expire", propagate=True)
+def _on_expire(instance: CoreModel, attrs) -> None:
+    _drop_decoded_json(instance)
+
 class TableBase(CoreModel):
     uuid: unique_id.UUID = Field(default_factory=unique_id.uuid4, primary_key=True)
 
@@ -91,6 +132,10 @@ class Dataset(TableBase, table=True):
     type: Type = Field(sa_column=Column(Enum(Type)))
     # Path or connection string to the dataset
     path: str
+    # Settings of the async connection pool of PostgreSQL datasets (timeout in seconds to wait for a free connection)
+    pool_min_size: int = Field(default=1)
+    pool_max_size: int = Field(default=10)
+    pool_timeout: float = Field(default=30.0)
     
     collections: list["CollectionTable"] = Relationship(back_populates="dataset", cascade_delete=True)
     
@@ -120,10 +165,21 @@ class Dataset(TableBase, table=True):
             if path is None:
                 raise ValueError("Path is required")
         
+        pool_min_size = int(obj.get("pool_min_size") if obj.get("pool_min_size") is not None else 1)
+        pool_max_size = int(obj.get("pool_max_size") if obj.get("pool_max_size") is not None else 10)
+        pool_timeout = float(obj.get("pool_timeout") if obj.get("pool_timeout") is not None else 30.0)
+        if pool_min_size < 0 or pool_max_size < max(pool_min_size, 1):
+            raise ValueError("Pool sizes must be positive and the maximum size must be at least the minimum size")
+        if pool_timeout <= 0:
+            raise ValueError("Pool timeout must be greater than 0")
+        
         return cls(
             name=name,
             type=cls.Type(type_value),
-            path=path
+            path=path,
+            pool_min_size=pool_min_size,
+            pool_max_size=pool_max_size,
+            pool_timeout=pool_timeout,
         )
     
     def to_dict(self, short: bool = False, show_password: bool = False) -> dict:
@@ -148,6 +204,9 @@ class Dataset(TableBase, table=True):
             obj["role"] = connection_string.username
             obj["password"] = connection_string.password if show_password else "********"
             obj["database_name"] = connection_string.database
+            obj["pool_min_size"] = self.pool_min_size
+            obj["pool_max_size"] = self.pool_max_size
+            obj["pool_timeout"] = self.pool_timeout
         else:
             obj["path"] = self.path
             
@@ -241,6 +300,10 @@ class License(TableBase, table=True):
         return licenses
     
 class CollectionTable(TableBase, table=True):
+    class FeatureEngine(str, enum.Enum):
+        GDAL = "gdal"
+        POSTGIS = "postgis"
+    
     # id with index for faster search when querying specific id
     id: str = Field(index=True, unique=True)
     layer_name: str
@@ -259,6 +322,25 @@ class CollectionTable(TableBase, table=True):
     crs_json: str = Field(default="""["http://www.opengis.net/def/crs/OGC/1.3/CRS84"]""")                   # JSON
     storage_crs: str = Field(default="http://www.opengis.net/def/crs/OGC/1.3/CRS84")
     storage_crs_coordinate_epoch: Optional[float] = Field(default=None)
+    # CRSs of crs_json, whose reprojected geometries are kept in materialized views of PostgreSQL datasets (see materialized_geometry) and those, whose view is already built
+    materialized_crs_json: Optional[str] = Field(default=None)                                              # JSON
+    materialized_crs_ready_json: Optional[str] = Field(default=None)                                        # JSON
+    # Scale denominators of the pre-generalized copies of the layer (see generalized_geometry) and those, whose copy is already built
+    generalization_json: Optional[str] = Field(default=None)                                                # JSON
+    generalization_ready_json: Optional[str] = Field(default=None)                                          # JSON
+    
+    # Default policy for the numberMatched member of items responses (exact, estimated or omitted), can be overwritten per request
+    number_matched: str = Field(default=ogc_api_config.params.NumberMatched.exact.value)
+    # Engine, which reads the items (gdal for all datasets, postgis to build the GeoJSON inside the database for PostgreSQL datasets)
+    feature_engine: str = Field(default=FeatureEngine.GDAL.value)
+    # Decimal places of the coordinates in GeoJSON responses, can be overwritten per request (None uses the default of the unit of the response CRS)
+    coordinate_precision: Optional[int] = Field(default=None)
+    
+    # Layer metadata resolved when the collection is created (or refreshed in the web admin), so items requests don't resolve it from the dataset again
+    fid_column: Optional[str] = Field(default=None)
+    geometry_column: Optional[str] = Field(default=None)
+    srid: Optional[int] = Field(default=None)
+    fields_json: Optional[str] = Field(default=None)                                                        # JSON
     
     dataset_uuid: unique_id.UUID = Field(sa_column=Column(pg_uuid(as_uuid=True), ForeignKey(f"{Dataset.__tablename__}.uuid", ondelete="CASCADE", onupdate="CASCADE"), nullable=False))
     
@@ -282,9 +364,10 @@ class CollectionTable(TableBase, table=True):
         
         return collection
     
-    # TODO: Delete column on restart / Better solution to access endpoints from different user url (e.g. localhost:8000 and localhost)
-    def pre_render(self, app_base_url: str = "") -> None:
-        app_base_url = app_base_url.rstrip("/")
+    def pre_render(self) -> None:
+        """Render the links and the collection document with the base URL placeholder (see pre_render_helper.BASE_URL_PLACEHOLDER)"""
+        
+        app_base_url = pre_render_helper.BASE_URL_PLACEHOLDER
 
         link_root = {
             "url": f"{app_base_url}{ogc_api_config.routes.FEATURES}",
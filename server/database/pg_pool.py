@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import uuid as unique_id
+
+from psycopg_pool import AsyncConnectionPool
+
+from server.database import models
+from server.utils import metrics
+
+_LOGGER = logging.getLogger("database")
+
+# One pool per dataset: dataset uuid -> (settings, event loop, pool)
+# A pool is bound to the event loop it was opened in, so it is recreated if the loop or the settings of the dataset changed
+_POOLS: dict[unique_id.UUID, tuple[tuple, asyncio.AbstractEventLoop, AsyncConnectionPool]] = {}
+
+def _get_pool_settings(dataset: models.Dataset) -> tuple:
+    return (dataset.path, dataset.pool_min_size, dataset.pool_max_size, dataset.pool_timeout)
+
+async def get_pool(dataset: models.Dataset) -> AsyncConnectionPool:
+    """Get the connection pool of a PostgreSQL dataset. The pool is opened on first use.
+
+    Raises:
+        ValueError: If the dataset is not a PostgreSQL dataset.
+    """
+
+    if dataset.type != models.Dataset.Type.DB:
+        raise ValueError(f"Dataset '{dataset.name}' is not a PostgreSQL dataset")
+
+    loop = asyncio.get_running_loop()
+    settings = _get_pool_settings(dataset)
+
+    entry = _POOLS.get(dataset.uuid)
+    if entry is not None:
+        pool_settings, pool_loop, pool = entry
+        if pool_settings == settings and pool_loop is loop and not pool.closed:
+            return pool
+
+        _POOLS.pop(dataset.uuid, None)
+        if pool_loop is loop:
+            await pool.close()
+
+    path, min_size, max_size, timeout = settings
+    _LOGGER.info(msg=f"Opening connection pool for dataset [{dataset.name}] (min {min_size}, max {max_size}, timeout {timeout}s)")
+    pool = AsyncConnectionPool(
+        conninfo=path,
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        name=dataset.name,
+        kwargs={"autocommit": True},
+        open=False,
+    )
+    # Don't wait for the minimum number of connections, the first request waits for its connection anyway
+    await pool.open(wait=False)
+
+    # Another request could have opened a pool while waiting
+    entry = _POOLS.get(dataset.uuid)
+    if entry is not None and entry[0] == settings and entry[1] is loop:
+        await pool.close()
+        return entry[2]
+
+    _POOLS[dataset.uuid] = (settings, loop, pool)
+    return pool
+
+async def close_pools() -> None:
+    """Close all pools of the running event loop."""
+
+    loop = asyncio.get_running_loop()
+    for dataset_uuid, (_, pool_loop, pool) in list(_POOLS.items()):
+        if pool_loop is not loop:
+            continue
+
+        _POOLS.pop(dataset_uuid, None)
+        await pool.close()
+
+def close_pool(dataset_uuid: unique_id.UUID) -> None:
+    """Close the pool of a dataset (e.g. after it was deleted) from any thread. The pool is closed on the event loop it was opened in."""
+
+    entry = _POOLS.pop(dataset_uuid, None)
+    if entry is None:
+        return
+
+    _, pool_loop, pool = entry
+    # The pool is unusable anyway, if its loop was already closed
+    if pool_loop.is_closed():
+        return
+
+    _LOGGER.info(msg=f"Closing connection pool for dataset [{pool.name}]")
+    asyncio.run_coroutine_threadsafe(pool.close(), pool_loop)
+
+def _collect_pool_metrics() -> list[metrics.MetricFamily]:
+    families = {
+        "pool_size": ("mapsage_pg_pool_size", "gauge", "Number of open connections of the pool", []),
+        "pool_max": ("mapsage_pg_pool_max_size", "gauge", "Maximum number of connections of the pool", []),
+        "pool_in_use": ("mapsage_pg_pool_in_use", "gauge", "Number of connections lent to requests or being prepared", []),
+        "requests_waiting": ("mapsage_pg_pool_requests_waiting", "gauge", "Number of requests waiting for a connection", []),
+        "requests_num": ("mapsage_pg_pool_requests_total", "counter", "Number of connection requests to the pool", []),
+        "requests_queued": ("mapsage_pg_pool_requests_queued_total", "counter", "Number of connection requests, which had to wait for a connection", []),
+        "requests_wait_ms": ("mapsage_pg_pool_requests_wait_ms_total", "counter", "Total time requests waited for a connection in milliseconds", []),
+        "requests_errors": ("mapsage_pg_pool_requests_errors_total", "counter", "Number of connection requests, which failed (e.g. timeout)", []),
+    }
+
+    for dataset_uuid, (_, _, pool) in list(_POOLS.items()):
+        stats = pool.get_stats()
+        stats["pool_in_use"] = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        labels = {"dataset": str(dataset_uuid), "name": pool.name}
+        for key, family in families.items():
+            family[3].append((labels, stats.get(key, 0)))
+
+    return list(families.values())
+
+metrics.register_collector("pg_pool", _collect_pool_metrics)
@@ -20,7 +20,9 @@ class GeoJSONResponse(Response):
             return orjson.dumps(content)
         if type(content) is str:
             return content.encode("utf-8")
-        raise ValueError("Invalid content type. Expected a dictionary or string.")
+        if type(content) is bytes:
+            return content
+        raise ValueError("Invalid content type. Expected a dictionary, string or bytes.")
 
 class ReturnFormat(str, Enum):
     json = "json"
@@ -1,3 +1,5 @@
+from enum import Enum
+import os
 from typing import Any, Optional
 import orjson
 from fastapi import HTTPException, Header, Query, Request
@@ -6,6 +8,23 @@ from typing_extensions import Annotated
 from . import formats
 
 LIMIT_MAXIMUM = 100000
+# GeoJSON pages with at least this limit are streamed instead of built in memory (0 disables streaming)
+STREAMING_LIMIT_THRESHOLD = int(os.getenv("APP_FEATURES_STREAMING_LIMIT", "10000"))
+
+# Decimal places of the coordinates, if neither the request nor the collection sets them (negative values keep the full precision).
+# 7 decimal places of a degree and 3 decimal places of a metre are both about a millimetre to a centimetre on the ground.
+COORDINATE_PRECISION_DEGREES = int(os.getenv("APP_COORDINATE_PRECISION_DEGREES", "7"))
+COORDINATE_PRECISION_METRES = int(os.getenv("APP_COORDINATE_PRECISION_METRES", "3"))
+COORDINATE_PRECISION_MAXIMUM = 15
+# Deepest zoom level of the WebMercatorQuad tile matrix set accepted by the zoom-level parameter
+ZOOM_LEVEL_MAXIMUM = 30
+
+class NumberMatched(str, Enum):
+    """Policy how the numberMatched member of an items response is determined"""
+    
+    exact = "exact"
+    estimated = "estimated"
+    omitted = "omitted"
 
 def get_format_query(
     _f_docs: Annotated[formats.ReturnFormat, Field(
@@ -88,8 +107,24 @@ def validate_bbox(bbox_param: Any) -> list[float]:
             detail="Bounding box should be specified as comma-separated numbers"
         )
         
+def parse_properties(properties: Optional[str]) -> Optional[list[str]]:
+    """Parse the comma-separated properties parameter. None selects all properties, an empty list none of them. \n
+    The names are only checked against the schema of the layer by the implementation.
+    """
+    
+    if properties is None:
+        return None
+    
+    names = []
+    for name in properties.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    
+    return names
+
 def validate_items_parameters(request: Request):
-    allowed_params = {"limit", "offset", "bbox", "bbox-crs", "datetime", "crs", "f"}
+    allowed_params = {"limit", "offset", "cursor", "bbox", "bbox-crs", "datetime", "crs", "number-matched", "properties", "skipGeometry", "coordinate-precision", "scale-denominator", "zoom-level", "f"}
     query_params = request.query_params
     unrecognized_params = set(query_params.keys()) - allowed_params
     
@@ -28,8 +28,8 @@ from fastapi import (  # noqa: F401
 )
 
 from server.ogc_apis.features.models.extra_models import TokenModel  # noqa: F401
-from pydantic import Field, StrictStr
-from typing import Any
+from pydantic import BeforeValidator, Field, StrictStr
+from typing import Any, Optional
 from typing_extensions import Annotated
 from server.ogc_apis.features.models.collection import Collection
 from server.ogc_apis.features.models.collections import Collections
@@ -269,11 +269,13 @@ async def describe_collection(
 )
 async def get_collections(
     request: Request,
+    limit: Annotated[Optional[Annotated[int, Field(le=ogc_api_config.params.LIMIT_MAXIMUM, ge=1), BeforeValidator(ogc_api_config.params.validate_limit)]], Field(description="The optional limit parameter limits the number of collections that are presented in the response document. If the parameter is omitted, all collections are presented.")] = Query(None, description="The optional limit parameter limits the number of collections that are presented in the response document. If the parameter is omitted, all collections are presented.", alias="limit", ge=1, le=ogc_api_config.params.LIMIT_MAXIMUM),
+    offset: Annotated[int, Field(ge=0, description="The optional offset parameter is used to skip the specified number of collections in the response document. The first collection has the index 0.")] = Query(0, description="The optional offset parameter is used to skip the specified number of collections in the response document. The first collection has the index 0.", alias="offset", ge=0),
     format: ogc_api_config.ReturnFormat = Depends(ogc_api_config.params.get_format_query)
 ) -> Collections:
     if not BaseCapabilitiesApi.subclasses:
         raise HTTPException(status_code=500, detail="Not implemented")
-    return await BaseCapabilitiesApi.subclasses[0]().get_collections(request, format)
+    return await BaseCapabilitiesApi.subclasses[0]().get_collections(limit, offset, request, format)
 
 @router.get(
     "/conformance",
@@ -305,12 +307,13 @@ async def get_collections(
     response_model_by_alias=True,
 )
 async def get_conformance_declaration(
+    request: Request = None,
     format: ogc_api_config.ReturnFormat = Depends(ogc_api_config.params.get_format_query)
 ) -> ConfClasses:
     """A list of all conformance classes specified in a standard that the server conforms to."""
     if not BaseCapabilitiesApi.subclasses:
         raise HTTPException(status_code=500, detail="Not implemented")
-    return await BaseCapabilitiesApi.subclasses[0]().get_conformance_declaration(format)
+    return await BaseCapabilitiesApi.subclasses[0]().get_conformance_declaration(request, format)
 
 
 @router.get(
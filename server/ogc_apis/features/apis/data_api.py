@@ -125,6 +125,9 @@ async def get_feature(
     collectionId: Annotated[StrictStr, Field(description="local identifier of a collection")] = Path(..., description=markdown.markdown("local identifier of a collection")),
     featureId: Annotated[StrictStr, Field(description="local identifier of a feature")] = Path(..., description=markdown.markdown("local identifier of a feature")),
     crs: Annotated[Optional[StrictStr], Field(description="The optional `crs` parameter is used to specify the coordinate reference system of the geometries in the response document. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system  http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used.")] = Query(None, description=markdown.markdown("The optional `crs` parameter is used to specify the coordinate reference system of the geometries in the response document. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system  http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used."), alias="crs"),
+    properties: Annotated[Optional[StrictStr], Field(description="The optional `properties` parameter is a comma-separated list of the properties, which are included in the features of the response document. The names have to be properties of the collection. If the parameter is empty, no properties are included. If the parameter is omitted, all properties are included.")] = Query(None, description="The optional `properties` parameter is a comma-separated list of the properties, which are included in the features of the response document. The names have to be properties of the collection. If the parameter is empty, no properties are included. If the parameter is omitted, all properties are included.", alias="properties"),
+    skip_geometry: Annotated[Optional[bool], Field(description="The optional `skipGeometry` parameter excludes the geometries from the features of the response document, if it is `true`. Default = false.")] = Query(False, description="The optional `skipGeometry` parameter excludes the geometries from the features of the response document, if it is `true`. Default = false.", alias="skipGeometry"),
+    coordinate_precision: Annotated[Optional[Annotated[int, Field(ge=0, le=ogc_api_config.params.COORDINATE_PRECISION_MAXIMUM)]], Field(description="The optional `coordinate-precision` parameter sets the number of decimal places of the coordinates in the response document. If the parameter is omitted, the setting of the collection or the default for the unit of the response CRS (degrees or metres) is used.")] = Query(None, description="The optional `coordinate-precision` parameter sets the number of decimal places of the coordinates in the response document. If the parameter is omitted, the setting of the collection or the default for the unit of the response CRS (degrees or metres) is used.", alias="coordinate-precision"),
     format: ogc_api_config.ReturnFormat = Depends(ogc_api_config.params.get_format_query),
     request: Request,
     session = Depends(Database.get_sqlite_session),
@@ -132,7 +135,7 @@ async def get_feature(
     """Fetch the feature with id `featureId` in the feature collection with id `collectionId`.  Use content negotiation to request HTML or GeoJSON."""
     if not BaseDataApi.subclasses:
         raise HTTPException(status_code=500, detail="Not implemented")
-    return await BaseDataApi.subclasses[0]().get_feature(collectionId, featureId, crs, format, request, session)
+    return await BaseDataApi.subclasses[0]().get_feature(collectionId, featureId, crs, properties, skip_geometry, coordinate_precision, format, request, session)
 
 
 @router.get(
@@ -236,10 +239,17 @@ async def get_features(
     collectionId: Annotated[StrictStr, Field(description="local identifier of a collection")] = Path(..., description=markdown.markdown("local identifier of a collection")),
     limit: Annotated[Optional[Annotated[int, Field(le=ogc_api_config.params.LIMIT_MAXIMUM, ge=1), BeforeValidator(ogc_api_config.params.validate_limit)]], Field(description=f"The optional limit parameter limits the number of items that are presented in the response document.  Only items are counted that are on the first level of the collection in the response document. Nested objects contained within the explicitly requested items shall not be counted.  Minimum = 1. Maximum = {ogc_api_config.params.LIMIT_MAXIMUM}. Default = 100.")] = Query(100, description=markdown.markdown(f"The optional limit parameter limits the number of items that are presented in the response document.\n\n  Only items are counted that are on the first level of the collection in the response document. Nested objects contained within the explicitly requested items shall not be counted. \n\n  Minimum &#x3D; 1. Maximum &#x3D; {ogc_api_config.params.LIMIT_MAXIMUM}. Default &#x3D; 100."), alias="limit", ge=1, le=ogc_api_config.params.LIMIT_MAXIMUM),
     offset: Annotated[Optional[Annotated[int, Field(default=0, ge=0)]], Field(description="The optional offset parameter is used to skip the specified number of items in the result set. The offset is applied after the limit parameter. The first element has the index 0.")] = Query(0, description="The optional offset parameter is used to skip the specified number of items in the result set. The offset is applied after the limit parameter. The first element has the index 0.", alias="offset", ge=0),
+    cursor: Annotated[Optional[StrictStr], Field(description="The optional cursor parameter is an opaque token, which is provided by the server in the `next` link of a response. It continues the result set after the last feature of the previous page and takes precedence over the `offset` parameter.")] = Query(None, description="The optional cursor parameter is an opaque token, which is provided by the server in the `next` link of a response. It continues the result set after the last feature of the previous page and takes precedence over the `offset` parameter.", alias="cursor"),
     bbox: Annotated[Optional[Annotated[List[Union[StrictFloat, StrictInt]], BeforeValidator(ogc_api_config.params.validate_bbox)]], Field(description="Only features that have a geometry that intersects the bounding box are selected. The bounding box is provided as four or six numbers, depending on whether the coordinate reference system includes a vertical axis (height or depth):  * Lower left corner, coordinate axis 1 * Lower left corner, coordinate axis 2 * Minimum value, coordinate axis 3 (optional) * Upper right corner, coordinate axis 1 * Upper right corner, coordinate axis 2 * Maximum value, coordinate axis 3 (optional)  If the value consists of four numbers, the coordinate reference system is WGS 84 longitude/latitude (http://www.opengis.net/def/crs/OGC/1.3/CRS84) unless a different coordinate reference system is specified in the parameter `bbox-crs`.  If the value consists of six numbers, the coordinate reference system is WGS 84 longitude/latitude/ellipsoidal height (http://www.opengis.net/def/crs/OGC/0/CRS84h) unless a different coordinate reference system is specified in the parameter `bbox-crs`.  The query parameter `bbox-crs` is specified in OGC API - Features - Part 2: Coordinate Reference Systems by Reference.  For WGS 84 longitude/latitude the values are in most cases the sequence of minimum longitude, minimum latitude, maximum longitude and maximum latitude. However, in cases where the box spans the antimeridian the first value (west-most box edge) is larger than the third value (east-most box edge).  If the vertical axis is included, the third and the sixth number are the bottom and the top of the 3-dimensional bounding box.  If a feature has multiple spatial geometry properties, it is the decision of the server whether only a single spatial geometry property is used to determine the extent or all relevant geometries.")] = Query(None, description=markdown.markdown("Only features that have a geometry that intersects the bounding box are selected. The bounding box is provided as four or six numbers, depending on whether the coordinate reference system includes a vertical axis (height or depth):\n\n  * Lower left corner, coordinate axis 1\n\n * Lower left corner, coordinate axis 2\n\n * Minimum value, coordinate axis 3 (optional)\n\n * Upper right corner, coordinate axis 1\n\n * Upper right corner, coordinate axis 2\n\n * Maximum value, coordinate axis 3 (optional)\n\n  If the value consists of four numbers, the coordinate reference system is WGS 84 longitude/latitude (http://www.opengis.net/def/crs/OGC/1.3/CRS84) unless a different coordinate reference system is specified in the parameter `bbox-crs`.\n\n  If the value consists of six numbers, the coordinate reference system is WGS 84 longitude/latitude/ellipsoidal height (http://www.opengis.net/def/crs/OGC/0/CRS84h) unless a different coordinate reference system is specified in the parameter `bbox-crs`.\n\n  The query parameter `bbox-crs` is specified in OGC API - Features - Part 2: Coordinate Reference Systems by Reference.\n\n  For WGS 84 longitude/latitude the values are in most cases the sequence of minimum longitude, minimum latitude, maximum longitude and maximum latitude. However, in cases where the box spans the antimeridian the first value (west-most box edge) is larger than the third value (east-most box edge).\n\n  If the vertical axis is included, the third and the sixth number are the bottom and the top of the 3-dimensional bounding box.\n\n  If a feature has multiple spatial geometry properties, it is the decision of the server whether only a single spatial geometry property is used to determine the extent or all relevant geometries."), alias="bbox"),
     datetime: Annotated[Optional[StrictStr], Field(description="Either a date-time or an interval. Date and time expressions adhere to RFC 3339. Intervals may be bounded or half-bounded (double-dots at start or end).  Examples:  * A date-time: \"2018-02-12T23:20:50Z\" * A bounded interval: \"2018-02-12T00:00:00Z/2018-03-18T12:31:12Z\" * Half-bounded intervals: \"2018-02-12T00:00:00Z/..\" or \"../2018-03-18T12:31:12Z\"  Only features that have a temporal property that intersects the value of `datetime` are selected.  If a feature has multiple temporal properties, it is the decision of the server whether only a single temporal property is used to determine the extent or all relevant temporal properties.")] = Query(None, description=markdown.markdown("Either a date-time or an interval. Date and time expressions adhere to RFC 3339. Intervals may be bounded or half-bounded (double-dots at start or end).\n\n  Examples:\n\n  * A date-time: \"2018-02-12T23:20:50Z\"\n\n * A bounded interval: \"2018-02-12T00:00:00Z/2018-03-18T12:31:12Z\"\n\n * Half-bounded intervals: \"2018-02-12T00:00:00Z/..\" or \"../2018-03-18T12:31:12Z\"\n\n  Only features that have a temporal property that intersects the value of `datetime` are selected.\n\n  If a feature has multiple temporal properties, it is the decision of the server whether only a single temporal property is used to determine the extent or all relevant temporal properties."), alias="datetime"),
     bbox_crs: Annotated[Optional[StrictStr], Field(description="The optional `bbox-crs` parameter is used to specify the coordinate reference system of the bounding box. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used.")] = Query(None, description=markdown.markdown("The optional `bbox-crs` parameter is used to specify the coordinate reference system of the bounding box. The value of the parameter is a URI identifying the coordinate reference system.\n\n  If the parameter is omitted, the default coordinate reference system http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used."), alias="bbox-crs"),
     crs: Annotated[Optional[StrictStr], Field(description="The optional `crs` parameter is used to specify the coordinate reference system of the geometries in the response document. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system  http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used.")] = Query(None, description=markdown.markdown("The optional `crs` parameter is used to specify the coordinate reference system of the geometries in the response document. The value of the parameter is a URI identifying the coordinate reference system.\n\n  If the parameter is omitted, the default coordinate reference system  http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used."), alias="crs"),
+    number_matched: Annotated[Optional[ogc_api_config.params.NumberMatched], Field(description="The optional `number-matched` parameter controls how the `numberMatched` member of the response is determined. `exact` counts all matching features, `estimated` uses the statistics of the data source and `omitted` leaves the member out. If the parameter is omitted, the default of the collection is used.")] = Query(None, description="The optional `number-matched` parameter controls how the `numberMatched` member of the response is determined. `exact` counts all matching features, `estimated` uses the statistics of the data source and `omitted` leaves the member out. If the parameter is omitted, the default of the collection is used.", alias="number-matched"),
+    properties: Annotated[Optional[StrictStr], Field(description="The optional `properties` parameter is a comma-separated list of the properties, which are included in the features of the response document. The names have to be properties of the collection. If the parameter is empty, no properties are included. If the parameter is omitted, all properties are included.")] = Query(None, description="The optional `properties` parameter is a comma-separated list of the properties, which are included in the features of the response document. The names have to be properties of the collection. If the parameter is empty, no properties are included. If the parameter is omitted, all properties are included.", alias="properties"),
+    skip_geometry: Annotated[Optional[bool], Field(description="The optional `skipGeometry` parameter excludes the geometries from the features of the response document, if it is `true`. Default = false.")] = Query(False, description="The optional `skipGeometry` parameter excludes the geometries from the features of the response document, if it is `true`. Default = false.", alias="skipGeometry"),
+    coordinate_precision: Annotated[Optional[Annotated[int, Field(ge=0, le=ogc_api_config.params.COORDINATE_PRECISION_MAXIMUM)]], Field(description="The optional `coordinate-precision` parameter sets the number of decimal places of the coordinates in the response document. If the parameter is omitted, the setting of the collection or the default for the unit of the response CRS (degrees or metres) is used.")] = Query(None, description="The optional `coordinate-precision` parameter sets the number of decimal places of the coordinates in the response document. If the parameter is omitted, the setting of the collection or the default for the unit of the response CRS (degrees or metres) is used.", alias="coordinate-precision"),
+    scale_denominator: Annotated[Optional[Annotated[float, Field(gt=0)]], Field(description="The optional `scale-denominator` parameter is the scale denominator of the map, on which the features are displayed. If the collection has generalized geometries for an equal or smaller scale denominator, the features are returned with the geometries of the coarsest of them. If the parameter is omitted, the geometries are returned in full resolution.")] = Query(None, description="The optional `scale-denominator` parameter is the scale denominator of the map, on which the features are displayed. If the collection has generalized geometries for an equal or smaller scale denominator, the features are returned with the geometries of the coarsest of them. If the parameter is omitted, the geometries are returned in full resolution.", alias="scale-denominator"),
+    zoom_level: Annotated[Optional[Annotated[int, Field(ge=0, le=ogc_api_config.params.ZOOM_LEVEL_MAXIMUM)]], Field(description="The optional `zoom-level` parameter is the zoom level of the WebMercatorQuad tile matrix set of the map, on which the features are displayed. It is converted to its scale denominator and can't be combined with the `scale-denominator` parameter.")] = Query(None, description="The optional `zoom-level` parameter is the zoom level of the WebMercatorQuad tile matrix set of the map, on which the features are displayed. It is converted to its scale denominator and can't be combined with the `scale-denominator` parameter.", alias="zoom-level"),
     format: ogc_api_config.ReturnFormat = Depends(ogc_api_config.params.get_format_query),
     validate_query_params = Depends(ogc_api_config.params.validate_items_parameters),
     request: Request,
@@ -248,4 +258,4 @@ async def get_features(
     """Fetch features of the feature collection with id `collectionId`.  Every feature in a dataset belongs to a collection. A dataset may consist of multiple feature collections. A feature collection is often a collection of features of a similar type, based on a common schema.  Use content negotiation to request HTML or GeoJSON."""
     if not BaseDataApi.subclasses:
         raise HTTPException(status_code=500, detail="Not implemented")
-    return await BaseDataApi.subclasses[0]().get_features(collectionId, limit, offset, bbox, datetime, bbox_crs, crs, format, request, session)
\ No newline at end of file
+    return await BaseDataApi.subclasses[0]().get_features(collectionId, limit, offset, cursor, bbox, datetime, bbox_crs, crs, number_matched, properties, skip_geometry, coordinate_precision, scale_denominator, zoom_level, format, request, session)
\ No newline at end of file
@@ -1,2 +1,3 @@
 from . import collection as collection_impl
-from . import feature as feature_impl
\ No newline at end of file
+from . import feature as feature_impl
+from . import feature_postgis as feature_postgis_impl
\ No newline at end of file
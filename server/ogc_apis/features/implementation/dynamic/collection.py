@@ -1,18 +1,22 @@
 import uuid as unique_id
 from sqlmodel import text
-from server.database.db import Database
+from server.database.db import Database, DatabaseSession
 from server.database import models
 from server.ogc_apis.features.models.extent import Extent
 from server.ogc_apis.features.models.extent_spatial import ExtentSpatial
 from server.ogc_apis.features.models.extent_temporal import ExtentTemporal
-from server.utils import gdal_utils
-import re, math, datetime, sqlmodel
+from server.ogc_apis.features.implementation import pre_render_helper
+from server.ogc_apis.features.implementation.dynamic import materialized_geometry, postgis_query
+from server.utils import gdal_utils, http_utils
+import re, math, datetime, orjson, sqlmodel, threading, asyncio
+from typing import Callable, Optional
+from sqlalchemy.orm import selectinload
 
 from osgeo import gdal, ogr, osr
 
 from server.utils.string_utils import string_to_kebab
 
-def generate_collection_table_object(layer_name: str, dataset_uuid: str, dataset: gdal.Dataset, app_base_url: str, optional_data: dict = {}) -> models.CollectionTable:
+def generate_collection_table_object(layer_name: str, dataset_uuid: str, dataset: gdal.Dataset, optional_data: dict = {}) -> models.CollectionTable:
     gdal.UseExceptions()
     
     new_collection = models.CollectionTable()
@@ -156,6 +160,7 @@ def generate_collection_table_object(layer_name: str, dataset_uuid: str, dataset
         new_collection.id = f"{base_id}-{next_suffix:02d}"
     
     new_collection.layer_name = layer_name
+    apply_layer_metadata(new_collection, resolve_layer_metadata(dataset, layer))
     collection_title = string_to_kebab(layer_name.split(".", 1)[-1]).replace("-", " ")
     collection_title = " ".join(word.capitalize() for word in collection_title.split(" "))
     new_collection.title = collection_title
@@ -170,10 +175,77 @@ def generate_collection_table_object(layer_name: str, dataset_uuid: str, dataset
                 value = unique_id.UUID(value)
             setattr(new_collection, key, value)
     
-    new_collection.pre_render(app_base_url=app_base_url)
+    new_collection.pre_render()
 
     return new_collection
 
+class LayerMetadata(object):
+    __slots__ = ("fid_column", "geometry_column", "srid", "is_3D", "fields", "materialized_srids")
+
+    def __init__(self, fid_column: str, geometry_column: str, srid: Optional[int], is_3D: bool, fields: list[dict], materialized_srids: frozenset[int] = frozenset()):
+        self.fid_column = fid_column
+        self.geometry_column = geometry_column
+        self.srid = srid
+        self.is_3D = is_3D
+        self.fields = fields
+        # SRIDs with a materialized view of the reprojected geometries (see materialized_geometry)
+        self.materialized_srids = materialized_srids
+
+def resolve_layer_metadata(dataset: gdal.Dataset, layer: ogr.Layer) -> LayerMetadata:
+    """Resolve the FID and geometry column, the SRID and the fields of a layer from the dataset.
+
+    Args:
+        dataset (gdal.Dataset): The dataset of the layer.
+        layer (ogr.Layer): The layer.
+
+    Returns:
+        LayerMetadata: The metadata of the layer.
+    """
+    
+    fid_column = layer.GetFIDColumn()
+    geometry_column = layer.GetGeometryColumn()
+    
+    srid = None
+    if dataset.GetDriver().GetName() == "PostgreSQL":
+        schema, table = layer.GetName().split(".", 1)
+        with dataset.ExecuteSQL(f"SELECT Find_SRID({postgis_query.quote_literal(schema)}, {postgis_query.quote_literal(table)}, {postgis_query.quote_literal(geometry_column)}) as srid") as result:
+            srid = result.GetNextFeature().GetField("srid")
+    else:
+        spatial_ref: osr.SpatialReference = layer.GetSpatialRef()
+        if spatial_ref is not None and spatial_ref.GetAuthorityName(None) == "EPSG":
+            srid = int(spatial_ref.GetAuthorityCode(None))
+    
+    layer_defn: ogr.FeatureDefn = layer.GetLayerDefn()
+    fields = []
+    for i in range(layer_defn.GetFieldCount()):
+        field_defn: ogr.FieldDefn = layer_defn.GetFieldDefn(i)
+        fields.append({"name": field_defn.GetName(), "type": field_defn.GetFieldTypeName(field_defn.GetType())})
+    
+    return LayerMetadata(fid_column, geometry_column, srid, bool(ogr.GT_HasZ(layer.GetGeomType())), fields)
+
+def apply_layer_metadata(collection: models.CollectionTable, layer_metadata: LayerMetadata) -> None:
+    collection.fid_column = layer_metadata.fid_column
+    collection.geometry_column = layer_metadata.geometry_column
+    collection.srid = layer_metadata.srid
+    collection.fields_json = layer_metadata.fields
+
+def get_layer_metadata(collection: models.CollectionTable) -> Optional[LayerMetadata]:
+    """Get the layer metadata stored with the collection. It is built once per snapshot of the collection (see CollectionSnapshot.layer_metadata). \n
+    None for collections created before the metadata was stored, until it is refreshed in the web admin. The items are then read with the metadata of the GDAL layer.
+    """
+    
+    if not collection.fid_column or not collection.geometry_column:
+        return None
+    
+    return LayerMetadata(
+        collection.fid_column,
+        collection.geometry_column,
+        collection.srid,
+        collection.is_3D,
+        collection.fields_json or [],
+        materialized_geometry.get_materialized_srids(collection.materialized_crs_ready_json) if collection.dataset.type == models.Dataset.Type.DB else frozenset(),
+    )
+
 def get_collection_by_id(id: str, session: sqlmodel.Session = None) -> list[models.CollectionTable]:
     statement = sqlmodel.select(models.CollectionTable).where(models.CollectionTable.id == id)
     found_collections: list[models.CollectionTable]
@@ -183,4 +255,224 @@ def get_collection_by_id(id: str, session: sqlmodel.Session = None) -> list[mode
     else:
         found_collections = session.exec(statement=statement).all()
         
-    return found_collections
\ No newline at end of file
+    return found_collections
+
+def pre_render_collections(collection_ids: list[str]) -> None:
+    """Pre-render the collections, which are not pre-rendered yet (e.g. after the base URL placeholder was introduced), and store them"""
+    
+    statement = sqlmodel.select(models.CollectionTable).where(
+        models.CollectionTable.id.in_(collection_ids),
+        models.CollectionTable.pre_rendered_json == None,  # noqa: E711
+    ).options(selectinload(models.CollectionTable.license))
+    with DatabaseSession() as session:
+        collections = session.exec(statement).all()
+        for collection in collections:
+            collection.pre_render()
+            session.add(collection)
+        
+        session.commit()
+
+class _Snapshot(object):
+    """Immutable copy of a table row. The decoded JSON values are frozen by CoreModel as well."""
+    
+    __slots__ = ()
+    
+    def __init__(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+def _get_row_values(row: Optional[models.CoreModel]) -> Optional[tuple]:
+    # The column values as stored (JSON fields still encoded), so unchanged rows are detected without decoding them
+    if row is None:
+        return None
+    
+    return tuple(row.__dict__.get(name) for name in type(row).model_fields)
+
+class DatasetSnapshot(_Snapshot):
+    __slots__ = ("uuid", "name", "type", "path", "pool_min_size", "pool_max_size", "pool_timeout")
+
+class LicenseSnapshot(_Snapshot):
+    __slots__ = ("title", "url", "type", "pre_rendered_json", "pre_rendered_json_alternate")
+
+class CollectionSnapshot(_Snapshot):
+    """
+    Read-only collection with its dataset and license, which serves the requests instead of the table row.\n
+    The JSON fields are already decoded, `crs_set` holds the CRSs for fast membership checks. The layer metadata is reloaded together with the
+    collection, so it never outlives a change of the collection (e.g. a dropped materialized view).
+    """
+    
+    __slots__ = (
+        "uuid", "id", "layer_name", "title", "description", "links_json", "license_title", "license", "extent_json", "date_time_field", "is_3D",
+        "crs_json", "crs_set", "storage_crs", "storage_crs_coordinate_epoch", "materialized_crs_json", "materialized_crs_ready_json", "generalization_ready_json", "number_matched", "feature_engine", "coordinate_precision", "fid_column", "geometry_column",
+        "srid", "fields_json", "dataset_uuid", "dataset", "pre_rendered_json", "pre_rendered_template", "layer_metadata", "row_values",
+    )
+    
+    @classmethod
+    def from_table(cls, collection: models.CollectionTable, previous: Optional["CollectionSnapshot"] = None) -> "CollectionSnapshot":
+        """Create the snapshot of a collection. The previous snapshot is kept as a whole, if the rows of the collection, its dataset and its license
+        didn't change, otherwise at least its pre-rendered template, if that didn't change (rendered documents per base URL).
+        """
+        
+        dataset = collection.dataset
+        license = collection.license
+        row_values = (_get_row_values(collection), _get_row_values(dataset), _get_row_values(license))
+        if previous is not None and previous.row_values == row_values:
+            return previous
+        
+        crs_list = tuple(collection.crs_json or [])
+        
+        pre_rendered_template = None
+        if collection.pre_rendered_json is not None:
+            content = orjson.dumps(collection.pre_rendered_json)
+            if previous is not None and previous.pre_rendered_template is not None and previous.pre_rendered_template.content == content:
+                pre_rendered_template = previous.pre_rendered_template
+            else:
+                pre_rendered_template = http_utils.DocumentTemplate(content, pre_render_helper.BASE_URL_PLACEHOLDER)
+        
+        return cls(
+            uuid=collection.uuid,
+            id=collection.id,
+            layer_name=collection.layer_name,
+            title=collection.title,
+            description=collection.description,
+            links_json=collection.links_json,
+            license_title=collection.license_title,
+            license=LicenseSnapshot(
+                title=license.title,
+                url=license.url,
+                type=license.type,
+                pre_rendered_json=license.pre_rendered_json,
+                pre_rendered_json_alternate=license.pre_rendered_json_alternate,
+            ) if license is not None else None,
+            extent_json=collection.extent_json,
+            date_time_field=collection.date_time_field,
+            is_3D=collection.is_3D,
+            crs_json=crs_list,
+            crs_set=frozenset(crs_list),
+            storage_crs=collection.storage_crs,
+            storage_crs_coordinate_epoch=collection.storage_crs_coordinate_epoch,
+            materialized_crs_json=tuple(collection.materialized_crs_json or []),
+            materialized_crs_ready_json=tuple(collection.materialized_crs_ready_json or []),
+            generalization_ready_json=tuple(collection.generalization_ready_json or []),
+            number_matched=collection.number_matched,
+            feature_engine=collection.feature_engine,
+            coordinate_precision=collection.coordinate_precision,
+            fid_column=collection.fid_column,
+            geometry_column=collection.geometry_column,
+            srid=collection.srid,
+            fields_json=collection.fields_json,
+            dataset_uuid=collection.dataset_uuid,
+            dataset=DatasetSnapshot(
+                uuid=dataset.uuid,
+                name=dataset.name,
+                type=dataset.type,
+                path=dataset.path,
+                pool_min_size=dataset.pool_min_size,
+                pool_max_size=dataset.pool_max_size,
+                pool_timeout=dataset.pool_timeout,
+            ),
+            pre_rendered_json=collection.pre_rendered_json,
+            pre_rendered_template=pre_rendered_template,
+            layer_metadata=get_layer_metadata(collection),
+            row_values=row_values,
+        )
+
+class CollectionRegistry(object):
+    """
+    In-memory snapshot of all collections per process, so requests don't query SQLite for the collection.\n
+    The snapshot is reloaded, after any connection committed changes to the SQLite database (e.g. the web admin or another worker).
+    This is detected with the data version of the database (see Database.get_data_version), which is a cheap check per request without lock.
+    Only the reload is serialized. It keeps the snapshots of unchanged collections and runs in a thread for requests on the event loop.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._collections: dict[str, CollectionSnapshot] = {}
+        self._change_listeners: list[Callable[[str], None]] = []
+        self.reloads = 0
+    
+    def add_change_listener(self, listener: Callable[[str], None]) -> None:
+        """Call the listener with the id of every collection, which changed or was deleted since the previous reload (e.g. to drop cached responses).
+        This covers changes of other processes as well, which the web admin of this process doesn't know about.
+        """
+        
+        self._change_listeners.append(listener)
+    
+    def _load(self) -> dict[str, CollectionSnapshot]:
+        statement = sqlmodel.select(models.CollectionTable).options(
+            selectinload(models.CollectionTable.dataset),
+            selectinload(models.CollectionTable.license),
+        )
+        with DatabaseSession() as session:
+            return {
+                collection.id: CollectionSnapshot.from_table(collection, self._collections.get(collection.id, None))
+                for collection in session.exec(statement).all()
+            }
+    
+    def _is_current(self) -> bool:
+        return self._version is not None and Database.get_data_version() == self._version
+    
+    def _refresh(self) -> dict[str, CollectionSnapshot]:
+        if self._is_current():
+            return self._collections
+        
+        changed_ids = []
+        with self._lock:
+            # The version is read before loading, so changes committed while loading trigger another reload
+            version = Database.get_data_version()
+            if version != self._version:
+                previous = self._collections
+                # The collections are replaced before the version, so a reader of the new version gets the new collections
+                self._collections = self._load()
+                self._version = version
+                self.reloads += 1
+                # Unchanged collections keep their snapshot (see CollectionSnapshot.from_table)
+                changed_ids = [collection_id for collection_id, snapshot in previous.items() if self._collections.get(collection_id) is not snapshot]
+            
+            collections = self._collections
+        
+        for collection_id in changed_ids:
+            for listener in self._change_listeners:
+                listener(collection_id)
+        
+        return collections
+    
+    async def _refresh_async(self) -> dict[str, CollectionSnapshot]:
+        if self._is_current():
+            return self._collections
+        
+        # Loading all collections takes a while, so it doesn't block the event loop
+        return await asyncio.to_thread(self._refresh)
+    
+    def get(self, collection_id: str) -> Optional[CollectionSnapshot]:
+        return self._refresh().get(collection_id)
+    
+    async def get_async(self, collection_id: str) -> Optional[CollectionSnapshot]:
+        """Like `get`, for requests on the event loop"""
+        
+        return (await self._refresh_async()).get(collection_id)
+    
+    def get_all(self) -> list[CollectionSnapshot]:
+        return list(self._refresh().values())
+    
+    def get_collections(self) -> dict[str, CollectionSnapshot]:
+        """All collections by id in the order of the database. The dict is replaced on reload and must not be modified."""
+        
+        return self._refresh()
+    
+    async def get_collections_async(self) -> dict[str, CollectionSnapshot]:
+        """Like `get_collections`, for requests on the event loop"""
+        
+        return await self._refresh_async()
+    
+    def invalidate(self) -> None:
+        """Reload the snapshot on the next access, e.g. for changes the data version doesn't cover"""
+        
+        with self._lock:
+            self._version = None
+
+COLLECTION_REGISTRY = CollectionRegistry()
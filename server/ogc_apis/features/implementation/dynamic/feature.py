@@ -1,7 +1,10 @@
+import base64
 import datetime
+import hashlib
 import os
-import sys
-from typing import Any, Optional
+import re
+import threading
+from typing import Any, Callable, Iterator, Optional
 import uuid
 import orjson
 from osgeo import ogr, osr, gdal
@@ -9,22 +12,207 @@ import pyproj
 
 from server.database import models
 from server.ogc_apis.features.implementation import pre_render_helper
-from server.utils import gdal_utils
+from server.utils import cache_utils, gdal_utils, metrics, wkb_utils, worker_pool
 from server.ogc_apis import ogc_api_config
+from server.ogc_apis.features.implementation.dynamic import collection as collection_impl, materialized_geometry, postgis_query
 
 ogr.UseExceptions()
 
-def get_feature_by_id(dataset_wrapper: gdal_utils.DatasetWrapper, layer_name: str, feature_id: int) -> ogr.Feature:
+# Exact feature counts per (collection id, filter hash), since a full COUNT(*) often costs more than the page itself
+FEATURE_COUNT_CACHE = cache_utils.LRUCache(
+    max_entries=int(os.getenv("APP_FEATURE_COUNT_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("APP_FEATURE_COUNT_CACHE_TTL", "300")),
+)
+
+# Encoded GeoJSON items responses (body, ETag) per normalized request, bounded by the summed size of the bodies (0 disables the cache)
+ITEMS_RESPONSE_CACHE = cache_utils.LRUCache(
+    max_entries=int(os.getenv("APP_ITEMS_CACHE_ENTRIES", "1024")),
+    ttl=float(os.getenv("APP_ITEMS_CACHE_TTL", "60")),
+    max_size=int(os.getenv("APP_ITEMS_CACHE_SIZE", str(64 * 1024 * 1024))),
+    size_of=lambda entry: len(entry[0]),
+)
+
+class FeatureFragmentCache(object):
+    """
+    Encoded GeoJSON features per (collection id, version, FID, target CRS, coordinate precision), bounded by the summed size of the features.\n
+    Overlapping pages (e.g. slightly moved bounding boxes) only query the FIDs of the page and the features, which aren't cached yet.
+    Every collection has a version, which is increased on invalidation. Features read before an invalidation are stored
+    under the previous version, so they are never returned afterwards, even if the request finishes after the invalidation.
+    """
+
+    def __init__(self, max_entries: int, max_size: int, ttl: Optional[float] = None):
+        self.enabled = max_size > 0
+        self._cache = cache_utils.LRUCache(max_entries=max_entries, ttl=ttl, max_size=max_size, size_of=len)
+        self._versions: dict[str, int] = {}
+        # Invalidations come from the web admin and the worker threads at the same time
+        self._versions_lock = threading.Lock()
+
+    def get_version(self, collection_id: str) -> int:
+        return self._versions.get(collection_id, 0)
+
+    def get_many(self, collection_id: str, version: int, crs: str, fids: list[Any], precision: Optional[int] = None) -> dict[Any, bytes]:
+        """The cached features of the FIDs, missing features are not contained"""
+
+        fragments = {}
+        for fid in fids:
+            fragment = self._cache.get((collection_id, version, fid, crs, precision))
+            if fragment is not None:
+                fragments[fid] = fragment
+
+        return fragments
+
+    def set_many(self, collection_id: str, version: int, crs: str, fragments: dict[Any, bytes], precision: Optional[int] = None) -> None:
+        for fid, fragment in fragments.items():
+            self._cache.set((collection_id, version, fid, crs, precision), fragment)
+
+    def invalidate(self, collection_id: str) -> None:
+        with self._versions_lock:
+            self._versions[collection_id] = self._versions.get(collection_id, 0) + 1
+        # The features of previous versions are never hit again, they are only removed to free the memory
+        self._cache.invalidate(lambda key: key[0] == collection_id)
+
+    def get_stats(self) -> dict[str, int]:
+        return self._cache.get_stats()
+
+# Encoded features of the PostGIS engine (0 disables the cache, then a page is encoded by a single query)
+FEATURE_FRAGMENT_CACHE = FeatureFragmentCache(
+    max_entries=int(os.getenv("APP_FEATURE_FRAGMENT_CACHE_ENTRIES", "200000")),
+    max_size=int(os.getenv("APP_FEATURE_FRAGMENT_CACHE_SIZE", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("APP_FEATURE_FRAGMENT_CACHE_TTL", "300")),
+)
+
+metrics.register_cache("feature_count", FEATURE_COUNT_CACHE)
+metrics.register_cache("items_response", ITEMS_RESPONSE_CACHE)
+metrics.register_cache("feature_fragment", FEATURE_FRAGMENT_CACHE)
+
+# Number of features of a streamed page, whose geometries are encoded together
+ENCODE_BATCH_SIZE = 1000
+
+# Start of every items response, the encoded features and the other members (timeStamp, links, ...) are appended to it
+FEATURE_COLLECTION_PREFIX = b'{"type":"FeatureCollection","features":['
+# The GeoJSON driver of GDAL writes the FID as first member after the type
+_GDAL_FEATURE_ID_PATTERN = re.compile(rb'^\{\s*"type"\s*:\s*"Feature"\s*,\s*"id"\s*:\s*(-?\d+)\s*,')
+
+def add_members(document: bytes, members: dict) -> bytes:
+    """Append members (e.g. links) to an encoded JSON object, without parsing it."""
+
+    if not members:
+        return document
+
+    # Replace the closing brace of the document and the opening brace of the members by a comma
+    return document[:-1] + b"," + orjson.dumps(members)[1:]
+
+def build_feature_collection(features: bytes, members: dict) -> bytes:
+    """Wrap the encoded, comma separated GeoJSON features into a FeatureCollection with the additional members (timeStamp, links, ...)."""
+
+    return b"".join((FEATURE_COLLECTION_PREFIX, features, b"]," if members else b"]}", orjson.dumps(members)[1:] if members else b""))
+
+def split_geojson_features(content: bytes) -> list[bytes]:
+    """
+    Split a FeatureCollection written by the GeoJSON driver of GDAL into its encoded features, without parsing them.\n
+    The driver writes every feature on a line of its own and JSON strings can't contain raw line breaks,
+    so the lines between the opening and the closing bracket of the features array are the features.
+    Other layouts are parsed and encoded again as fallback.
+    """
+
+    start = content.find(b'"features": [\n')
+    end = content.rfind(b"\n]")
+    if start != -1 and end != -1 and end >= start:
+        body = content[start + len(b'"features": [\n'):end]
+        if not body.strip():
+            return []
+        return [line.rstrip(b"\r ,") for line in body.split(b"\n") if line.strip()]
+
+    return [orjson.dumps(feature) for feature in orjson.loads(content).get("features", [])]
+
+def get_encoded_feature_id(feature: bytes) -> Any:
+    """The id of an encoded feature of GDAL, which is only parsed if the id isn't the first member"""
+
+    match = _GDAL_FEATURE_ID_PATTERN.match(feature)
+    if match is not None:
+        return int(match.group(1))
+
+    return orjson.loads(feature).get("id", None)
+
+def get_items_cache_key(
+    collection_id: str,
+    base_url: str,
+    bbox: Optional[list[float]],
+    bbox_crs: Optional[str],
+    datetime_value: Optional[str],
+    crs: str,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    number_matched: ogc_api_config.params.NumberMatched,
+    format: ogc_api_config.ReturnFormat,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+    precision: Optional[int] = None,
+    generalization_level: Optional[float] = None,
+) -> tuple:
+    """Normalized key of an items request. The collection id is always the first element, so the entries of a collection can be invalidated."""
+    
+    return (
+        collection_id,
+        base_url,
+        tuple(float(value) for value in bbox) if bbox is not None else None,
+        bbox_crs,
+        datetime_value,
+        crs,
+        limit,
+        offset if cursor is None else None,
+        cursor,
+        ogc_api_config.params.NumberMatched(number_matched).value,
+        ogc_api_config.ReturnFormat(format).value,
+        tuple(properties) if properties is not None else None,
+        bool(skip_geometry),
+        precision,
+        generalization_level,
+    )
+
+def get_coordinate_precision(t_srs_res: str, collection_precision: Optional[int] = None, request_precision: Optional[int] = None) -> Optional[int]:
+    """The decimal places of the coordinates in the target CRS: Those of the request, else those of the collection, else the default of the unit of the CRS (see params). \n
+    Geographic CRSs count in degrees, all others like metres. None keeps the full precision.
+    """
+    
+    precision = request_precision if request_precision is not None else collection_precision
+    if precision is None:
+        try:
+            is_geographic = bool(gdal_utils.get_spatial_ref_from_ressource(t_srs_res).IsGeographic())
+        except ValueError:
+            is_geographic = False
+        precision = ogc_api_config.params.COORDINATE_PRECISION_DEGREES if is_geographic else ogc_api_config.params.COORDINATE_PRECISION_METRES
+    
+    return precision if precision >= 0 else None
+
+def invalidate_collection_caches(collection_id: str) -> None:
+    """Remove the cached responses, features and feature counts of a collection and reload the collection registry (with the layer metadata), e.g. after it was updated or deleted."""
+    
+    collection_impl.COLLECTION_REGISTRY.invalidate()
+    _invalidate_cached_responses(collection_id)
+
+def _invalidate_cached_responses(collection_id: str) -> None:
+    ITEMS_RESPONSE_CACHE.invalidate(lambda key: key[0] == collection_id)
+    FEATURE_FRAGMENT_CACHE.invalidate(collection_id)
+    FEATURE_COUNT_CACHE.invalidate(lambda key: isinstance(key, tuple) and key[0] == collection_id)
+
+# Collections changed by other processes (or directly in SQLite) are detected, when the registry reloads
+collection_impl.COLLECTION_REGISTRY.add_change_listener(_invalidate_cached_responses)
+
+def get_feature_by_id(dataset_wrapper: gdal_utils.DatasetWrapper, layer_name: str, feature_id: int, properties: Optional[list[str]] = None, skip_geometry: bool = False) -> ogr.Feature:
     """Get a feature by its id from a dataset
 
     Args:
         dataset_wrapper (gdal_utils.DatasetWrapper): The dataset wrapper containing the dataset.
         layer_name (str): The name of the layer from which to get the feature.
         feature_id (int): The id of the feature to retrieve.
+        properties (Optional[list[str]]): The properties, which are read. None reads all of them.
+        skip_geometry (bool): Whether the geometry isn't read.
 
     Raises:
         RuntimeError: If the layer is not found in the dataset.
-        ValueError: If the feature with given id is not found in the layer.
+        ValueError: If the feature with given id is not found in the layer or a property is not a field of the layer.
         
     Returns:
         ogr.Feature: The feature retrieved from the dataset.
@@ -35,30 +223,148 @@ def get_feature_by_id(dataset_wrapper: gdal_utils.DatasetWrapper, layer_name: st
         if layer is None:
             raise RuntimeError(f"Layer '{layer_name}' not found in dataset '{ds.GetDescription()}'")
         
+        # Ignored fields aren't read by the driver at all
+        ignored_fields = []
+        if properties is not None:
+            layer_defn: ogr.FeatureDefn = layer.GetLayerDefn()
+            validate_properties([layer_defn.GetFieldDefn(index).GetName() for index in range(layer_defn.GetFieldCount())], properties)
+            ignored_fields = [layer_defn.GetFieldDefn(index).GetName() for index in range(layer_defn.GetFieldCount()) if layer_defn.GetFieldDefn(index).GetName() not in properties]
+        if skip_geometry:
+            ignored_fields.append("OGR_GEOMETRY")
+        
+        if ignored_fields:
+            layer.SetIgnoredFields(ignored_fields)
         try:
             feature: ogr.Feature = layer.GetFeature(feature_id)
         except RuntimeError as error:
             raise ValueError(f"Feature with id '{feature_id}' not found in layer '{layer_name}'") from error
+        finally:
+            # The layer of a pooled dataset is shared with the next requests
+            if ignored_fields:
+                layer.SetIgnoredFields([])
         
         return feature
 
-def transform_feature(feature: ogr.Feature, t_srs_resource: str) -> None:
-    """Transform a feature in place to a new spatial reference system.
+def validate_properties(field_names: list[str], properties: Optional[list[str]]) -> None:
+    """Check, that the requested properties are fields of the layer.
 
-    Args:
-        feature (ogr.Feature): The feature to transform.
-        t_srs (str): The target spatial reference system as URI or URN.
+    Raises:
+        ValueError: If a property is not a field of the layer.
     """
     
-    geom: ogr.Geometry = feature.GetGeometryRef()
-    # If the feature has no geometry, return the feature as is
-    # Don't know whether this is the correct behavior
-    if geom is None:        
+    if properties is None:
         return
     
-    t_srs = gdal_utils.get_spatial_ref_from_ressource(t_srs_resource)
+    unknown_properties = [name for name in properties if name not in field_names]
+    if unknown_properties:
+        raise ValueError(f"Unknown properties: {', '.join(unknown_properties)}. Available properties: {', '.join(field_names)}")
+
+def get_property_fields(layer_defn: ogr.FeatureDefn, fid_col: Optional[str] = None, properties: Optional[list[str]] = None) -> tuple[list[tuple[int, str, bool]], Optional[int]]:
+    """Get the fields, which are written as properties, as (index, name, is boolean) and the index of the FID column, which is written as id instead (None if it isn't a field).
+    If properties are given, only these fields are written in the requested order.
+    """
+    
+    fields = []
+    fid_index = None
+    for index in range(layer_defn.GetFieldCount()):
+        field_defn: ogr.FieldDefn = layer_defn.GetFieldDefn(index)
+        name = field_defn.GetName()
+        if fid_col and name == fid_col:
+            fid_index = index
+            continue
+        
+        is_boolean = field_defn.GetType() == ogr.OFTInteger and field_defn.GetSubType() == ogr.OFSTBoolean
+        fields.append((index, name, is_boolean))
+    
+    if properties is not None:
+        validate_properties([name for _, name, _ in fields], properties)
+        fields_by_name = {field[1]: field for field in fields}
+        fields = [fields_by_name[name] for name in properties]
+    
+    return fields, fid_index
+
+def get_feature_id(feature: ogr.Feature, fid_index: Optional[int] = None) -> Any:
+    if fid_index is not None:
+        return feature.GetField(fid_index)
+    
+    fid = feature.GetFID()
+    return fid if fid != ogr.NullFID else None
+
+def encode_geometries(
+    geometries: list[Optional[ogr.Geometry]],
+    precision: Optional[int] = None,
+    source_srs: Optional[osr.SpatialReference] = None,
+    t_srs_res: Optional[str] = None,
+) -> list[bytes]:
+    """Encode the geometries of a batch of features as GeoJSON, in one pass over their WKB if NumPy is installed (see wkb_utils). \n
+    If a source and target spatial reference system are given, all coordinates of the batch are transformed with a single pyproj call.
+    """
+    
+    transform = source_srs is not None and t_srs_res is not None and not source_srs.IsSame(gdal_utils.get_spatial_ref_from_ressource(t_srs_res))
+    
+    if wkb_utils.numpy is not None:
+        try:
+            wkbs = [geom.ExportToIsoWkb() if geom is not None else None for geom in geometries]
+            transformation = gdal_utils.SPATIAL_REF_REGISTRY.get_bulk_transformation(source_srs, t_srs_res) if transform else None
+            return wkb_utils.encode_geometries(wkbs, precision, transformation)
+        except ValueError:
+            # Curves and other types without GeoJSON equivalent are linearized by OGR
+            pass
+    
+    if transform:
+        transformation = gdal_utils.SPATIAL_REF_REGISTRY.get_transformation(source_srs, t_srs_res)
+        for geom in geometries:
+            if geom is not None:
+                geom.Transform(transformation)
+    
+    options = [f"COORDINATE_PRECISION={precision}"] if precision is not None else []
+    return [geom.ExportToJson(options=options).encode("utf-8") if geom is not None else b"null" for geom in geometries]
+
+def encode_features(
+    features: list[ogr.Feature],
+    fields: list[tuple[int, str, bool]],
+    fid_index: Optional[int] = None,
+    precision: Optional[int] = None,
+    source_srs: Optional[osr.SpatialReference] = None,
+    t_srs_res: Optional[str] = None,
+    skip_geometry: bool = False,
+) -> list[bytes]:
+    """Encode a batch of OGR features as GeoJSON features, instead of converting every feature with ExportToJson.
+
+    Args:
+        features (list[ogr.Feature]): The features.
+        fields (list[tuple[int, str, bool]]): The property fields of the features (see get_property_fields).
+        fid_index (Optional[int]): The index of the FID column, if it is a field.
+        precision (Optional[int]): The number of decimal places of the coordinates. None keeps the full precision.
+        source_srs (Optional[osr.SpatialReference]): The spatial reference system of the geometries. If None, the geometries aren't transformed.
+        t_srs_res (Optional[str]): The target spatial reference system as URI or URN.
+        skip_geometry (bool): Whether the geometries are written as null.
+
+    Returns:
+        list[bytes]: The encoded features.
+    """
+    
+    if skip_geometry:
+        geometries = [b"null"] * len(features)
+    else:
+        geometries = encode_geometries([feature.GetGeometryRef() for feature in features], precision, source_srs, t_srs_res)
+    
+    encoded = []
+    for feature, geometry in zip(features, geometries):
+        properties = {}
+        for index, name, is_boolean in fields:
+            value = feature.GetField(index)
+            properties[name] = bool(value) if is_boolean and value is not None else value
         
-    geom.TransformTo(t_srs)
+        fid = get_feature_id(feature, fid_index)
+        encoded.append(b"".join((
+            b'{"type":"Feature",',
+            b'"id":' + orjson.dumps(fid) + b"," if fid is not None else b"",
+            b'"geometry":', geometry,
+            b',"properties":', orjson.dumps(properties), b"}",
+        )))
+    
+    return encoded
 
 # Could be cached with LRU cache if necessary
 def generate_feature_links(base_url: str, collection_id: str, feature_id: str | int) -> list[dict[str, str]]:
@@ -100,6 +406,67 @@ def generate_feature_links(base_url: str, collection_id: str, feature_id: str |
     
     return links
 
+def get_filter_hash(collection_id: str, bbox: Optional[list[float]], bbox_crs: Optional[str], datetime_value: Optional[str]) -> str:
+    """Generate a short hash of the filter parameters of an items request, so a cursor can only be used with the filter it was created for.
+
+    Args:
+        collection_id (str): The id of the feature collection.
+        bbox (Optional[list[float]]): The bounding box filter of the request.
+        bbox_crs (Optional[str]): The coordinate reference system of the bounding box as URI or URN.
+        datetime_value (Optional[str]): The raw datetime filter of the request.
+
+    Returns:
+        str: The hash of the filter parameters.
+    """
+    
+    filter_key = orjson.dumps([collection_id, bbox, bbox_crs, datetime_value])
+    return hashlib.blake2b(filter_key, digest_size=8).hexdigest()
+
+def generate_cursor(last_fid: int, offset: int, filter_hash: str) -> str:
+    """Generate an opaque cursor token for keyset pagination.
+
+    Args:
+        last_fid (int): The FID of the last feature of the current page.
+        offset (int): The position of the next page in the result set (used for numberMatched based paging decisions).
+        filter_hash (str): The hash of the filter parameters, the cursor was created for.
+
+    Returns:
+        str: The URL safe cursor token.
+    """
+    
+    token = orjson.dumps({"fid": last_fid, "offset": offset, "filter": filter_hash})
+    return base64.urlsafe_b64encode(token).decode("ascii").rstrip("=")
+
+def parse_cursor(cursor: str, filter_hash: str) -> tuple[int, int]:
+    """Parse a cursor token generated by `generate_cursor`.
+
+    Args:
+        cursor (str): The cursor token.
+        filter_hash (str): The hash of the filter parameters of the current request.
+
+    Raises:
+        ValueError: If the cursor is malformed or was created for a different filter.
+
+    Returns:
+        tuple[int, int]: The FID of the last feature of the previous page and the offset of the page.
+    """
+    
+    try:
+        token = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_fid = token["fid"]
+        offset = token["offset"]
+        token_filter_hash = token["filter"]
+    except (ValueError, TypeError, KeyError) as error:
+        raise ValueError("Input for parameter 'cursor' of type 'query' is invalid. The cursor is malformed") from error
+    
+    if type(last_fid) is not int or type(offset) is not int or offset < 0:
+        raise ValueError("Input for parameter 'cursor' of type 'query' is invalid. The cursor is malformed")
+    
+    if token_filter_hash != filter_hash:
+        raise ValueError("Input for parameter 'cursor' of type 'query' is invalid. The cursor does not belong to the given filter parameters")
+    
+    return last_fid, offset
+
 def get_feature_count(
     layer: ogr.Layer, 
     filter_geom: Optional[ogr.Geometry], 
@@ -130,42 +497,11 @@ def get_feature_count(
     if driver_name == "PostgreSQL":
         # PostGIS
         schema, table = layer.GetName().split(".")  
-        sql = f'SELECT COUNT(*) as count FROM "{schema}"."{table}"'
-        where_clauses = []
-        
-        if sql_where_query:
-            if "where" not in sql_where_query.lower():
-                sql += " WHERE " + sql_where_query
-            sql += sql_where_query
-            with ds.ExecuteSQL(sql) as result:
-                total_feature_count = result.GetNextFeature().GetField("count")
-        else:
-            if filter_geom is not None:
-                with ds.ExecuteSQL(f"SELECT Find_SRID('{schema}','{table}','{geom_col}') as srid") as result:
-                    srid = result.GetNextFeature().GetField("srid")
-                
-                if filter_geom.Is3D():
-                    z_min = filter_geom.GetGeometryRef(0).GetZ(0)
-                    z_max = filter_geom.GetGeometryRef(0).GetZ(2)
-                    where_clauses.append(f'(ST_Intersects("{geom_col}", ST_GeomFromText(\'{filter_geom.ExportToWkt()}\', {srid})) AND ST_ZMin("{geom_col}") <= {z_max} AND ST_ZMax("{geom_col}") >= {z_min}) OR "{geom_col}" IS NULL')
-                else:
-                    filter_geom.FlattenTo2D()
-                    where_clauses.append(f'ST_Intersects({geom_col}, ST_GeomFromText(\'{filter_geom.ExportToWkt()}\', {srid})) OR {geom_col} IS NULL')
-            
-            if datetime_interval and datetime_field:
-                start, end = datetime_interval
-                if start and end:
-                    where_clauses.append(f'("{datetime_field}" >= \'{start.isoformat()}\' AND "{datetime_field}" <= \'{end.isoformat()}\') OR {datetime_field} IS NULL')
-                elif start:
-                    where_clauses.append(f'"{datetime_field}" >= \'{start.isoformat()}\' OR {datetime_field} IS NULL')
-                elif end:
-                    where_clauses.append(f'"{datetime_field}" <= \'{end.isoformat()}\' OR {datetime_field} IS NULL')
-            
-            where_clauses = [f'({clause})' for clause in where_clauses]
-            sql += (" WHERE " + " AND ".join(where_clauses)) if len(where_clauses) > 0 else ""
-            
-            with ds.ExecuteSQL(sql) as result:
-                total_feature_count = result.GetNextFeature().GetField("count")
+        if not sql_where_query:
+            sql_where_query = compile_postgresql_filter(ds, layer, filter_geom, datetime_interval, datetime_field).render()
+        
+        with ds.ExecuteSQL(f'SELECT COUNT(*) as count FROM "{schema}"."{table}"{sql_where_query}') as result:
+            total_feature_count = result.GetNextFeature().GetField("count")
     else:
         # File based drivers (at least GeoPackage)
         # Needs to be redone if file based drivers become available
@@ -176,32 +512,35 @@ def get_feature_count(
             geom_col = "_ogr_geometry_"
             
         # Count only NULL geometry features
+        # The dataset is pooled, so the filters are reset even if counting fails, otherwise later requests would count with them
         layer.SetAttributeFilter(f"{geom_col} IS NULL")
-        null_geom_count = layer.GetFeatureCount()
-        # Manually count NULL geometry features
-        # for feature in layer:
-        #     null_geom_count += 1
-        
-        layer.SetAttributeFilter(None)
-        layer.ResetReading()
+        try:
+            null_geom_count = layer.GetFeatureCount()
+            # Manually count NULL geometry features
+            # for feature in layer:
+            #     null_geom_count += 1
+        finally:
+            layer.SetAttributeFilter(None)
+            layer.ResetReading()
         
         feature_count = 0
         if filter_geom:
             layer.SetSpatialFilter(filter_geom)
-            if not filter_geom.Is3D() or layer.GetSpatialRef().GetAxesCount() == 2:
-                feature_count = layer.GetFeatureCount()
-            else:
-                filter_env = filter_geom.GetEnvelope3D()
-                for feature in layer:
-                    geom = feature.GetGeometryRef()
-                    feature_env = geom.GetEnvelope3D()
-                    if feature_env[4] > filter_env[5] or feature_env[5] < filter_env[4]:
-                        continue
-                    
-                    feature_count += 1
-            
-            layer.SetSpatialFilter(None)
-            layer.ResetReading()
+            try:
+                if not filter_geom.Is3D() or layer.GetSpatialRef().GetAxesCount() == 2:
+                    feature_count = layer.GetFeatureCount()
+                else:
+                    filter_env = filter_geom.GetEnvelope3D()
+                    for feature in layer:
+                        geom = feature.GetGeometryRef()
+                        feature_env = geom.GetEnvelope3D()
+                        if feature_env[4] > filter_env[5] or feature_env[5] < filter_env[4]:
+                            continue
+                        
+                        feature_count += 1
+            finally:
+                layer.SetSpatialFilter(None)
+                layer.ResetReading()
         
         # Manually count features
         # for feature in layer:
@@ -231,6 +570,198 @@ def get_feature_count(
 
     return total_feature_count
 
+def estimate_feature_count(layer: ogr.Layer, sql_where_query: Optional[str] = None) -> Optional[int]:
+    """Estimate the number of features in a layer, without counting them. \n
+    Uses the table statistics of PostgreSQL (pg_class.reltuples or the row estimate of the query plan) and the feature count of gpkg_ogr_contents for GeoPackages.
+
+    Args:
+        layer (ogr.Layer): The layer from which to estimate the number of features.
+        sql_where_query (Optional[str]): The SQL WHERE query (including the WHERE keyword) to filter the features. Only used for database drivers.
+
+    Returns:
+        Optional[int]: The estimated number of features or None, if no estimate is available.
+    """
+    
+    ds: gdal.Dataset = layer.GetDataset()
+    driver_name: str = ds.GetDriver().GetName()
+    
+    if driver_name == "PostgreSQL":
+        schema, table = layer.GetName().split(".")
+        if not sql_where_query:
+            # reltuples is -1 (PostgreSQL >= 14) or 0, if the table was never vacuumed or analyzed
+            with ds.ExecuteSQL(f"""SELECT reltuples::bigint AS count FROM pg_class WHERE oid = '"{schema}"."{table}"'::regclass""") as result:
+                feature = result.GetNextFeature()
+                estimate = feature.GetField("count") if feature is not None else None
+            
+            return estimate if estimate is not None and estimate > 0 else None
+        
+        with ds.ExecuteSQL(f'EXPLAIN (FORMAT JSON) SELECT 1 FROM "{schema}"."{table}" {sql_where_query}') as result:
+            feature = result.GetNextFeature()
+            if feature is None:
+                return None
+            plan = orjson.loads(feature.GetField(0))
+        
+        return int(plan[0]["Plan"]["Plan Rows"])
+    
+    if driver_name == "GPKG" and not sql_where_query:
+        with ds.ExecuteSQL(f"SELECT feature_count FROM gpkg_ogr_contents WHERE lower(table_name) = lower('{layer.GetName()}')") as result:
+            feature = result.GetNextFeature() if result is not None else None
+            estimate = feature.GetField("feature_count") if feature is not None else None
+        
+        return estimate if estimate is not None and estimate >= 0 else None
+    
+    return None
+
+def get_matched_feature_count(
+    layer: ogr.Layer, 
+    filter_geom: Optional[ogr.Geometry], 
+    datetime_interval: tuple[Optional[datetime.datetime], Optional[datetime.datetime]],
+    datetime_field: Optional[str] = None,
+    sql_where_query: Optional[str] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+) -> tuple[Optional[int], bool]:
+    """Get the number of features matching the filters according to the numberMatched policy.
+
+    Args:
+        layer (ogr.Layer): The layer from which to get the number of features.
+        filter_geom (Optional[ogr.Geometry]): The geometry to spatialy filter the features.
+        datetime_interval (tuple[Optional[datetime.datetime], Optional[datetime.datetime]]): The datetime interval to filter features.
+        datetime_field (Optional[str]): The name of the datetime field to filter features.
+        sql_where_query (Optional[str]): A SQL WHERE query to filter the features. Only used for database drivers.
+        number_matched (ogc_api_config.params.NumberMatched): Whether the count should be exact, estimated or omitted.
+        count_cache_key (Optional[tuple]): Key of the collection and filter, under which exact counts are cached. If None, nothing is cached.
+
+    Returns:
+        tuple[Optional[int], bool]: The number of matched features (None if omitted) and whether the number is exact.
+    """
+    
+    if number_matched == ogc_api_config.params.NumberMatched.omitted:
+        return None, False
+    
+    if count_cache_key is not None:
+        cached_count = FEATURE_COUNT_CACHE.get(count_cache_key)
+        if cached_count is not None:
+            return cached_count, True
+    
+    if number_matched == ogc_api_config.params.NumberMatched.estimated:
+        estimate = None
+        if filter_geom is None and (datetime_field is None or datetime_interval is None):
+            estimate = estimate_feature_count(layer)
+        elif sql_where_query:
+            estimate = estimate_feature_count(layer, sql_where_query)
+        
+        if estimate is not None:
+            return estimate, False
+        # Fall back to an exact count, if there are no statistics to estimate from
+    
+    matched_feature_count = get_feature_count(layer, filter_geom, datetime_interval, datetime_field, sql_where_query=sql_where_query)
+    if count_cache_key is not None:
+        FEATURE_COUNT_CACHE.set(count_cache_key, matched_feature_count)
+    
+    return matched_feature_count, True
+
+# SRIDs of the geometry columns per (connection string, layer name) of collections without stored SRID, so Find_SRID isn't queried for every page
+_LAYER_SRID_CACHE = cache_utils.LRUCache(max_entries=1024, ttl=300)
+
+def get_postgresql_layer_srid(ds: gdal.Dataset, layer: ogr.Layer, layer_metadata: Optional[collection_impl.LayerMetadata] = None) -> Optional[int]:
+    """Get the SRID of the geometry column of a PostGIS layer from the layer metadata resolved at registration. \n
+    Only collections registered before the SRID was stored query it from the database (cached for some minutes), until they are refreshed.
+    """
+    
+    # No round trip for collections with layer metadata, the SRID was resolved at registration
+    if layer_metadata is not None and layer_metadata.srid is not None:
+        return layer_metadata.srid
+    
+    cache_key = (ds.GetDescription(), layer.GetName())
+    srid = _LAYER_SRID_CACHE.get(cache_key)
+    if srid is None:
+        geom_col = layer_metadata.geometry_column if layer_metadata is not None else layer.GetGeometryColumn()
+        schema, table = layer.GetName().split(".")
+        with ds.ExecuteSQL(f"SELECT Find_SRID({postgis_query.quote_literal(schema)}, {postgis_query.quote_literal(table)}, {postgis_query.quote_literal(geom_col)}) as srid") as result:
+            srid = result.GetNextFeature().GetField("srid")
+        _LAYER_SRID_CACHE.set(cache_key, srid)
+    
+    return srid
+
+def build_projected_columns(
+    layer: ogr.Layer,
+    fid_col: str,
+    geom_col: str,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+    t_srid: Optional[int] = None,
+    materialized: bool = False,
+) -> str:
+    """The column list of a page query instead of `*`: The FID, the requested properties and the geometry columns, unless they are skipped. \n
+    With a target SRID, the geometry column is transformed by PostGIS. If the target SRID is materialized, the geometry is taken from the view,
+    which has to be joined with `materialized_geometry.build_join`.
+
+    Raises:
+        ValueError: If a property is not a field of the layer.
+    """
+    
+    layer_defn: ogr.FeatureDefn = layer.GetLayerDefn()
+    field_names = [layer_defn.GetFieldDefn(index).GetName() for index in range(layer_defn.GetFieldCount())]
+    validate_properties([name for name in field_names if name != fid_col], properties)
+    
+    columns = [postgis_query.quote_identifier(fid_col)]
+    for name in (properties if properties is not None else field_names):
+        if name != fid_col:
+            columns.append(postgis_query.quote_identifier(name))
+    
+    if skip_geometry:
+        return ", ".join(columns)
+    
+    for index in range(layer_defn.GetGeomFieldCount()):
+        name = layer_defn.GetGeomFieldDefn(index).GetName()
+        column = postgis_query.quote_identifier(name)
+        if name != geom_col or t_srid is None:
+            columns.append(column)
+        elif materialized:
+            columns.append(f"{materialized_geometry.build_geometry_expression(name, t_srid)} AS {column}")
+        else:
+            columns.append(f"ST_Transform({column}, {int(t_srid)}) AS {column}")
+    
+    return ", ".join(columns)
+
+def compile_postgresql_filter(
+    ds: gdal.Dataset,
+    layer: ogr.Layer,
+    filter_geom: Optional[ogr.Geometry],
+    datetime_interval: tuple[Optional[datetime.datetime], Optional[datetime.datetime]],
+    datetime_field: Optional[str],
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+) -> postgis_query.CompiledFilter:
+    """Compile the spatial and temporal filter of a PostGIS layer, which is shared by the count and the page query.
+
+    Args:
+        ds (gdal.Dataset): The dataset of the layer.
+        layer (ogr.Layer): The PostGIS layer.
+        filter_geom (Optional[ogr.Geometry]): The geometry to spatialy filter the features, in the spatial reference system of the layer.
+        datetime_interval (tuple[Optional[datetime.datetime], Optional[datetime.datetime]]): The datetime interval to filter features.
+        datetime_field (Optional[str]): The name of the datetime field to filter features.
+        layer_metadata (Optional[collection_impl.LayerMetadata]): The metadata stored with the collection. If None, it is resolved from the layer.
+
+    Returns:
+        postgis_query.CompiledFilter: The compiled filter.
+    """
+    
+    compiled = postgis_query.CompiledFilter()
+    if filter_geom is not None:
+        geom_col = layer_metadata.geometry_column if layer_metadata is not None else layer.GetGeometryColumn()
+        srid = get_postgresql_layer_srid(ds, layer, layer_metadata)
+        
+        if filter_geom.Is3D():
+            # Cant use ST_3DIntersects with Box3D, since the Box3D would "unwarp" the filter geometry and thus would make it bigger when one system is geographic while the other is projected
+            z_range = (filter_geom.GetGeometryRef(0).GetZ(0), filter_geom.GetGeometryRef(0).GetZ(2))
+            compiled = postgis_query.compile_geometry_filter(compiled, geom_col, srid, filter_geom.ExportToWkt(), z_range)
+        else:
+            filter_geom.FlattenTo2D()
+            compiled = postgis_query.compile_geometry_filter(compiled, geom_col, srid, filter_geom.ExportToWkt())
+    
+    return postgis_query.compile_datetime_filter(compiled, datetime_interval, datetime_field)
+
 def prepare_features_postgresql(
     layer: ogr.Layer, 
     filter_geom: Optional[ogr.Geometry], 
@@ -238,8 +769,26 @@ def prepare_features_postgresql(
     datetime_field: Optional[str], 
     limit: int, 
     offset: int, 
-    gdal_vector_translate_options: dict = None
-) -> tuple[Any, int, int]:
+    after_fid: Optional[int] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+    t_srs_res: Optional[str] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+) -> tuple[str, Optional[str], Optional[int], bool, Optional[osr.SpatialReference]]:
+    """Count the matched features and build the SQL statement for a page of features of a PostGIS layer. \n
+    If the target spatial reference system has a SRID, the geometries are transformed by PostGIS (ST_Transform), so only the
+    axis order is left to GDAL. Layers with a coordinate epoch are still transformed by GDAL, since PostGIS ignores epochs.
+    Only the requested properties (and the geometry, unless it is skipped) are selected.
+
+    Returns:
+        str: The SQL statement selecting the page (with one additional feature, if the count is not exact).
+        Optional[str]: The SQL dialect of the statement (None for the native dialect).
+        Optional[int]: The number of matched features.
+        bool: Whether the number of matched features is exact.
+        Optional[osr.SpatialReference]: The spatial reference system of the selected geometries, if they are already transformed. None if they are in the layer's one.
+    """
     
     if filter_geom:
         filter_geom_srs = filter_geom.GetSpatialReference()
@@ -247,54 +796,55 @@ def prepare_features_postgresql(
         if filter_geom_srs and layer_srs and not filter_geom_srs.IsSame(layer_srs):
             raise RuntimeError("Filter geometry and layer have different spatial reference systems")
     
-    layer_name = layer.GetName()
-    geom_col = layer.GetGeometryColumn()
-    fid_col = layer.GetFIDColumn()
-    schema, table = layer_name.split(".")
-    dataset: gdal.Dataset = layer.GetDataset()
+    schema, table = layer.GetName().split(".")
+    fid_col = layer_metadata.fid_column if layer_metadata is not None else layer.GetFIDColumn()
     
-    with dataset.ExecuteSQL(f"SELECT Find_SRID('{schema}', '{table}', '{geom_col}') as srid") as result:
-        feature = result.GetNextFeature()
-        srid = feature.GetField("srid")
+    # GDAL can't bind parameters, so the compiled filter is rendered with literals. The count and the page query share it.
+    where_filter = compile_postgresql_filter(layer.GetDataset(), layer, filter_geom, datetime_interval, datetime_field, layer_metadata)
+    where_clauses = where_filter.render()
     
-    where_clauses = []
-    if filter_geom:
-        if filter_geom.Is3D():
-            # Cant use ST_3DIntersects with Box3D, since the Box3D would "unwarp" the filter geometry and thus would make it bigger when one system is geographic while the other is projected
-            # where_clauses.append(f'ST_3DIntersects({geom_col}, Box3D(ST_GeomFromText(\'{filter_geom.ExportToWkt()}\', {srid})))')
-            
-            z_min = filter_geom.GetGeometryRef(0).GetZ(0)
-            z_max = filter_geom.GetGeometryRef(0).GetZ(2)
-            where_clauses.append(f'(ST_Intersects("{geom_col}", ST_GeomFromText(\'{filter_geom.ExportToWkt()}\', {srid})) AND ST_ZMin("{geom_col}") <= {z_max} AND ST_ZMax("{geom_col}") >= {z_min}) OR "{geom_col}" IS NULL')
-        else:
-            filter_geom.FlattenTo2D()
-            where_clauses.append(f'ST_Intersects("{geom_col}", ST_GeomFromText(\'{filter_geom.ExportToWkt()}\', {srid})) OR "{geom_col}" IS NULL')
-            
-    if datetime_interval and datetime_field:
-        start, end = datetime_interval
-        if start and end:
-            where_clauses.append(f'("{datetime_field}" >= \'{start.isoformat()}\' AND "{datetime_field}" <= \'{end.isoformat()}\') OR {datetime_field} IS NULL')
-        elif start:
-            where_clauses.append(f'"{datetime_field}" >= \'{start.isoformat()}\' OR {datetime_field} IS NULL')
-        elif end:
-            where_clauses.append(f'"{datetime_field}" <= \'{end.isoformat()}\' OR {datetime_field} IS NULL')
-
-    where_clauses = [f'({clause})' for clause in where_clauses]
-    where_clauses = (" WHERE " + " AND ".join(where_clauses)) if len(where_clauses) > 0 else ""
-    
-    matched_feature_count = get_feature_count(layer, filter_geom, datetime_interval, datetime_field, sql_where_query=where_clauses)
-    if offset >= matched_feature_count and matched_feature_count > 0:
+    matched_feature_count, count_is_exact = get_matched_feature_count(layer, filter_geom, datetime_interval, datetime_field, where_clauses, number_matched, count_cache_key)
+    if count_is_exact and offset >= matched_feature_count and matched_feature_count > 0:
         raise ValueError(f"Offset is greater than or equal to the number of features in the layer/extent")
     
-    sql_statement = f'SELECT * FROM "{schema}"."{table}" {where_clauses}'
-    sql_statement += f" ORDER BY {fid_col} LIMIT {limit} OFFSET {offset}"
+    # Keyset pagination: Continue after the last FID of the previous page, instead of skipping offset rows
+    if after_fid is not None:
+        where_clauses = where_filter.add(postgis_query.quote_identifier(fid_col) + " > %s", int(after_fid)).render()
     
-    options = gdal.VectorTranslateOptions(
-        **gdal_vector_translate_options,
-        SQLStatement=sql_statement
-    )
-
-    return options, matched_feature_count
+    columns = "*"
+    join = ""
+    geometry_srs = None
+    geom_col = layer_metadata.geometry_column if layer_metadata is not None else layer.GetGeometryColumn()
+    layer_srs = layer.GetSpatialRef()
+    transform_srid = None
+    materialized = False
+    if not skip_geometry and t_srs_res is not None and fid_col and geom_col and layer_srs is not None and not layer_srs.GetCoordinateEpoch():
+        try:
+            t_srid, _ = postgis_query.get_srid_from_ressource(t_srs_res)
+        except ValueError:
+            t_srid = None
+        
+        layer_srid = get_postgresql_layer_srid(layer.GetDataset(), layer, layer_metadata)
+        if t_srid is not None and layer_srid and t_srid != layer_srid:
+            transform_srid = t_srid
+            materialized = layer_metadata is not None and t_srid in layer_metadata.materialized_srids
+            if materialized:
+                join = materialized_geometry.build_join(schema, table, fid_col, t_srid)
+            # PostGIS writes easting/longitude first, like the traditional GIS order of GDAL
+            geometry_srs = gdal_utils.get_spatial_ref_from_ressource(t_srs_res).Clone()
+            geometry_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    
+    # Without a FID column the page can't be projected, the properties are then selected by get_features and stream_features
+    if fid_col and (transform_srid is not None or properties is not None or skip_geometry):
+        columns = build_projected_columns(layer, fid_col, geom_col, properties, skip_geometry, transform_srid, materialized)
+    
+    # Without an exact count, one additional feature is queried to know whether there is a next page
+    sql_statement = f'SELECT {columns} FROM "{schema}"."{table}"{join}{where_clauses}'
+    sql_statement += f' ORDER BY "{fid_col}" LIMIT {limit if count_is_exact else limit + 1}'
+    if after_fid is None:
+        sql_statement += f" OFFSET {offset}"
+    
+    return sql_statement, None, matched_feature_count, count_is_exact, geometry_srs
 
 def prepare_features_file(
     layer: ogr.Layer, 
@@ -303,16 +853,23 @@ def prepare_features_file(
     datetime_field: Optional[str], 
     limit: int, 
     offset: int, 
-    gdal_vector_translate_options: dict = None
-) -> tuple[Any, int, int]:
+    after_fid: Optional[int] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+) -> tuple[str, Optional[str], Optional[int], bool, Optional[osr.SpatialReference]]:
+    """Count the matched features and build the SQL statement for a page of features of a file based layer. \n
+    Returns the same values as `prepare_features_postgresql`.
+    """
     # Needs to be redone if file based drivers become available
     
     where_clauses = []
     geom_col = layer.GetGeometryColumn()
     fid_col = layer.GetFIDColumn()
     
-    matched_feature_count = get_feature_count(layer, filter_geom, datetime_interval)
-    if offset >= matched_feature_count and matched_feature_count > 0:
+    matched_feature_count, count_is_exact = get_matched_feature_count(layer, filter_geom, datetime_interval, number_matched=number_matched, count_cache_key=count_cache_key)
+    if count_is_exact and offset >= matched_feature_count and matched_feature_count > 0:
         raise ValueError(f"Offset is greater than or equal to the number of features in the layer/extent")
     
     if filter_geom:
@@ -333,19 +890,25 @@ def prepare_features_file(
         where_clauses.append(f'(ST_Intersects({geom_col}, ST_GeomFromText(\'{filter_geom.ExportToWkt()}\')) {query_3D_string})')
         where_clauses.append(f'(ST_IsEmpty({geom_col}))')
         
-    sqllite_query = (
-        f'SELECT * FROM "{layer.GetName()}" '
-        f'WHERE {" OR ".join(where_clauses)} '
-        f'ORDER BY {fid_col} LIMIT {limit} OFFSET {offset}'
-    )
+    where_query = f'({" OR ".join(where_clauses)})' if len(where_clauses) > 0 else ""
+    # Keyset pagination: Continue after the last FID of the previous page, instead of skipping offset rows
+    if after_fid is not None:
+        where_query += (" AND " if where_query else "") + f'"{fid_col}" > {int(after_fid)}'
     
-    options = gdal.VectorTranslateOptions(
-        **gdal_vector_translate_options,
-        SQLDialect="SQLite",
-        SQLStatement=sqllite_query
-    )
+    # Only layers with a FID column keep their FIDs with a column list, the properties of the others are selected by get_features and stream_features
+    columns = "*"
+    if fid_col and (properties is not None or skip_geometry):
+        columns = build_projected_columns(layer, fid_col, geom_col, properties, skip_geometry)
     
-    return options, matched_feature_count    
+    sqllite_query = f'SELECT {columns} FROM "{layer.GetName()}" '
+    if where_query:
+        sqllite_query += f'WHERE {where_query} '
+    # Without an exact count, one additional feature is queried to know whether there is a next page
+    sqllite_query += f'ORDER BY "{fid_col}" LIMIT {limit if count_is_exact else limit + 1}'
+    if after_fid is None:
+        sqllite_query += f" OFFSET {offset}"
+    
+    return sqllite_query, "SQLite", matched_feature_count, count_is_exact, None
     
     # Manuell getting and filtering of features
     # Currently not used, but might be useful in the future
@@ -416,6 +979,87 @@ def prepare_features_file(
     
     # return features, matched_feature_count, returned_feature_count
 
+def get_filter_geometry(layer: ogr.Layer, bbox: Optional[list[float]], bbox_srs_res: Optional[str]) -> Optional[ogr.Geometry]:
+    """Create the filter geometry of a bounding box in the spatial reference system of the layer.
+
+    Args:
+        layer (ogr.Layer): The layer, which is filtered.
+        bbox (Optional[list[float]]): The bounding box in format xmin, ymin, xmax, ymax or xmin, ymin, zmin, xmax, ymax, zmax.
+        bbox_srs_res (Optional[str]): The coordinate reference system of the bounding box as URI or URN.
+
+    Raises:
+        ValueError: If the bounding box or its coordinate reference system is invalid.
+
+    Returns:
+        Optional[ogr.Geometry]: The filter geometry or None, if no bounding box is given.
+    """
+    
+    if bbox is None:
+        return None
+    
+    try:
+        bbox_srs = gdal_utils.get_spatial_ref_from_ressource(bbox_srs_res)
+    except ValueError as error:
+        raise ValueError(f"Invalid bounding box spatial reference system: {error}") from error
+
+    filter_ring = ogr.Geometry(ogr.wkbLinearRing)
+    if len(bbox) == 4:
+        filter_ring.AddPoint_2D(bbox[0], bbox[1])
+        filter_ring.AddPoint_2D(bbox[2], bbox[1])
+        filter_ring.AddPoint_2D(bbox[2], bbox[3])
+        filter_ring.AddPoint_2D(bbox[0], bbox[3])
+        filter_ring.AddPoint_2D(bbox[0], bbox[1])
+    elif len(bbox) == 6:
+        filter_ring.AddPoint(bbox[0], bbox[1], bbox[2])
+        filter_ring.AddPoint(bbox[3], bbox[1], bbox[2])
+        filter_ring.AddPoint(bbox[3], bbox[4], bbox[5])
+        filter_ring.AddPoint(bbox[0], bbox[4], bbox[5])
+        filter_ring.AddPoint(bbox[0], bbox[1], bbox[2])
+    else:
+        raise ValueError("Input for parameter 'bbox' of type 'query' is invalid. Input should consist of 4 or 6 values")
+
+    filter_geom = ogr.Geometry(ogr.wkbPolygon)
+    filter_geom.AddGeometry(filter_ring)
+    
+    filter_geom.AssignSpatialReference(bbox_srs)
+    
+    # Ensure the filter geometry has the same spatial reference as the layer
+    layer_srs = layer.GetSpatialRef()
+    if bbox_srs and layer_srs and not bbox_srs.IsSame(layer_srs):
+        transform = gdal_utils.SPATIAL_REF_REGISTRY.get_transformation(bbox_srs_res, layer_srs)
+        filter_geom.Transform(transform)
+    
+    return filter_geom
+
+def prepare_features(
+    ds: gdal.Dataset,
+    layer: ogr.Layer,
+    bbox: Optional[list[float]], 
+    bbox_srs_res: Optional[str], 
+    datetime_interval: tuple[Optional[datetime.datetime], Optional[datetime.datetime]], 
+    datetime_field: Optional[str], 
+    limit: int, 
+    offset: int,
+    after_fid: Optional[int] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+    t_srs_res: Optional[str] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+) -> tuple[str, Optional[str], Optional[int], bool, Optional[osr.SpatialReference]]:
+    """Count the matched features and build the SQL statement for a page of features with the driver specific prepare function. \n
+    Returns the same values as `prepare_features_postgresql`.
+    """
+    
+    filter_geom = get_filter_geometry(layer, bbox, bbox_srs_res)
+    
+    driver_name = ds.GetDriver().GetName()
+    if driver_name == "PostgreSQL":
+        return prepare_features_postgresql(layer, filter_geom, datetime_interval, datetime_field, limit, offset, after_fid, number_matched, count_cache_key, layer_metadata, t_srs_res, properties, skip_geometry)
+    
+    return prepare_features_file(layer, filter_geom, datetime_interval, datetime_field, limit, offset, after_fid, number_matched, count_cache_key, properties, skip_geometry)
+
 def get_features(
     dataset_wrapper: gdal_utils.DatasetWrapper, 
     layer_name: str, bbox: list[float], 
@@ -424,7 +1068,14 @@ def get_features(
     datetime_field: Optional[str], 
     t_srs_res: str, 
     limit: int, 
-    offset: int
+    offset: int,
+    after_fid: Optional[int] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+    precision: Optional[int] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
 ):
     """Get features from a dataset within a bounding box.
 
@@ -437,16 +1088,25 @@ def get_features(
         datetime_field (Optional[str]): The optional field for filtering by datetime.
         t_srs_res (str): The target spatial reference system as URI or URN.
         limit (int): The maximum number of features to return.
-        offset (int): The number of features to skip.
+        offset (int): The number of features to skip. Ignored for the query, if after_fid is given.
+        after_fid (Optional[int]): The FID of the last feature of the previous page (keyset pagination).
+        number_matched (ogc_api_config.params.NumberMatched): Whether the number of matched features is counted exactly, estimated or omitted.
+        count_cache_key (Optional[tuple]): Key of the collection and filter, under which exact counts are cached.
+        layer_metadata (Optional[collection_impl.LayerMetadata]): The layer metadata stored with the collection. If None, it is resolved from the layer.
+        precision (Optional[int]): The number of decimal places of the coordinates (see get_coordinate_precision). None keeps the full precision.
+        properties (Optional[list[str]]): The properties of the features. None selects all properties.
+        skip_geometry (bool): Whether the geometries are left out (written as null).
 
     Raises:
         ValueError: Provided parameters are invalid
         RuntimeError: If the layer is not found in the dataset.
 
     Returns:
-        dict: A dictionary (GeoJSON) containing the features retrieved from the dataset.
-        int: The total number of features in the layer with given spatial, attribute and (temporal) filter.
-        int: The returned number of features in the GeoJSON object with given spatial, attribute and (temporal) filter.
+        bytes: The encoded GeoJSON features separated by commas (see build_feature_collection).
+        Optional[int]: The (estimated) total number of features in the layer with given spatial, attribute and (temporal) filter. None if omitted.
+        int: The returned number of features with given spatial, attribute and (temporal) filter.
+        bool: Whether there is a next page of features.
+        Optional[int]: The FID of the last returned feature.
     """
     ds: gdal.Dataset
     with dataset_wrapper as ds:
@@ -454,185 +1114,252 @@ def get_features(
             layer = ds.GetLayerByName(layer_name)
         except RuntimeError as error:
             raise RuntimeError(f"Layer '{layer_name}' not found in dataset '{ds.GetDescription()}'") from error
-    
-    try:
-        t_srs = gdal_utils.get_spatial_ref_from_ressource(t_srs_res)
-    except ValueError as error:
-        raise ValueError(f"Invalid target spatial reference system: {error}") from error
-    
-    filter_geom = None
-    if bbox is not None:
+        
         try:
-            bbox_srs = gdal_utils.get_spatial_ref_from_ressource(bbox_srs_res)
+            t_srs = gdal_utils.get_spatial_ref_from_ressource(t_srs_res)
         except ValueError as error:
-            raise ValueError(f"Invalid bounding box spatial reference system: {error}") from error
-
-        filter_ring = ogr.Geometry(ogr.wkbLinearRing)
-        if len(bbox) == 4:
-            filter_ring.AddPoint_2D(bbox[0], bbox[1])
-            filter_ring.AddPoint_2D(bbox[2], bbox[1])
-            filter_ring.AddPoint_2D(bbox[2], bbox[3])
-            filter_ring.AddPoint_2D(bbox[0], bbox[3])
-            filter_ring.AddPoint_2D(bbox[0], bbox[1])
-        elif len(bbox) == 6:
-            filter_ring.AddPoint(bbox[0], bbox[1], bbox[2])
-            filter_ring.AddPoint(bbox[3], bbox[1], bbox[2])
-            filter_ring.AddPoint(bbox[3], bbox[4], bbox[5])
-            filter_ring.AddPoint(bbox[0], bbox[4], bbox[5])
-            filter_ring.AddPoint(bbox[0], bbox[1], bbox[2])
-        else:
-            raise ValueError("Input for parameter 'bbox' of type 'query' is invalid. Input should consist of 4 or 6 values")
-
-        filter_geom = ogr.Geometry(ogr.wkbPolygon)
-        filter_geom.AddGeometry(filter_ring)
+            raise ValueError(f"Invalid target spatial reference system: {error}") from error
         
-        filter_geom.AssignSpatialReference(bbox_srs)
+        fid_col = layer_metadata.fid_column if layer_metadata is not None else layer.GetFIDColumn()
+        translate_options = {
+            "format": "GeoJSON",
+            "dstSRS": t_srs,
+            "reproject": True,
+            "layerCreationOptions": {
+                "WRITE_NAME": False,
+                "ID_FIELD": fid_col,
+            },
+        }
+        if precision is not None:
+            # Rounded by the GeoJSON driver while the coordinates are written, instead of 15 significant digits
+            translate_options["layerCreationOptions"]["COORDINATE_PRECISION"] = precision
         
-        # Ensure the filter geometry has the same spatial reference as the layer
-        layer_srs = layer.GetSpatialRef()
-        if bbox_srs and layer_srs and not bbox_srs.IsSame(layer_srs):
-            transform = osr.CoordinateTransformation(bbox_srs, layer_srs)
-            filter_geom.Transform(transform)
-    
-    translate_options = {
-        "format": "GeoJSON",
-        "srcSRS": layer.GetSpatialRef(),
-        "dstSRS": t_srs,
-        "reproject": True,
-        "layerCreationOptions": {
-            "WRITE_NAME": False,
-            "ID_FIELD": layer.GetFIDColumn(),
-        },
-    }
-    
-    driver_name = ds.GetDriver().GetName()
-    with gdal.config_option("GDAL_NUM_THREADS", "ALL_CPUS"):
-        if driver_name == "PostgreSQL":
-            options, matched_feature_count = prepare_features_postgresql(layer, filter_geom, datetime_interval, datetime_field, limit, offset, translate_options)
-        else:
-            options, matched_feature_count = prepare_features_file(layer, filter_geom, datetime_interval, datetime_field, limit, offset, translate_options)
-                
-        file_id = uuid.uuid4()
-        gdal.VectorTranslate(f"/vsimem/{file_id}.geojson", dataset_wrapper.dataset_desc, options=options)
-        vsi_file = gdal.VSIFOpenL(f'/vsimem/{file_id}.geojson', 'rb')
-        # Get the file size
-        gdal.VSIFSeekL(vsi_file, 0, 2)  # Seek to end
-        file_size = gdal.VSIFTellL(vsi_file)
-        gdal.VSIFSeekL(vsi_file, 0, 0)  # Seek back to beginning
+        # Pages of layers with a FID column are projected in the SQL statement, the others are projected while they are translated
+        if not fid_col:
+            layer_defn: ogr.FeatureDefn = layer.GetLayerDefn()
+            validate_properties([layer_defn.GetFieldDefn(index).GetName() for index in range(layer_defn.GetFieldCount())], properties)
+            if properties is not None:
+                translate_options["selectFields"] = properties
+            if skip_geometry:
+                translate_options["geometryType"] = "NONE"
         
-        # Read entire content at once
-        content = gdal.VSIFReadL(1, file_size, vsi_file)
-        # Process the content as needed (e.g., decode from bytes)
-        geojson_object = orjson.loads(content)
+        # Limited to the share of the worker pool's CPU budget, since all workers run queries at the same time
+        with gdal.config_option("GDAL_NUM_THREADS", str(worker_pool.FEATURE_WORKER_POOL.threads_per_task)):
+            sql_statement, sql_dialect, matched_feature_count, count_is_exact, geometry_srs = prepare_features(ds, layer, bbox, bbox_srs_res, datetime_interval, datetime_field, limit, offset, after_fid, number_matched, count_cache_key, layer_metadata, t_srs_res, properties, skip_geometry)
+            
+            options = gdal.VectorTranslateOptions(
+                **translate_options,
+                # Geometries transformed by the database only need the axis order of the target CRS
+                srcSRS=geometry_srs or layer.GetSpatialRef(),
+                SQLStatement=sql_statement,
+                SQLDialect=sql_dialect,
+            )
+            
+            file_id = uuid.uuid4()
+            # Translate from the pooled dataset, instead of opening the dataset (and its connection) again
+            gdal.VectorTranslate(f"/vsimem/{file_id}.geojson", ds, options=options)
+            vsi_file = gdal.VSIFOpenL(f'/vsimem/{file_id}.geojson', 'rb')
+            # Get the file size
+            gdal.VSIFSeekL(vsi_file, 0, 2)  # Seek to end
+            file_size = gdal.VSIFTellL(vsi_file)
+            gdal.VSIFSeekL(vsi_file, 0, 0)  # Seek back to beginning
+            
+            # Read entire content at once
+            content = gdal.VSIFReadL(1, file_size, vsi_file)
+            
+            # Close the file
+            gdal.VSIFCloseL(vsi_file)
+            gdal.Unlink(f'/vsimem/{file_id}.geojson')
+    
+    # The features are kept encoded, only the envelope of the page is built by the caller
+    features = split_geojson_features(content)
+    returned_feature_count = len(features)
+    if count_is_exact:
+        has_next_page = offset + returned_feature_count < matched_feature_count
+    else:
+        # The offset check of the prepare functions needs an exact count, so an empty page is detected here instead
+        if returned_feature_count == 0 and offset > 0:
+            raise ValueError(f"Offset is greater than or equal to the number of features in the layer/extent")
         
-        # Close the file
-        gdal.VSIFCloseL(vsi_file)
-        gdal.Unlink(f'/vsimem/{file_id}.geojson')
+        # Remove the additionally queried feature, which only indicates a next page
+        has_next_page = returned_feature_count > limit
+        if has_next_page:
+            features = features[:limit]
+            returned_feature_count = limit
+    
+    last_fid = get_encoded_feature_id(features[-1]) if returned_feature_count > 0 else None
+    
+    return b",".join(features), matched_feature_count, returned_feature_count, has_next_page, last_fid
+
+class FeatureStream(object):
+    """
+    Chunks of a streamed page (see `stream_features`).\n
+    The dataset of the stream is returned to the pool, as soon as the stream is exhausted, fails or is closed. This also holds for streams,
+    which are abandoned before their first chunk (e.g. the client disconnected), since the chunk generator wouldn't run its cleanup then.
+    """
+    
+    __slots__ = ("_chunks", "_dataset_wrapper", "_lock")
+    
+    def __init__(self, chunks: Iterator[bytes], dataset_wrapper: gdal_utils.DatasetWrapper):
+        self._chunks = chunks
+        self._dataset_wrapper = dataset_wrapper
+        self._lock = threading.Lock()
+    
+    def __iter__(self) -> "FeatureStream":
+        return self
+    
+    def __next__(self) -> bytes:
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except BaseException as error:
+            self._release(type(error))
+            raise
+    
+    def close(self) -> None:
+        """Close the stream and return its dataset to the pool. Closing a stream more than once has no effect."""
         
-        return geojson_object, matched_feature_count, len(geojson_object["features"])
+        try:
+            # Closes the result set of the page, before the dataset is lent again
+            self._chunks.close()
+        finally:
+            self._release(None)
+    
+    def _release(self, exc_type: Optional[type]) -> None:
+        with self._lock:
+            dataset_wrapper, self._dataset_wrapper = self._dataset_wrapper, None
+        if dataset_wrapper is not None:
+            dataset_wrapper.__exit__(exc_type, None, None)
+    
+    def __del__(self):
+        self.close()
 
 # Apparently clients like QGIS cant handle streamed data. They receive it but they only render the features after the whole response is received
-# So streaming doesnt lead to a better user experience (showing more and more features until everything is finished)instead of waiting)
-# I leave this function in here for the time being, but it is not used
-async def stream_features(dataset_wrapper: gdal_utils.DatasetWrapper, layer_name: str, limit: int, offset: int, bbox: list[float], bbox_srs_res: str, t_srs_res: str):
-    ds: gdal.Dataset
-    with dataset_wrapper as ds:
+# So streaming doesnt lead to a better user experience, but it keeps the memory of the server at the size of a chunk instead of a whole (large) page
+def stream_features(
+    dataset_wrapper: gdal_utils.DatasetWrapper, 
+    layer_name: str, 
+    bbox: list[float], 
+    bbox_srs_res: str, 
+    datetime_interval: tuple[Optional[datetime.datetime], Optional[datetime.datetime]], 
+    datetime_field: Optional[str], 
+    t_srs_res: str, 
+    limit: int, 
+    offset: int,
+    trailer_callback: Callable[[int, bool, Optional[int]], dict],
+    after_fid: Optional[int] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+    precision: Optional[int] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+) -> tuple[FeatureStream, Optional[int]]:
+    """Get features from a dataset as a stream of GeoJSON chunks. \n
+    The matched features are counted (and the parameters validated) before the stream starts, so errors can still be returned as such.
+    The features are written in batches, as they come off the OGR cursor, and the members after the features array are written as a trailer.
+
+    Args:
+        trailer_callback (Callable[[int, bool, Optional[int]], dict]): Called with the returned number of features, whether there is a next page and the last FID after all features are written. Returns the members (e.g. links) of the trailer.
+        precision (Optional[int]): The number of decimal places of the coordinates. None keeps the full precision.
+        Other arguments are the same as in `get_features`.
+
+    Raises:
+        ValueError: Provided parameters are invalid
+        RuntimeError: If the layer is not found in the dataset.
+
+    Returns:
+        FeatureStream: The chunks of the GeoJSON document. It has to be exhausted or closed, to return the dataset to the pool.
+        Optional[int]: The (estimated) total number of features with given filters. None if omitted.
+    """
+    
+    # The dataset stays open until the stream is finished, so it is returned to the pool by the stream
+    ds: gdal.Dataset = dataset_wrapper.__enter__()
+    try:
         try:
             layer = ds.GetLayerByName(layer_name)
         except RuntimeError as error:
             raise RuntimeError(f"Layer '{layer_name}' not found in dataset '{ds.GetDescription()}'") from error
-    
-    try:
-        t_srs = gdal_utils.get_spatial_ref_from_ressource(t_srs_res)
-    except ValueError as error:
-        raise ValueError(f"Invalid target spatial reference system: {error}") from error
-    
-    filter_geom = None
-    if bbox is not None:
+        
         try:
-            bbox_srs = gdal_utils.get_spatial_ref_from_ressource(bbox_srs_res)
+            # Resolved before the stream starts, so an invalid CRS is still returned as error
+            gdal_utils.get_spatial_ref_from_ressource(t_srs_res)
         except ValueError as error:
-            raise ValueError(f"Invalid bounding box spatial reference system: {error}") from error
-
-        filter_ring = ogr.Geometry(ogr.wkbLinearRing)
-        if len(bbox) == 4:
-            filter_ring.AddPoint_2D(bbox[0], bbox[1])
-            filter_ring.AddPoint_2D(bbox[2], bbox[1])
-            filter_ring.AddPoint_2D(bbox[2], bbox[3])
-            filter_ring.AddPoint_2D(bbox[0], bbox[3])
-            filter_ring.AddPoint_2D(bbox[0], bbox[1])
-        elif len(bbox) == 6:
-            filter_ring.AddPoint(bbox[0], bbox[1], bbox[2])
-            filter_ring.AddPoint(bbox[3], bbox[1], bbox[2])
-            filter_ring.AddPoint(bbox[3], bbox[4], bbox[5])
-            filter_ring.AddPoint(bbox[0], bbox[4], bbox[5])
-            filter_ring.AddPoint(bbox[0], bbox[1], bbox[2])
-        else:
-            raise ValueError("Bounding box must have 4 or 6 coordinates")
-
-        filter_geom = ogr.Geometry(ogr.wkbPolygon)
-        filter_geom.AddGeometry(filter_ring)
+            raise ValueError(f"Invalid target spatial reference system: {error}") from error
         
-        filter_geom.AssignSpatialReference(bbox_srs)
+        sql_statement, sql_dialect, matched_feature_count, count_is_exact, geometry_srs = prepare_features(ds, layer, bbox, bbox_srs_res, datetime_interval, datetime_field, limit, offset, after_fid, number_matched, count_cache_key, layer_metadata, t_srs_res, properties, skip_geometry)
         
-        # Ensure the filter geometry has the same spatial reference as the layer
-        layer_srs = layer.GetSpatialRef()
-        if bbox_srs and layer_srs and not bbox_srs.IsSame(layer_srs):
-            transform = osr.CoordinateTransformation(bbox_srs, layer_srs)
-            filter_geom.Transform(transform)
+        # Pages of layers without a FID column aren't projected in the SQL statement, so the properties are selected while they are encoded
+        fid_col = layer_metadata.fid_column if layer_metadata is not None else layer.GetFIDColumn()
+        get_property_fields(layer.GetLayerDefn(), fid_col, properties)
+    except Exception as error:
+        dataset_wrapper.__exit__(type(error), error, error.__traceback__)
+        raise
     
-    driver_name = ds.GetDriver().GetName()
-    with gdal.config_option("GDAL_NUM_THREADS", "ALL_CPUS"):
-        if driver_name == "PostgreSQL":
-            features, matched_feature_count, returned_feature_count = prepare_features_postgresql(layer, filter_geom, limit, offset)
-        else:
-            features, matched_feature_count, returned_feature_count = prepare_features_file(layer, filter_geom, limit, offset)
+    layer_srs = layer.GetSpatialRef()
     
-        yield b'{"type":"FeatureCollection","features":['
-    
-        fid_col = layer.GetFIDColumn()
-        buffer_size = 0.5 * 1024 * 1024  # 0.5 MB
-        max_features_per_chunk = 50
+    def generate_chunks() -> Iterator[bytes]:
+        buffer_size = 512 * 1024  # 0.5 MB
+        
+        yield FEATURE_COLLECTION_PREFIX
+        
+        returned_feature_count = 0
+        has_next_page = False
+        last_fid = None
+        batch = []
         buffer = []
         current_size = 0
         
-        for idx, feature in enumerate(features):
-            # Transform and prepare the feature
-            geom: ogr.Geometry = feature.GetGeometryRef()
-            if geom:
-                geom.TransformTo(t_srs)
+        result: ogr.Layer
+        with ds.ExecuteSQL(sql_statement, dialect=sql_dialect or "") as result:
+            # The coordinates of a batch are transformed together (see gdal_utils.BulkTransformation)
+            result_srs = geometry_srs or result.GetSpatialRef() or layer_srs
+            fields, fid_index = get_property_fields(result.GetLayerDefn(), fid_col, properties)
             
-            # Export feature and remove properties you don't want
-            json_feature = feature.ExportToJson(as_object=True)
-            if fid_col in json_feature["properties"]:
-                del json_feature["properties"][fid_col]
-                
-            # Convert to string with proper JSON formatting
-            feature_str = orjson.dumps(json_feature)
+            def encode_batch() -> bytes:
+                # The first batch starts the features array, every other one continues it
+                chunk = b",".join(encode_features(batch, fields, fid_index, precision, result_srs, t_srs_res, skip_geometry))
+                return chunk if returned_feature_count == len(batch) else b"," + chunk
             
-            # Add comma if not the first feature
-            if idx > 0:
-                feature_str = b"," + feature_str
+            for feature in result:
+                # Only possible if the count isn't exact, then the additional feature indicates a next page
+                if returned_feature_count == limit:
+                    has_next_page = True
+                    break
+                
+                batch.append(feature)
+                returned_feature_count += 1
                 
-            buffer.append(feature_str)
-            current_size += sys.getsizeof(feature_str)
+                # The geometries of a batch are encoded together, the features stay open only until then
+                if len(batch) == ENCODE_BATCH_SIZE:
+                    last_fid = get_feature_id(batch[-1], fid_index)
+                    buffer.append(encode_batch())
+                    current_size += len(buffer[-1])
+                    batch = []
+                
+                if current_size >= buffer_size:
+                    yield b"".join(buffer)
+                    buffer = []
+                    current_size = 0
             
-            # Yield when buffer gets large enough
-            if current_size >= buffer_size or len(buffer) >= max_features_per_chunk:
-                yield b"".join(buffer)
-                buffer = []
-                current_size = 0
+            if batch:
+                last_fid = get_feature_id(batch[-1], fid_index)
+                buffer.append(encode_batch())
+                batch = []
         
-        # Send any remaining buffered features
         if buffer:
             yield b"".join(buffer)
-            
-        # Complete the GeoJSON document
-        import datetime as dt
-        footer = f'],"numberMatched":{matched_feature_count},"numberReturned":{returned_feature_count},"timeStamp":"{dt.datetime.now().replace(microsecond=0).isoformat()}"'
-        footer += '}'
         
-        yield footer
+        if count_is_exact:
+            has_next_page = offset + returned_feature_count < matched_feature_count
+        
+        trailer = trailer_callback(returned_feature_count, has_next_page, last_fid)
+        # Remove the opening brace, since the members are appended to the already opened document
+        yield b"]," + orjson.dumps(trailer)[1:] if trailer else b"]}"
+    
+    return FeatureStream(generate_chunks(), dataset_wrapper), matched_feature_count
 
 def generate_features_links(base_url: str, url_self: str, url_next: str = None, url_prev: str = None) -> list[dict[str, str]]:
     links = []
@@ -0,0 +1,484 @@
+import datetime
+from typing import Any, Optional
+
+import orjson
+import psycopg
+from psycopg import sql
+
+from server.database import models, pg_pool
+from server.ogc_apis import ogc_api_config
+from server.ogc_apis.features.implementation.dynamic import collection as collection_impl, feature as feature_impl, materialized_geometry, postgis_query
+from server.utils import cache_utils
+
+# Native PostGIS engine: The features of a page are encoded as GeoJSON by PostGIS and aggregated to a single text value,
+# so neither OGR features nor JSON documents are created in Python. The bytes are only wrapped into the FeatureCollection.
+# All queries run on the async connection pool of the dataset, so they don't block the event loop.
+# With the feature cache, a page only selects its FIDs and the features, which aren't cached yet, are encoded (see feature.FEATURE_FRAGMENT_CACHE).
+
+# Schema information of the layers per (connection string, layer name)
+_LAYER_INFO_CACHE = cache_utils.LRUCache(max_entries=1024, ttl=300)
+
+class LayerInfo(object):
+    __slots__ = ("schema", "table", "fid_column", "geometry_column", "srid", "is_3D", "materialized_srids")
+
+    def __init__(self, schema: str, table: str, fid_column: str, geometry_column: str, srid: int, is_3D: bool, materialized_srids: frozenset[int] = frozenset()):
+        self.schema = schema
+        self.table = table
+        self.fid_column = fid_column
+        self.geometry_column = geometry_column
+        self.srid = srid
+        self.is_3D = is_3D
+        self.materialized_srids = materialized_srids
+
+def is_applicable(collection: models.CollectionTable, *ressources: Optional[str]) -> bool:
+    """Whether the items of the collection are read by this engine: The engine is selected for the collection, the dataset is a PostgreSQL database and all coordinate reference systems have a SRID. \n
+    ST_Transform ignores coordinate epochs, so collections with a dynamic storage CRS are only read by this engine in their storage CRS.
+    """
+
+    return (
+        collection.feature_engine == models.CollectionTable.FeatureEngine.POSTGIS.value
+        and collection.dataset.type == models.Dataset.Type.DB
+        and all(postgis_query.supports_crs(ressource) for ressource in ressources)
+        and (not collection.storage_crs_coordinate_epoch or all(ressource in (None, collection.storage_crs) for ressource in ressources))
+    )
+
+async def get_layer_info(connection: psycopg.AsyncConnection, conninfo: str, layer_name: str, layer_metadata: Optional[collection_impl.LayerMetadata] = None) -> LayerInfo:
+    """Get the schema, primary key, geometry column and SRID of a PostGIS table. \n
+    Taken from the layer metadata stored with the collection, if it is complete. Otherwise it is queried and cached for some minutes.
+
+    Raises:
+        RuntimeError: If the table has no geometry column or no primary key.
+    """
+
+    if layer_metadata is not None and layer_metadata.srid is not None:
+        schema, table = layer_name.split(".", 1)
+        return LayerInfo(schema, table, layer_metadata.fid_column, layer_metadata.geometry_column, layer_metadata.srid, layer_metadata.is_3D, layer_metadata.materialized_srids)
+
+    cache_key = (conninfo, layer_name)
+    layer_info = _LAYER_INFO_CACHE.get(cache_key)
+    if layer_info is not None:
+        return layer_info
+
+    schema, table = layer_name.split(".", 1)
+    async with connection.cursor() as cursor:
+        await cursor.execute(
+            "SELECT f_geometry_column, srid, coord_dimension FROM geometry_columns WHERE f_table_schema = %s AND f_table_name = %s LIMIT 1",
+            (schema, table),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"Layer '{layer_name}' has no geometry column")
+        geometry_column, srid, coord_dimension = row
+
+        await cursor.execute(
+            """SELECT a.attname FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = %s::regclass AND i.indisprimary AND array_length(i.indkey, 1) = 1""",
+            (sql.Identifier(schema, table).as_string(connection),),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"Layer '{layer_name}' has no single column primary key, which is needed as feature id")
+        fid_column = row[0]
+
+    layer_info = LayerInfo(schema, table, fid_column, geometry_column, srid, coord_dimension > 2)
+    _LAYER_INFO_CACHE.set(cache_key, layer_info)
+    return layer_info
+
+def build_where_clause(
+    layer_info: LayerInfo,
+    bbox: Optional[list[float]],
+    bbox_srs_res: Optional[str],
+    datetime_interval: Optional[tuple[Optional[datetime.datetime], Optional[datetime.datetime]]],
+    datetime_field: Optional[str],
+) -> postgis_query.CompiledFilter:
+    """Compile the spatial and temporal filter, which is shared by the count and the page query.
+
+    Raises:
+        ValueError: If the bounding box or its coordinate reference system is invalid.
+    """
+
+    compiled = postgis_query.CompiledFilter()
+    if bbox is not None:
+        try:
+            bbox_srid, swap_axes = postgis_query.get_srid_from_ressource(bbox_srs_res)
+        except ValueError as error:
+            raise ValueError(f"Invalid bounding box spatial reference system: {error}") from error
+
+        compiled = postgis_query.compile_bbox_filter(compiled, layer_info.geometry_column, layer_info.srid, bbox, bbox_srid, swap_axes)
+
+    return postgis_query.compile_datetime_filter(compiled, datetime_interval, datetime_field)
+
+async def get_matched_feature_count(
+    connection: psycopg.AsyncConnection,
+    layer_info: LayerInfo,
+    where_filter: postgis_query.CompiledFilter,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+) -> tuple[Optional[int], bool]:
+    """Get the number of features matching the compiled filter according to the numberMatched policy. \n
+    Exact counts share the cache of the GDAL engine.
+
+    Returns:
+        tuple[Optional[int], bool]: The number of matched features (None if omitted) and whether the number is exact.
+    """
+
+    if number_matched == ogc_api_config.params.NumberMatched.omitted:
+        return None, False
+
+    if count_cache_key is not None:
+        cached_count = feature_impl.FEATURE_COUNT_CACHE.get(count_cache_key)
+        if cached_count is not None:
+            return cached_count, True
+
+    table = sql.Identifier(layer_info.schema, layer_info.table)
+    if number_matched == ogc_api_config.params.NumberMatched.estimated:
+        estimate = None
+        if not where_filter:
+            # reltuples is -1 (PostgreSQL >= 14) or 0, if the table was never vacuumed or analyzed
+            async with connection.cursor() as cursor:
+                await cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", (table.as_string(connection),))
+                row = await cursor.fetchone()
+                estimate = row[0] if row is not None and row[0] > 0 else None
+        else:
+            # Utility statements like EXPLAIN can't have server side parameters
+            async with psycopg.AsyncClientCursor(connection) as cursor:
+                await cursor.execute(sql.SQL("EXPLAIN (FORMAT JSON) SELECT 1 FROM {table}").format(table=table) + sql.SQL(where_filter.where), where_filter.params)
+                plan = (await cursor.fetchone())[0]
+                if isinstance(plan, str):
+                    plan = orjson.loads(plan)
+                estimate = int(plan[0]["Plan"]["Plan Rows"])
+
+        if estimate is not None:
+            return estimate, False
+        # Fall back to an exact count, if there are no statistics to estimate from
+
+    async with connection.cursor() as cursor:
+        # The statement text only depends on the collection and the kind of filter, so the prepared plan is reused
+        await cursor.execute(sql.SQL("SELECT count(*) FROM {table}").format(table=table) + sql.SQL(where_filter.where), where_filter.params, prepare=True)
+        matched_feature_count = (await cursor.fetchone())[0]
+
+    if count_cache_key is not None:
+        feature_impl.FEATURE_COUNT_CACHE.set(count_cache_key, matched_feature_count)
+
+    return matched_feature_count, True
+
+def build_columns(layer_info: LayerInfo, properties: Optional[list[str]] = None, skip_geometry: bool = False) -> sql.Composable:
+    """The columns of the table, which are selected: The FID, the requested properties and the geometry, unless it is skipped. \n
+    Without requested properties all columns are selected, a skipped geometry is then only left out by `build_feature_object`.
+    """
+
+    if properties is None:
+        return sql.SQL("*")
+
+    columns = [layer_info.fid_column] + [name for name in properties if name not in (layer_info.fid_column, layer_info.geometry_column)]
+    if not skip_geometry:
+        columns.append(layer_info.geometry_column)
+
+    return sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+
+def build_relation(layer_info: LayerInfo, properties: Optional[list[str]] = None, skip_geometry: bool = False) -> sql.Composable:
+    """The table, or a subquery of the table with only the selected columns (see `build_columns`)."""
+
+    table = sql.Identifier(layer_info.schema, layer_info.table)
+    if properties is None:
+        return table
+
+    return sql.SQL("(SELECT {columns} FROM {table})").format(columns=build_columns(layer_info, properties, skip_geometry), table=table)
+
+def build_materialized_join(layer_info: LayerInfo, t_srid: int, relation: str, skip_geometry: bool = False) -> sql.Composable:
+    """The LEFT JOIN of the materialized view with the geometries in the target SRID, if there is one (see materialized_geometry)."""
+
+    if skip_geometry or t_srid == layer_info.srid or t_srid not in layer_info.materialized_srids:
+        return sql.SQL("")
+
+    return sql.SQL(" LEFT JOIN {view} AS {alias} ON {alias}.{view_fid} = {relation}.{fid}").format(
+        view=sql.Identifier(layer_info.schema, materialized_geometry.get_view_name(layer_info.table, t_srid)),
+        alias=sql.Identifier(materialized_geometry.VIEW_ALIAS),
+        view_fid=sql.Identifier(materialized_geometry.VIEW_FID_COLUMN),
+        relation=sql.Identifier(relation),
+        fid=sql.Identifier(layer_info.fid_column),
+    )
+
+def build_feature_object(layer_info: LayerInfo, t_srid: int, swap_axes: bool, relation: str, skip_geometry: bool = False, precision: Optional[int] = None) -> tuple[sql.Composable, list[Any]]:
+    """Build the json_build_object expression, which encodes a row of the relation as GeoJSON feature, and its parameters. \n
+    If the target SRID is materialized, the relation has to be joined with `build_materialized_join`.
+    The coordinates are written with the decimal places of precision. If it is None, they are written with the maximum precision like
+    the GDAL engine does, instead of the default of ST_AsGeoJSON (9).
+    """
+
+    if skip_geometry:
+        feature_object = sql.SQL("json_build_object('type', 'Feature', 'id', {relation}.{fid}, 'geometry', NULL, 'properties', to_jsonb({relation}.*) - %s::text - %s::text)").format(
+            relation=sql.Identifier(relation),
+            fid=sql.Identifier(layer_info.fid_column),
+        )
+        return feature_object, [layer_info.fid_column, layer_info.geometry_column]
+
+    geometry = sql.SQL("{relation}.{geom}").format(relation=sql.Identifier(relation), geom=sql.Identifier(layer_info.geometry_column))
+    params = []
+    if t_srid != layer_info.srid:
+        geometry = sql.SQL("ST_Transform({geometry}, %s::integer)").format(geometry=geometry)
+        params.append(t_srid)
+        if t_srid in layer_info.materialized_srids:
+            # Features inserted after the last refresh of the view are transformed on the fly
+            geometry = sql.SQL("COALESCE({alias}.{view_geom}, {geometry})").format(
+                alias=sql.Identifier(materialized_geometry.VIEW_ALIAS),
+                view_geom=sql.Identifier(materialized_geometry.VIEW_GEOMETRY_COLUMN),
+                geometry=geometry,
+            )
+    if swap_axes:
+        geometry = sql.SQL("ST_FlipCoordinates({geometry})").format(geometry=geometry)
+
+    geometry = sql.SQL("{geometry}, %s::integer").format(geometry=geometry)
+    params.append(precision if precision is not None else ogc_api_config.params.COORDINATE_PRECISION_MAXIMUM)
+
+    feature_object = sql.SQL("json_build_object('type', 'Feature', 'id', {relation}.{fid}, 'geometry', ST_AsGeoJSON({geometry})::json, 'properties', to_jsonb({relation}.*) - %s::text - %s::text)").format(
+        relation=sql.Identifier(relation),
+        fid=sql.Identifier(layer_info.fid_column),
+        geometry=geometry,
+    )
+    params.extend([layer_info.fid_column, layer_info.geometry_column])
+
+    return feature_object, params
+
+async def get_feature_by_id(
+    dataset: models.Dataset,
+    layer_name: str,
+    feature_id: int,
+    t_srs_res: str,
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+    collection_id: Optional[str] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+    precision: Optional[int] = None,
+) -> bytes:
+    """Get a single feature of a PostGIS table, encoded as GeoJSON by the database.
+
+    Args:
+        dataset (models.Dataset): The PostgreSQL dataset of the collection.
+        layer_name (str): The name of the layer (schema.table).
+        feature_id (int): The id of the feature.
+        t_srs_res (str): The target spatial reference system as URI or URN.
+        layer_metadata (Optional[collection_impl.LayerMetadata]): The layer metadata stored with the collection.
+        collection_id (Optional[str]): The id of the collection, under which the encoded feature is cached. If None, the feature cache isn't used.
+        properties (Optional[list[str]]): The properties of the feature. If None, all properties are returned.
+        skip_geometry (bool): Whether the geometry is omitted (null).
+        precision (Optional[int]): The number of decimal places of the coordinates. None keeps the full precision.
+
+    Raises:
+        ValueError: If the feature with given id is not found, a property is unknown or the target spatial reference system is invalid.
+        RuntimeError: If the layer has no geometry column or primary key.
+        psycopg_pool.PoolTimeout: If no connection of the pool became available in time.
+
+    Returns:
+        bytes: The GeoJSON feature.
+    """
+
+    try:
+        t_srid, swap_axes = postgis_query.get_srid_from_ressource(t_srs_res)
+    except ValueError as error:
+        raise ValueError(f"Invalid target spatial reference system: {error}") from error
+
+    pool = await pg_pool.get_pool(dataset)
+    async with pool.connection() as connection:
+        layer_info = await get_layer_info(connection, dataset.path, layer_name, layer_metadata)
+
+        # The feature cache only holds complete features
+        if collection_id is not None and feature_impl.FEATURE_FRAGMENT_CACHE.enabled and properties is None and not skip_geometry:
+            fragments = await get_fragments(connection, layer_info, t_srid, swap_axes, [feature_id], collection_id, t_srs_res, precision)
+            if feature_id not in fragments:
+                raise ValueError(f"Feature with id '{feature_id}' not found in layer '{layer_name}'")
+            return fragments[feature_id]
+
+        feature_object, params = build_feature_object(layer_info, t_srid, swap_axes, "feature", skip_geometry, precision)
+        statement = sql.SQL("SELECT {feature_object}::text FROM {relation} AS feature{join} WHERE feature.{fid} = %s").format(
+            feature_object=feature_object,
+            relation=build_relation(layer_info, properties, skip_geometry),
+            join=build_materialized_join(layer_info, t_srid, "feature", skip_geometry),
+            fid=sql.Identifier(layer_info.fid_column),
+        )
+        params.append(feature_id)
+
+        try:
+            async with connection.cursor() as cursor:
+                await cursor.execute(statement, params)
+                row = await cursor.fetchone()
+        except psycopg.errors.UndefinedColumn as error:
+            raise ValueError(f"Unknown properties: {error.diag.message_primary}") from error
+
+    if row is None:
+        raise ValueError(f"Feature with id '{feature_id}' not found in layer '{layer_name}'")
+
+    return row[0].encode("utf-8")
+
+async def get_fragments(
+    connection: psycopg.AsyncConnection,
+    layer_info: LayerInfo,
+    t_srid: int,
+    swap_axes: bool,
+    fids: list[Any],
+    collection_id: str,
+    t_srs_res: str,
+    precision: Optional[int] = None,
+) -> dict[Any, bytes]:
+    """Get the encoded features of the FIDs from the feature cache, the missing features are encoded by PostGIS and cached."""
+
+    fragment_cache = feature_impl.FEATURE_FRAGMENT_CACHE
+    # Read before the query, so features of an invalidated version are stored under that version
+    version = fragment_cache.get_version(collection_id)
+    fragments = fragment_cache.get_many(collection_id, version, t_srs_res, fids, precision)
+
+    missing_fids = [fid for fid in fids if fid not in fragments]
+    if missing_fids:
+        feature_object, params = build_feature_object(layer_info, t_srid, swap_axes, "feature", precision=precision)
+        statement = sql.SQL("SELECT feature.{fid}, {feature_object}::text FROM {table} AS feature{join} WHERE feature.{fid} = ANY(%s)").format(
+            fid=sql.Identifier(layer_info.fid_column),
+            feature_object=feature_object,
+            table=sql.Identifier(layer_info.schema, layer_info.table),
+            join=build_materialized_join(layer_info, t_srid, "feature"),
+        )
+        params.append(missing_fids)
+
+        async with connection.cursor() as cursor:
+            await cursor.execute(statement, params, prepare=True)
+            queried = {fid: feature.encode("utf-8") for fid, feature in await cursor.fetchall()}
+
+        fragment_cache.set_many(collection_id, version, t_srs_res, queried, precision)
+        fragments.update(queried)
+
+    return fragments
+
+async def get_page_from_fragments(
+    connection: psycopg.AsyncConnection,
+    layer_info: LayerInfo,
+    t_srid: int,
+    swap_axes: bool,
+    page_query: sql.Composable,
+    page_params: list[Any],
+    limit: int,
+    collection_id: str,
+    t_srs_res: str,
+    precision: Optional[int] = None,
+) -> tuple[int, Optional[Any], bytes]:
+    """Select only the FIDs of the page and assemble the page from the encoded features of the feature cache.
+
+    Returns:
+        int: The number of selected rows (including the additional feature, which indicates a next page).
+        Optional[Any]: The FID of the last returned feature.
+        bytes: The comma separated GeoJSON features of the page.
+    """
+
+    fid_query = sql.SQL("SELECT page.{fid} FROM ({page_query}) AS page ORDER BY page.{fid}").format(fid=sql.Identifier(layer_info.fid_column), page_query=page_query)
+    async with connection.cursor() as cursor:
+        await cursor.execute(fid_query, page_params, prepare=True)
+        fids = [row[0] for row in await cursor.fetchall()]
+
+    page_fids = fids[:limit]
+    fragments = await get_fragments(connection, layer_info, t_srid, swap_axes, page_fids, collection_id, t_srs_res, precision)
+
+    # Features deleted between both queries are left out
+    features = b",".join(fragments[fid] for fid in page_fids if fid in fragments)
+    return len(fids), page_fids[-1] if page_fids else None, features
+
+async def get_features(
+    dataset: models.Dataset,
+    layer_name: str,
+    bbox: Optional[list[float]],
+    bbox_srs_res: Optional[str],
+    datetime_interval: Optional[tuple[Optional[datetime.datetime], Optional[datetime.datetime]]],
+    datetime_field: Optional[str],
+    t_srs_res: str,
+    limit: int,
+    offset: int,
+    after_fid: Optional[int] = None,
+    number_matched: ogc_api_config.params.NumberMatched = ogc_api_config.params.NumberMatched.exact,
+    count_cache_key: Optional[tuple] = None,
+    layer_metadata: Optional[collection_impl.LayerMetadata] = None,
+    collection_id: Optional[str] = None,
+    properties: Optional[list[str]] = None,
+    skip_geometry: bool = False,
+    precision: Optional[int] = None,
+) -> tuple[bytes, Optional[int], int, bool, Optional[int]]:
+    """Get a page of features of a PostGIS table, encoded as GeoJSON by the database.
+
+    Args:
+        dataset (models.Dataset): The PostgreSQL dataset of the collection.
+        collection_id (Optional[str]): The id of the collection, under which the encoded features are cached. If None, the feature cache isn't used.
+        Other arguments are the same as in `feature.get_features`.
+
+    Raises:
+        ValueError: Provided parameters are invalid
+        RuntimeError: If the layer has no geometry column or primary key.
+        psycopg_pool.PoolTimeout: If no connection of the pool became available in time.
+
+    Returns:
+        bytes: The comma separated GeoJSON features of the page (the content of the features array).
+        Optional[int]: The (estimated) total number of features with given filters. None if omitted.
+        int: The returned number of features.
+        bool: Whether there is a next page of features.
+        Optional[int]: The id of the last returned feature.
+    """
+
+    try:
+        t_srid, swap_axes = postgis_query.get_srid_from_ressource(t_srs_res)
+    except ValueError as error:
+        raise ValueError(f"Invalid target spatial reference system: {error}") from error
+
+    pool = await pg_pool.get_pool(dataset)
+    async with pool.connection() as connection:
+        layer_info = await get_layer_info(connection, dataset.path, layer_name, layer_metadata)
+        where_filter = build_where_clause(layer_info, bbox, bbox_srs_res, datetime_interval, datetime_field)
+
+        matched_feature_count, count_is_exact = await get_matched_feature_count(connection, layer_info, where_filter, number_matched, count_cache_key)
+        if count_is_exact and offset >= matched_feature_count and matched_feature_count > 0:
+            raise ValueError(f"Offset is greater than or equal to the number of features in the layer/extent")
+
+        fid_col = sql.Identifier(layer_info.fid_column)
+
+        page_filter = where_filter
+        # Keyset pagination: Continue after the last FID of the previous page, instead of skipping offset rows
+        if after_fid is not None:
+            page_filter = page_filter.add(postgis_query.quote_identifier(layer_info.fid_column) + " > %s", int(after_fid))
+
+        # Without an exact count, one additional feature is queried to know whether there is a next page
+        page_params = page_filter.params + [limit if count_is_exact else limit + 1]
+        # Only the requested columns are read, the geometry isn't encoded, if it is skipped
+        page_query = sql.SQL("SELECT {columns} FROM {table}").format(columns=build_columns(layer_info, properties, skip_geometry), table=sql.Identifier(layer_info.schema, layer_info.table)) + sql.SQL(page_filter.where) + sql.SQL(" ORDER BY {fid} LIMIT %s").format(fid=fid_col)
+        if after_fid is None:
+            page_query += sql.SQL(" OFFSET %s")
+            page_params.append(offset)
+
+        if collection_id is not None and feature_impl.FEATURE_FRAGMENT_CACHE.enabled and properties is None and not skip_geometry:
+            page_feature_count, last_fid, features = await get_page_from_fragments(connection, layer_info, t_srid, swap_axes, page_query, page_params, limit, collection_id, t_srs_res, precision)
+        else:
+            feature_object, feature_params = build_feature_object(layer_info, t_srid, swap_axes, "page", skip_geometry, precision)
+            statement = sql.SQL("""WITH page AS ({page_query}), features AS (
+                    SELECT page.{fid} AS fid, row_number() OVER (ORDER BY page.{fid}) AS page_row, {feature_object} AS feature
+                    FROM page{join}
+                )
+                SELECT count(*), max(fid) FILTER (WHERE page_row <= %s), coalesce(string_agg(feature::text, ',' ORDER BY fid) FILTER (WHERE page_row <= %s), '') FROM features""").format(
+                page_query=page_query,
+                fid=fid_col,
+                feature_object=feature_object,
+                join=build_materialized_join(layer_info, t_srid, "page", skip_geometry),
+            )
+            params = page_params + feature_params + [limit, limit]
+
+            try:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(statement, params, prepare=True)
+                    page_feature_count, last_fid, features = await cursor.fetchone()
+            except psycopg.errors.UndefinedColumn as error:
+                raise ValueError(f"Unknown properties: {error.diag.message_primary}") from error
+            features = features.encode("utf-8")
+
+    if not count_is_exact and page_feature_count == 0 and offset > 0:
+        # The offset check above needs an exact count, so an empty page is detected here instead
+        raise ValueError(f"Offset is greater than or equal to the number of features in the layer/extent")
+
+    returned_feature_count = min(page_feature_count, limit)
+    if count_is_exact:
+        has_next_page = offset + returned_feature_count < matched_feature_count
+    else:
+        has_next_page = page_feature_count > limit
+
+    return features, matched_feature_count, returned_feature_count, has_next_page, last_fid
@@ -0,0 +1,205 @@
+import hashlib
+import math
+import os
+from typing import Iterable, Optional
+from uuid import UUID
+
+from osgeo import gdal, ogr, osr
+
+from server.database import models
+from server.ogc_apis.features.implementation.dynamic import collection as collection_impl, postgis_query
+
+# Pre-generalized copies of the layers of collections for overview requests (see CollectionTable.generalization_json).
+# Every level is a scale denominator, its copy has the geometries simplified with a tolerance of one pixel at that scale.
+# PostgreSQL layers are copied into side tables next to the table (ST_SimplifyPreserveTopology), the layers of file datasets
+# into a GeoPackage per collection (SimplifyPreserveTopology of OGR). The FIDs are kept, so cursors and feature ids stay valid.
+# Items requests with a scale denominator or zoom level read the copy of the coarsest level, which is still fine enough.
+
+# Size of a pixel in metres, as defined by OGC for scale denominators (0.28 mm)
+PIXEL_SIZE = 0.00028
+# Metres per degree at the equator, as used by OGC tile matrix sets for geographic CRSs
+METRES_PER_DEGREE = 6378137 * 2 * math.pi / 360
+# Scale denominator of zoom level 0 of the WebMercatorQuad tile matrix set, every zoom level halves it
+ZOOM_LEVEL_0_SCALE_DENOMINATOR = 559082264.0287178
+MAX_LEVELS = 10
+
+# PostgreSQL truncates identifiers after 63 bytes
+_MAX_TABLE_NAME_LENGTH = 63
+
+def get_scale_denominator(scale_denominator: Optional[float], zoom_level: Optional[int]) -> Optional[float]:
+    """The scale denominator of a request, given directly or as zoom level of WebMercatorQuad. None requests the full resolution.
+
+    Raises:
+        ValueError: If both are given.
+    """
+
+    if scale_denominator is not None and zoom_level is not None:
+        raise ValueError("Only one of the parameters 'scale-denominator' and 'zoom-level' can be given")
+
+    if zoom_level is not None:
+        return ZOOM_LEVEL_0_SCALE_DENOMINATOR / 2 ** zoom_level
+
+    return scale_denominator
+
+def select_level(levels: Optional[Iterable[float]], scale_denominator: Optional[float]) -> Optional[float]:
+    """The coarsest level, which is generalized for a scale at least as large as the requested one. None, if the full resolution is needed."""
+
+    if scale_denominator is None:
+        return None
+
+    suitable_levels = [level for level in levels or () if level <= scale_denominator]
+    return max(suitable_levels) if suitable_levels else None
+
+def parse_levels(levels: Optional[Iterable]) -> list[float]:
+    """Validate the levels of a collection and return them as sorted, distinct scale denominators.
+
+    Raises:
+        ValueError: If a level is no positive number or there are too many levels.
+    """
+
+    parsed_levels = set()
+    for level in levels or ():
+        try:
+            scale_denominator = float(level)
+        except (TypeError, ValueError):
+            raise ValueError(f"Generalization level '{level}' is no scale denominator")
+        if not math.isfinite(scale_denominator) or scale_denominator < 1:
+            raise ValueError(f"Generalization level '{level}' must be a scale denominator of at least 1")
+        parsed_levels.add(float(round(scale_denominator)))
+
+    if len(parsed_levels) > MAX_LEVELS:
+        raise ValueError(f"A collection can't have more than {MAX_LEVELS} generalization levels")
+
+    return sorted(parsed_levels)
+
+def get_tolerance(spatial_ref: Optional[osr.SpatialReference], scale_denominator: float) -> float:
+    """Simplification tolerance of a level in the units of the storage CRS: The size of a pixel at the scale"""
+
+    pixel_size = scale_denominator * PIXEL_SIZE
+    if spatial_ref is None:
+        return pixel_size
+
+    if spatial_ref.IsGeographic():
+        return pixel_size / METRES_PER_DEGREE
+
+    return pixel_size / (spatial_ref.GetLinearUnits() or 1)
+
+def get_table_name(table: str, scale_denominator: float) -> str:
+    """Name of the side table of a PostgreSQL table for a level, in the schema of the table"""
+
+    suffix = f"_gen_{int(scale_denominator)}"
+    if len(table.encode("utf-8")) + len(suffix) <= _MAX_TABLE_NAME_LENGTH:
+        return table + suffix
+
+    # The hash keeps the names of long tables with the same prefix apart
+    digest = hashlib.blake2b(table.encode("utf-8"), digest_size=4).hexdigest()
+    prefix = table.encode("utf-8")[:_MAX_TABLE_NAME_LENGTH - len(f"_{digest}{suffix}")].decode("utf-8", errors="ignore")
+    return f"{prefix}_{digest}{suffix}"
+
+def get_file_path(collection_uuid: UUID) -> str:
+    """Path of the GeoPackage with the generalized layers of a collection of a file dataset (in APP_GENERALIZATION_DIR, default: in the database directory)"""
+
+    directory = os.getenv("APP_GENERALIZATION_DIR") or os.path.join(os.getenv("APP_DATABASE_DIR", os.path.abspath("./data")), "generalized")
+    return os.path.join(directory, f"{UUID(str(collection_uuid)).hex}.gpkg")
+
+def get_layer_name(layer_name: str, dataset_type: models.Dataset.Type, scale_denominator: float) -> str:
+    """Name of the generalized layer of a level: The side table (schema.table) or the layer in the GeoPackage of the collection"""
+
+    if dataset_type == models.Dataset.Type.DB:
+        schema, table = layer_name.split(".", 1)
+        return f"{schema}.{get_table_name(table, scale_denominator)}"
+
+    return f"level_{int(scale_denominator)}"
+
+def get_layer_metadata(layer_metadata: Optional[collection_impl.LayerMetadata], dataset_type: models.Dataset.Type) -> Optional[collection_impl.LayerMetadata]:
+    """Layer metadata of a generalized layer. Side tables have the columns of the table, but no materialized views.
+    The layers of the GeoPackages are resolved from the layer, since the FID column is the one of the GeoPackage.
+    """
+
+    if layer_metadata is None or dataset_type != models.Dataset.Type.DB:
+        return None
+
+    return collection_impl.LayerMetadata(layer_metadata.fid_column, layer_metadata.geometry_column, layer_metadata.srid, layer_metadata.is_3D, layer_metadata.fields)
+
+def build_table_statements(schema: str, table: str, fid_col: str, geom_col: str, scale_denominator: float, tolerance: float) -> list[str]:
+    """Statements (re)creating the side table of a PostgreSQL table for a level, with the same primary key and a GiST index"""
+
+    source = f"{postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(table)}"
+    side_table = f"{postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(get_table_name(table, scale_denominator))}"
+    geom = postgis_query.quote_identifier(geom_col)
+    return [
+        f"DROP TABLE IF EXISTS {side_table}",
+        # The column types (including the type and SRID of the geometry column) are kept by CREATE TABLE AS
+        f"CREATE TABLE {side_table} AS SELECT * FROM {source}",
+        f"UPDATE {side_table} SET {geom} = ST_SimplifyPreserveTopology({geom}, {float(tolerance)!r}) WHERE {geom} IS NOT NULL",
+        f"ALTER TABLE {side_table} ADD PRIMARY KEY ({postgis_query.quote_identifier(fid_col)})",
+        f"CREATE INDEX ON {side_table} USING GIST ({geom})",
+        f"ANALYZE {side_table}",
+    ]
+
+def build_level(dataset_path: str, dataset_type: models.Dataset.Type, layer_name: str, collection_uuid: UUID, scale_denominator: float) -> None:
+    """Build (or rebuild) the generalized layer of a level. This reads and writes the whole layer, so it runs in a background job.
+
+    Raises:
+        RuntimeError: If the layer isn't found, has no FID column (PostgreSQL) or GDAL fails.
+    """
+
+    with gdal.OpenEx(dataset_path, gdal.OF_VECTOR) as dataset:
+        layer: ogr.Layer = dataset.GetLayerByName(layer_name)
+        if layer is None:
+            raise RuntimeError(f"Layer '{layer_name}' not found in dataset '{dataset.GetDescription()}'")
+
+        tolerance = get_tolerance(layer.GetSpatialRef(), scale_denominator)
+
+        if dataset_type == models.Dataset.Type.DB:
+            fid_col, geom_col = layer.GetFIDColumn(), layer.GetGeometryColumn()
+            if not fid_col or not geom_col:
+                raise RuntimeError(f"Layer '{layer_name}' needs a FID and a geometry column to be generalized")
+
+            schema, table = layer_name.split(".", 1)
+            for statement in build_table_statements(schema, table, fid_col, geom_col, scale_denominator, tolerance):
+                dataset.ExecuteSQL(statement)
+            return
+
+        file_path = get_file_path(collection_uuid)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        options = gdal.VectorTranslateOptions(
+            format="GPKG",
+            accessMode="overwrite" if os.path.exists(file_path) else None,
+            layers=[layer_name],
+            layerName=get_layer_name(layer_name, dataset_type, scale_denominator),
+            # ogr2ogr simplifies with OGR_G_SimplifyPreserveTopology
+            simplifyTolerance=tolerance,
+            preserveFID=True,
+        )
+        gdal.VectorTranslate(file_path, dataset, options=options)
+
+def drop_levels(dataset_path: str, dataset_type: models.Dataset.Type, layer_name: str, collection_uuid: UUID, scale_denominators: Iterable[float]) -> None:
+    """Drop the generalized layers of levels, e.g. after they were removed in the web admin or the collection was deleted"""
+
+    scale_denominators = list(scale_denominators)
+    if not scale_denominators:
+        return
+
+    if dataset_type == models.Dataset.Type.DB:
+        schema, table = layer_name.split(".", 1)
+        with gdal.OpenEx(dataset_path, gdal.OF_VECTOR) as dataset:
+            for scale_denominator in scale_denominators:
+                dataset.ExecuteSQL(f"DROP TABLE IF EXISTS {postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(get_table_name(table, scale_denominator))}")
+        return
+
+    file_path = get_file_path(collection_uuid)
+    if not os.path.exists(file_path):
+        return
+
+    with gdal.OpenEx(file_path, gdal.OF_VECTOR | gdal.OF_UPDATE) as dataset:
+        for scale_denominator in scale_denominators:
+            level_layer_name = get_layer_name(layer_name, dataset_type, scale_denominator)
+            for index in range(dataset.GetLayerCount()):
+                if dataset.GetLayerByIndex(index).GetName() == level_layer_name:
+                    dataset.DeleteLayer(index)
+                    break
+        is_empty = dataset.GetLayerCount() == 0
+
+    if is_empty:
+        os.remove(file_path)
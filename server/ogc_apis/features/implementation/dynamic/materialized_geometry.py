@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Any, Callable, Iterable, Optional
+
+import psycopg
+from psycopg import sql
+from osgeo import gdal
+
+from server.database import models, pg_pool
+from server.ogc_apis.features.implementation.dynamic import postgis_query
+
+# Reprojected geometries of PostGIS collections for the CRSs, which are requested most (see CollectionTable.materialized_crs_json).
+# Every CRS gets a materialized view with the FID and the transformed geometry, a unique index on the FID and a GiST index on the geometry.
+# The page queries join the view by FID instead of calling ST_Transform for every feature. Features inserted after the last refresh
+# are not in the view yet and are still transformed on the fly, changed geometries are served from the view until its next refresh.
+# The views are built in the background by the web admin, the page queries only join the views of CRSs in materialized_crs_ready_json.
+
+_LOGGER = logging.getLogger("server.api")
+
+# Seconds between two refreshes of all materialized views (0 disables the background refresh)
+REFRESH_INTERVAL = float(os.getenv("APP_MATERIALIZED_GEOMETRY_REFRESH_INTERVAL", "3600"))
+
+# Column names of the views, which don't collide with the columns of the table, so the filters of the page queries stay unqualified
+VIEW_FID_COLUMN = "mapsage_fid"
+VIEW_GEOMETRY_COLUMN = "mapsage_geometry"
+VIEW_ALIAS = "materialized"
+
+# PostgreSQL truncates identifiers after 63 bytes, the names of the indexes append up to 5 bytes to the name of the view
+_MAX_VIEW_NAME_LENGTH = 63 - len("_gist")
+
+def get_view_name(table: str, srid: int) -> str:
+    """Name of the materialized view of a table for a SRID, in the schema of the table"""
+
+    name = f"{table}_geom_{srid}"
+    if len(name.encode("utf-8")) <= _MAX_VIEW_NAME_LENGTH:
+        return name
+
+    # The hash keeps the names of long tables with the same prefix apart
+    digest = hashlib.blake2b(table.encode("utf-8"), digest_size=4).hexdigest()
+    prefix = table.encode("utf-8")[:_MAX_VIEW_NAME_LENGTH - len(f"_{digest}_geom_{srid}")].decode("utf-8", errors="ignore")
+    return f"{prefix}_{digest}_geom_{srid}"
+
+def get_materialized_srids(materialized_crs: Optional[Iterable[str]]) -> frozenset[int]:
+    """SRIDs of the materialized CRSs of a collection. CRSs without SRID are ignored (they are rejected, when the option is saved)."""
+
+    srids = set()
+    for crs in materialized_crs or ():
+        try:
+            srids.add(postgis_query.get_srid_from_ressource(crs)[0])
+        except ValueError:
+            continue
+
+    return frozenset(srids)
+
+def build_create_statements(schema: str, table: str, fid_col: str, geom_col: str, srid: int) -> list[str]:
+    """Statements creating (and populating) the materialized view of a table for a SRID and its indexes"""
+
+    view_name = get_view_name(table, srid)
+    qualified_view = f"{postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(view_name)}"
+    return [
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {qualified_view} AS "
+        f"SELECT {postgis_query.quote_identifier(fid_col)} AS {VIEW_FID_COLUMN}, ST_Transform({postgis_query.quote_identifier(geom_col)}, {int(srid)}) AS {VIEW_GEOMETRY_COLUMN} "
+        f"FROM {postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(table)}",
+        # The unique index is required by REFRESH MATERIALIZED VIEW CONCURRENTLY and serves the join of the page queries
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {postgis_query.quote_identifier(view_name + '_fid')} ON {qualified_view} ({VIEW_FID_COLUMN})",
+        f"CREATE INDEX IF NOT EXISTS {postgis_query.quote_identifier(view_name + '_gist')} ON {qualified_view} USING GIST ({VIEW_GEOMETRY_COLUMN})",
+    ]
+
+def build_drop_statement(schema: str, table: str, srid: int) -> str:
+    return f"DROP MATERIALIZED VIEW IF EXISTS {postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(get_view_name(table, srid))}"
+
+def build_join(schema: str, table: str, fid_col: str, srid: int, relation: Optional[str] = None) -> str:
+    """LEFT JOIN of the materialized view to the table (or the relation it is selected as), for statements executed by GDAL"""
+
+    relation = postgis_query.quote_identifier(relation) if relation is not None else f"{postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(table)}"
+    view = f"{postgis_query.quote_identifier(schema)}.{postgis_query.quote_identifier(get_view_name(table, srid))}"
+    return f" LEFT JOIN {view} AS {VIEW_ALIAS} ON {VIEW_ALIAS}.{VIEW_FID_COLUMN} = {relation}.{postgis_query.quote_identifier(fid_col)}"
+
+def build_geometry_expression(geom_col: str, srid: int, relation: Optional[str] = None) -> str:
+    """The transformed geometry: From the view, or transformed on the fly for features inserted after the last refresh"""
+
+    column = postgis_query.quote_identifier(geom_col)
+    if relation is not None:
+        column = f"{postgis_query.quote_identifier(relation)}.{column}"
+
+    return f"COALESCE({VIEW_ALIAS}.{VIEW_GEOMETRY_COLUMN}, ST_Transform({column}, {int(srid)}))"
+
+def apply_views(dataset: gdal.Dataset, layer_name: str, fid_col: str, geom_col: str, srids: Iterable[int], previous_srids: Iterable[int] = ()) -> None:
+    """Create the views of added SRIDs and drop the views of removed SRIDs (e.g. after the option was changed in the web admin).
+
+    Args:
+        dataset (gdal.Dataset): The PostgreSQL dataset of the layer.
+        layer_name (str): The name of the layer (schema.table).
+        fid_col (str): The FID column of the table.
+        geom_col (str): The geometry column of the table.
+        srids (Iterable[int]): The SRIDs, which are materialized from now on.
+        previous_srids (Iterable[int]): The SRIDs, which were materialized before.
+    """
+
+    schema, table = layer_name.split(".", 1)
+    srids = set(srids)
+    for srid in set(previous_srids) - srids:
+        dataset.ExecuteSQL(build_drop_statement(schema, table, srid))
+
+    for srid in srids:
+        for statement in build_create_statements(schema, table, fid_col, geom_col, srid):
+            dataset.ExecuteSQL(statement)
+
+async def refresh_views(collections: Iterable[Any]) -> int:
+    """Refresh the materialized views of the collections once. Every process runs the refresh, a view which is already refreshed by another one is skipped.
+
+    Args:
+        collections (Iterable[Any]): The collections (e.g. the snapshots of the collection registry).
+
+    Returns:
+        int: The number of refreshed views.
+    """
+
+    refreshed_views = 0
+    for collection in collections:
+        # Views, which are still built by the web admin, are skipped
+        if collection.dataset.type != models.Dataset.Type.DB or not collection.materialized_crs_ready_json:
+            continue
+
+        schema, table = collection.layer_name.split(".", 1)
+        for srid in get_materialized_srids(collection.materialized_crs_ready_json):
+            view_name = f"{schema}.{get_view_name(table, srid)}"
+            try:
+                pool = await pg_pool.get_pool(collection.dataset)
+                async with pool.connection() as connection:
+                    cursor = await connection.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (view_name,))
+                    locked, = await cursor.fetchone()
+                    if not locked:
+                        continue
+
+                    try:
+                        # Concurrently, so the page queries can still read the view while it is refreshed
+                        await connection.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {view}").format(view=sql.Identifier(schema, get_view_name(table, srid))))
+                    finally:
+                        await connection.execute("SELECT pg_advisory_unlock(hashtext(%s))", (view_name,))
+
+                refreshed_views += 1
+            except (psycopg.Error, OSError) as error:
+                _LOGGER.warning(msg=f"Materialized view '{view_name}' of collection '{collection.id}' could not be refreshed: {error}")
+
+    return refreshed_views
+
+async def run_refresh_loop(get_collections: Callable[[], Iterable[Any]], interval: float = REFRESH_INTERVAL) -> None:
+    """Refresh the materialized views of the current collections every interval seconds, until the task is cancelled"""
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            refreshed_views = await refresh_views(get_collections())
+            if refreshed_views > 0:
+                _LOGGER.info(msg=f"Refreshed {refreshed_views} materialized geometry views")
+        except Exception as error:
+            _LOGGER.error(msg=f"Refreshing the materialized geometry views failed: {error}", exc_info=True)
+
+def start_refresh_task(get_collections: Callable[[], Iterable[Any]]) -> Optional[asyncio.Task]:
+    """Start the background refresh in the running event loop. None, if it is disabled."""
+
+    if REFRESH_INTERVAL <= 0:
+        return None
+
+    return asyncio.get_running_loop().create_task(run_refresh_loop(get_collections), name="materialized-geometry-refresh")
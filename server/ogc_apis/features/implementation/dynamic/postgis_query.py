@@ -0,0 +1,214 @@
+import datetime
+import functools
+import re
+from typing import Any, Optional
+
+import pyproj
+
+# Compiler for the WHERE clauses of PostGIS items and count queries.
+# The clauses only contain %s placeholders, so the statement text of a collection doesn't change with the filter values
+# and PostgreSQL can reuse the plan of a prepared statement. The native engine binds the parameters,
+# GDAL can't bind parameters, so its statements get the parameters rendered as quoted literals.
+
+@functools.lru_cache(maxsize=256)
+def get_srid_from_ressource(ressource: str) -> tuple[int, bool]:
+    """Get the PostGIS SRID of a coordinate reference system URI or URN.
+
+    Args:
+        ressource (str): The coordinate reference system as URI or URN.
+
+    Raises:
+        ValueError: If the coordinate reference system has no SRID in PostGIS.
+
+    Returns:
+        int: The SRID.
+        bool: Whether the first axis of the coordinate reference system is northing/latitude, so the coordinates of PostGIS (always easting first) have to be swapped.
+    """
+
+    if ressource is None:
+        raise ValueError("Resource is None")
+
+    matches = re.findall(r"http://www.opengis.net/def/crs/(\w+)/[\d.]+/(.+)", ressource) or re.findall(r"urn:ogc:def:crs:(\w+):[\d.]*:(.+)", ressource)
+    if len(matches) == 0:
+        raise ValueError("Resource must be a valid URI or URN")
+    authority, code = matches[0]
+
+    try:
+        crs = pyproj.CRS.from_authority(authority, code)
+    except pyproj.exceptions.CRSError as error:
+        raise ValueError(f"Unknown coordinate reference system '{ressource}'") from error
+
+    # CRS84 is EPSG:4326 with longitude first, which is the axis order PostGIS uses anyway
+    if authority == "OGC" and code == "CRS84":
+        return 4326, False
+    if authority == "OGC" and code == "CRS84h":
+        return 4979, False
+    if authority != "EPSG":
+        raise ValueError(f"Coordinate reference system '{ressource}' has no SRID in PostGIS")
+
+    swap_axes = len(crs.axis_info) > 0 and crs.axis_info[0].direction in ("north", "south")
+    return int(code), swap_axes
+
+def supports_crs(ressource: Optional[str]) -> bool:
+    if ressource is None:
+        return True
+
+    try:
+        get_srid_from_ressource(ressource)
+    except ValueError:
+        return False
+
+    return True
+
+def quote_identifier(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+def quote_literal(value: Any) -> str:
+    """Render a parameter as SQL literal (for statements, which are executed by GDAL)."""
+
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+
+    return "'" + str(value).replace("'", "''") + "'"
+
+class CompiledFilter(object):
+    """The clauses of a WHERE clause with %s placeholders and their parameters in order of appearance"""
+
+    __slots__ = ("clauses", "params")
+
+    def __init__(self, clauses: Optional[list[str]] = None, params: Optional[list[Any]] = None):
+        self.clauses = clauses or []
+        self.params = params or []
+
+    def __bool__(self) -> bool:
+        return len(self.clauses) > 0
+
+    def add(self, clause: str, *params: Any) -> "CompiledFilter":
+        """Return a new filter with an additional clause (e.g. the keyset condition of the page query), so a compiled filter can be shared by the count and the page query."""
+
+        return CompiledFilter(self.clauses + [clause], self.params + list(params))
+
+    @property
+    def where(self) -> str:
+        """The WHERE clause (including the WHERE keyword) with placeholders or an empty string without clauses"""
+
+        if not self.clauses:
+            return ""
+
+        return " WHERE " + " AND ".join(f"({clause})" for clause in self.clauses)
+
+    def render(self) -> str:
+        """The WHERE clause with the parameters rendered as literals"""
+
+        parts = self.where.split("%s")
+        if len(parts) - 1 != len(self.params):
+            raise RuntimeError("Number of placeholders and parameters of the filter differ")
+
+        rendered = [parts[0]]
+        for param, part in zip(self.params, parts[1:]):
+            rendered.append(quote_literal(param))
+            rendered.append(part)
+
+        return "".join(rendered)
+
+def compile_datetime_filter(
+    compiled: CompiledFilter,
+    datetime_interval: Optional[tuple[Optional[datetime.datetime], Optional[datetime.datetime]]],
+    datetime_field: Optional[str],
+) -> CompiledFilter:
+    """Add the temporal filter. Features without datetime are always selected according to the OGC specification."""
+
+    if not datetime_interval or not datetime_field:
+        return compiled
+
+    col = quote_identifier(datetime_field)
+    start, end = datetime_interval
+    if start and end:
+        return compiled.add(f"({col} >= %s AND {col} <= %s) OR {col} IS NULL", start, end)
+    if start:
+        return compiled.add(f"{col} >= %s OR {col} IS NULL", start)
+    if end:
+        return compiled.add(f"{col} <= %s OR {col} IS NULL", end)
+
+    return compiled
+
+def compile_bbox_filter(
+    compiled: CompiledFilter,
+    geometry_column: str,
+    layer_srid: int,
+    bbox: Optional[list[float]],
+    bbox_srid: int,
+    swap_axes: bool,
+) -> CompiledFilter:
+    """Add the spatial filter of a bounding box, which is transformed to the layer SRID by PostGIS. \n
+    The `&&` operator on the envelope prefilters with the GiST index of the geometry column, before the exact intersection is tested.
+    Features without geometry are always selected according to the OGC specification.
+
+    Raises:
+        ValueError: If the bounding box doesn't consist of 4 or 6 values.
+    """
+
+    if bbox is None:
+        return compiled
+
+    geom = quote_identifier(geometry_column)
+    # Integer and float coordinates would be bound with different types and thus prepare different statements
+    bbox = [float(value) for value in bbox]
+    if len(bbox) == 4:
+        xmin, ymin, xmax, ymax = bbox
+        if swap_axes:
+            xmin, ymin, xmax, ymax = ymin, xmin, ymax, xmax
+
+        envelope = "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, %s::integer), %s::integer)"
+        envelope_params = [xmin, ymin, xmax, ymax, bbox_srid, layer_srid]
+        return compiled.add(f"({geom} && {envelope} AND ST_Intersects({geom}, {envelope})) OR {geom} IS NULL", *envelope_params, *envelope_params)
+
+    if len(bbox) == 6:
+        xmin, ymin, zmin, xmax, ymax, zmax = bbox
+        if swap_axes:
+            xmin, ymin, xmax, ymax = ymin, xmin, ymax, xmax
+
+        # The corners are transformed with their heights, so the height range is compared in the vertical reference of the layer
+        corners = [(xmin, ymin, zmin), (xmax, ymin, zmin), (xmax, ymax, zmax), (xmin, ymax, zmax), (xmin, ymin, zmin)]
+        points = ", ".join("ST_MakePoint(%s, %s, %s)" for _ in corners)
+        filter_geom = f"ST_Transform(ST_SetSRID(ST_MakePolygon(ST_MakeLine(ARRAY[{points}])), %s::integer), %s::integer)"
+        params = [value for corner in corners for value in corner] + [bbox_srid, layer_srid]
+        return compiled.add(
+            f"EXISTS (SELECT 1 FROM (SELECT {filter_geom} AS filter_geom) f WHERE {geom} && f.filter_geom AND ST_Intersects({geom}, f.filter_geom) AND ST_ZMin({geom}) <= ST_ZMax(f.filter_geom) AND ST_ZMax({geom}) >= ST_ZMin(f.filter_geom)) OR {geom} IS NULL",
+            *params,
+        )
+
+    raise ValueError("Input for parameter 'bbox' of type 'query' is invalid. Input should consist of 4 or 6 values")
+
+def compile_geometry_filter(
+    compiled: CompiledFilter,
+    geometry_column: str,
+    layer_srid: int,
+    filter_wkt: Optional[str],
+    z_range: Optional[tuple[float, float]] = None,
+) -> CompiledFilter:
+    """Add the spatial filter of a geometry, which is already in the spatial reference system of the layer (WKT). \n
+    Like `compile_bbox_filter`, the envelope is compared with `&&` first and features without geometry are always selected.
+    """
+
+    if filter_wkt is None:
+        return compiled
+
+    geom = quote_identifier(geometry_column)
+    filter_geom = "ST_GeomFromText(%s, %s::integer)"
+    if z_range is None:
+        return compiled.add(f"({geom} && {filter_geom} AND ST_Intersects({geom}, {filter_geom})) OR {geom} IS NULL", filter_wkt, layer_srid, filter_wkt, layer_srid)
+
+    z_min, z_max = z_range
+    return compiled.add(
+        f"({geom} && {filter_geom} AND ST_Intersects({geom}, {filter_geom}) AND ST_ZMin({geom}) <= %s AND ST_ZMax({geom}) >= %s) OR {geom} IS NULL",
+        filter_wkt, layer_srid, filter_wkt, layer_srid, z_max, z_min,
+    )
@@ -1,6 +1,10 @@
 import mimetypes
 from server.ogc_apis import ogc_api_config
 
+# Pre-rendered documents contain this placeholder instead of the base URL, so they don't depend on the host of the request, which rendered them.
+# It is replaced with the base URL of each request, when the document is served (see http_utils.DocumentTemplate).
+BASE_URL_PLACEHOLDER = "urn:mapsage:base-url"
+
 def _get_key_values(obj: dict) -> tuple[str, str, str, str]:
     href = obj.get('url', None)
     if href is None:
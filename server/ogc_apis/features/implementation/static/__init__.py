@@ -1,3 +1,4 @@
 from . import landing_page
 from . import conformance
-from . import collections
\ No newline at end of file
+from . import collections
+from . import documents
\ No newline at end of file
@@ -1,64 +1,118 @@
-from server.database.db import Database, DatabaseSession
-from server.database.models import CollectionTable, PreRenderedJson
+from collections import Counter
+import threading
+from typing import Optional
+
+import orjson
+
 from server.ogc_apis.features.implementation import pre_render_helper
-from server.ogc_apis.features.models.collections import Collections
+from server.ogc_apis.features.implementation.dynamic import collection as collection_impl
 from server.ogc_apis import config
+from server.utils import cache_utils, http_utils
 
-def generate_object(collections_url: str) -> Collections:
-    link_self = {
-        "url": collections_url,
-        "rel": "self",
-        "title": "This document as {format_name}",
-    }
-    
-    links = pre_render_helper.generate_links([link_self], multiple_types=True)
-    
-    all_collections: list[CollectionTable] = Database.select_sqlite_db(CollectionTable, select_all=True)
-    if len(all_collections) == 0:
-        return Collections(links=links, collections=[])
-    
-    shared_crs = list(set.intersection(*map(set, [collection.crs_json for collection in all_collections])))
-    for collection in all_collections:
-        specific_crs = [crs for crs in collection.crs_json if crs not in shared_crs]
-        if len(shared_crs) > 0:
-            specific_crs.insert(0, "#/crs")
-        collection.crs_json = specific_crs
-    
-    all_collections_model = [collection.to_collection() for collection in all_collections]
-    
-    return Collections(links=links, collections=all_collections_model, crs=shared_crs)
+# Rendered pages of the collections document per (offset, limit)
+MAX_PAGES = 64
 
-def update_database_object(collections_url: str = None, app_base_url: str = None) -> PreRenderedJson:
+class CollectionsCatalogue(object):
     """
-    Generates the collections model and updates or inserts it as a pre rendered object into the database.
-    
-    Parameters:
-        collections_url (str, optional): The URL of the collections, defaults to None.
-        app_base_url (str, optional): The base url of the application, defaults to None.
-        
-    Returns:
-        PreRenderedJson: The pre-rendered object (table model) of the collections model.
+    The collections document assembled from the pre-rendered documents of the collections in the collection registry.\n
+    Every collection is encoded once as a fragment (with the CRSs, which are not shared by all collections), so a page of the document
+    is only a concatenation of fragments. If the registry is reloaded, the catalogue is derived from the previous one: the counts of the CRSs
+    are only updated for changed collections and only fragments of changed collections are encoded again (or all, if the shared CRSs changed).
     """
-    
-    if collections_url is None and app_base_url is None:
-        raise ValueError("Either collections_url or base_url must be provided.")
-    
-    if collections_url is None:
-        app_base_url = app_base_url.lstrip("/")
-        collections_url = f"{app_base_url}{config.routes.FEATURES}/collections"
-    
-    with DatabaseSession() as session:
-        generated_collections = generate_object(collections_url)
-        pre_rendered_collections = PreRenderedJson(key="collections", json_data=generated_collections.model_dump_json(by_alias=True, exclude_unset=True, exclude_none=True))
-        collections_object = session.get(PreRenderedJson, pre_rendered_collections.key)
-        if collections_object:      # If the prerendered json with the key already exists
-            collections_object.sqlmodel_update(pre_rendered_collections)
-            session.add(collections_object)
-            session.commit()
-            session.refresh(collections_object)
-        else:                       # If the prerendered json with the key does not exist
-            session.add(pre_rendered_collections)
-            session.commit()
-            session.refresh(pre_rendered_collections)
-
-    return pre_rendered_collections
\ No newline at end of file
+
+    def __init__(self, collections: dict[str, collection_impl.CollectionSnapshot], previous: Optional["CollectionsCatalogue"] = None):
+        self.collections = collections
+        self.crs_counts: Counter[str] = Counter() if previous is None else previous.crs_counts.copy()
+
+        previous_collections = {} if previous is None else previous.collections
+        for collection_id, collection in previous_collections.items():
+            current = collections.get(collection_id, None)
+            if current is None or current.crs_set != collection.crs_set:
+                self.crs_counts.subtract(collection.crs_set)
+        for collection_id, collection in collections.items():
+            previous_collection = previous_collections.get(collection_id, None)
+            if previous_collection is None or previous_collection.crs_set != collection.crs_set:
+                self.crs_counts.update(collection.crs_set)
+
+        self.crs_counts = +self.crs_counts
+        # In the order of the first collection, so the shared CRSs don't change their order between reloads
+        first_collection = next(iter(collections.values()), None)
+        self.shared_crs = [crs for crs in first_collection.crs_json if self.crs_counts[crs] == len(collections)] if first_collection is not None else []
+        shared_crs_changed = previous is None or previous.shared_crs != self.shared_crs
+
+        # collection id -> (pre-rendered template the fragment was encoded from, fragment)
+        self.fragments: dict[str, tuple[http_utils.DocumentTemplate, bytes]] = {}
+        for collection_id, collection in collections.items():
+            if collection.pre_rendered_template is None:
+                continue
+            
+            fragment = None if shared_crs_changed or previous is None else previous.fragments.get(collection_id, None)
+            if fragment is None or fragment[0] is not collection.pre_rendered_template:
+                fragment = (collection.pre_rendered_template, self._encode_fragment(collection))
+
+            self.fragments[collection_id] = fragment
+
+        self._encoded_shared_crs = orjson.dumps(self.shared_crs)
+        self._pages = cache_utils.LRUCache(max_entries=MAX_PAGES)
+
+    def _encode_fragment(self, collection: collection_impl.CollectionSnapshot) -> bytes:
+        specific_crs = [crs for crs in collection.crs_json if crs not in self.shared_crs]
+        if len(self.shared_crs) > 0:
+            specific_crs.insert(0, "#/crs")
+
+        return orjson.dumps({**collection.pre_rendered_json, "crs": specific_crs})
+
+    def _generate_links(self, offset: int, limit: Optional[int]) -> list[dict]:
+        collections_url = f"{pre_render_helper.BASE_URL_PLACEHOLDER}{config.routes.FEATURES}/collections"
+
+        def page_url(page_offset: int) -> str:
+            if limit is None:
+                return collections_url
+            return f"{collections_url}?offset={page_offset}&limit={limit}"
+
+        links = pre_render_helper.generate_links([{"url": page_url(offset), "rel": "self", "title": "This document as {format_name}"}], multiple_types=True)
+        if limit is not None and offset + limit < len(self.fragments):
+            links.extend(pre_render_helper.generate_multiple_link_types({"url": page_url(offset + limit), "rel": "next", "title": "Next page as {format_name}"}))
+        if limit is not None and offset > 0:
+            links.extend(pre_render_helper.generate_multiple_link_types({"url": page_url(max(0, offset - limit)), "rel": "prev", "title": "Previous page as {format_name}"}))
+
+        return links
+
+    def get_page(self, offset: int = 0, limit: Optional[int] = None) -> http_utils.DocumentTemplate:
+        """The collections document with the collections from offset to offset + limit (all, if limit is None)"""
+
+        page = self._pages.get((offset, limit), None)
+        if page is not None:
+            return page
+
+        fragments = list(self.fragments.values())
+        fragments = fragments[offset:] if limit is None else fragments[offset:offset + limit]
+
+        parts = [b'{"links":', orjson.dumps(self._generate_links(offset, limit)), b',"collections":[', b",".join(fragment for _, fragment in fragments), b"]"]
+        if len(self.collections) > 0:
+            parts.extend([b',"crs":', self._encoded_shared_crs])
+        parts.append(b"}")
+
+        page = http_utils.DocumentTemplate(b"".join(parts), pre_render_helper.BASE_URL_PLACEHOLDER)
+        self._pages.set((offset, limit), page)
+        return page
+
+_CATALOGUE: Optional[CollectionsCatalogue] = None
+_CATALOGUE_LOCK = threading.Lock()
+
+def get_catalogue() -> CollectionsCatalogue:
+    """Get the catalogue of the current collections, which is derived again only after the collection registry was reloaded."""
+
+    global _CATALOGUE
+
+    collections = collection_impl.COLLECTION_REGISTRY.get_collections()
+    not_pre_rendered = [collection_id for collection_id, collection in collections.items() if collection.pre_rendered_template is None]
+    if len(not_pre_rendered) > 0:
+        collection_impl.pre_render_collections(not_pre_rendered)
+        collections = collection_impl.COLLECTION_REGISTRY.get_collections()
+
+    with _CATALOGUE_LOCK:
+        if _CATALOGUE is None or _CATALOGUE.collections is not collections:
+            _CATALOGUE = CollectionsCatalogue(collections, _CATALOGUE)
+
+        return _CATALOGUE
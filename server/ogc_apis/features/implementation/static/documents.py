@@ -0,0 +1,54 @@
+import threading
+from typing import Optional
+
+import orjson
+
+from server.database.db import Database
+from server.database.models import PreRenderedJson
+from server.ogc_apis.features.implementation import pre_render_helper
+from server.utils import http_utils
+
+class PreRenderedDocuments(object):
+    """
+    In-memory copy of the pre-rendered documents (landing page, conformance declaration) as templates of the final bytes.\n
+    The documents are only read from the database again, after the data version of the database changed (see Database.get_data_version).
+    A template keeps its rendered documents per base URL (ETag, Last-Modified, compressed variants), as long as its content doesn't change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._templates: dict[str, http_utils.DocumentTemplate] = {}
+
+    def _create_template(self, pre_rendered: PreRenderedJson) -> http_utils.DocumentTemplate:
+        content = orjson.dumps(pre_rendered.json_data)
+
+        template = self._templates.get(pre_rendered.key, None)
+        if template is not None and template.content == content:
+            return template
+
+        return http_utils.DocumentTemplate(content, pre_render_helper.BASE_URL_PLACEHOLDER)
+
+    def _refresh(self) -> dict[str, http_utils.DocumentTemplate]:
+        with self._lock:
+            version = Database.get_data_version()
+            if version != self._version:
+                rows: list[PreRenderedJson] = Database.select_sqlite_db(table_model=PreRenderedJson, select_all=True) or []
+                self._templates = {row.key: self._create_template(row) for row in rows}
+                self._version = version
+
+            return self._templates
+
+    def get(self, key: str) -> Optional[http_utils.DocumentTemplate]:
+        return self._refresh().get(key, None)
+
+    def set(self, pre_rendered: PreRenderedJson) -> http_utils.DocumentTemplate:
+        """Add a document, which was just rendered and stored in the database, without waiting for the next reload"""
+
+        with self._lock:
+            template = self._create_template(pre_rendered)
+            self._templates = {**self._templates, pre_rendered.key: template}
+
+            return template
+
+PRE_RENDERED_DOCUMENTS = PreRenderedDocuments()
@@ -52,22 +52,17 @@ def generate_object(base_url: str) -> LandingPage:
     
     return landing_page
 
-def update_database_object(app_base_url: str) -> PreRenderedJson:
+def update_database_object() -> PreRenderedJson:
     """
     Generates the landing page model and updates or inserts it as a pre rendered object into the database.
-    
-    Parameters:
-        app_base_url (str): The base url of the application.
+    The links contain the base URL placeholder (see pre_render_helper.BASE_URL_PLACEHOLDER).
         
     Returns:
         PreRenderedJson: The pre-rendered object (table model) of the landing page model.
     """
     
-    if app_base_url is None:
-        raise ValueError("The base_url must be provided.")
-    
     with DatabaseSession() as session:
-        generated_landing_page = generate_object(base_url=app_base_url)
+        generated_landing_page = generate_object(base_url=pre_render_helper.BASE_URL_PLACEHOLDER)
         pre_rendered_landing_page = PreRenderedJson(key="landing_page", json_data=generated_landing_page.model_dump_json(by_alias=True, exclude_unset=True, exclude_none=True))
         landing_page_object = session.get(PreRenderedJson, pre_rendered_landing_page.key)
         if landing_page_object:
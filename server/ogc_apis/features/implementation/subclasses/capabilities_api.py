@@ -1,5 +1,6 @@
-from typing import Collection, Union
-from fastapi.responses import HTMLResponse, ORJSONResponse
+from typing import Collection, Optional
+from fastapi.responses import HTMLResponse
+import orjson
 from pydantic import Field, StrictStr
 from typing_extensions import Annotated
 from fastapi import HTTPException, Request
@@ -9,9 +10,10 @@ from server.database.db import Database
 from server.database import models
 from server.ogc_apis import ogc_api_config
 from server.ogc_apis.features.apis.capabilities_api_base import BaseCapabilitiesApi
-from server.ogc_apis.features.implementation import static
+from server.ogc_apis.features.implementation import dynamic, static
 from server.ogc_apis.features.models.collections import Collections
 from server.ogc_apis.features.models.conf_classes import ConfClasses
+from server.utils import http_utils
 
 class CapabilitiesApi(BaseCapabilitiesApi):
     async def describe_collection(
@@ -23,71 +25,75 @@ class CapabilitiesApi(BaseCapabilitiesApi):
     ) -> Collection:
         """Return information about the feature collection with id `collectionId`."""
         
-        collections: list[models.CollectionTable] = session.exec(
-            statement=sqlmodel.select(models.CollectionTable).where(models.CollectionTable.id == collectionId)
-        ).all()
-        if len(collections) == 0:
+        collection = await dynamic.collection_impl.COLLECTION_REGISTRY.get_async(collectionId)
+        if collection is None:
             raise HTTPException(status_code=404, detail="The requested resource does not exist on the server. For example, a path parameter had an incorrect value.")
-        elif len(collections) > 1:
-            raise HTTPException(status_code=500, detail="Multiple collections with the same id found in the database.")
         
-        collection = collections[0]
-        if collection.pre_rendered_json is None:
-            collection.pre_render(str(request.base_url))
-            Database.update_sqlite_db(data_object=collection)
+        if collection.pre_rendered_template is None:
+            # Not pre-rendered yet, the rendered collection is stored and thus reloaded into the registry
+            dynamic.collection_impl.pre_render_collections([collectionId])
+            collection = await dynamic.collection_impl.COLLECTION_REGISTRY.get_async(collectionId)
+            if collection is None or collection.pre_rendered_template is None:
+                raise HTTPException(status_code=500, detail="The collection could not be rendered.")
         
+        document = collection.pre_rendered_template.render(http_utils.get_base_url(request))
         if format == ogc_api_config.ReturnFormat.html:
             html = ogc_api_config.templates.render("collection.html",
                 collection=collection,
+                links=orjson.loads(document.content)["links"],
             )
             
             return HTMLResponse(status_code=200, content=html)
-
-        return ORJSONResponse(content=collection.pre_rendered_json, status_code=200)
+        
+        return document.response(request)
 
     async def get_collections(
         self,
+        limit: Optional[int],
+        offset: int,
         request: Request,
         format: ogc_api_config.ReturnFormat,
     ) -> Collections:
         """Return the feature collections shared by this API."""
         
-        pre_rendered_collections: Union[models.PreRenderedJson, None] = Database.select_sqlite_db(table_model=models.PreRenderedJson, primary_key_value="collections")
-        if not pre_rendered_collections:
-            collections_url = str(request.url).split("?")[0]
-            pre_rendered_collections = static.collections.update_database_object(collections_url=collections_url)
-            
+        # A reload of the registry runs off the event loop, the catalogue then reads the current collections
+        await dynamic.collection_impl.COLLECTION_REGISTRY.get_collections_async()
+        catalogue = static.collections.get_catalogue()
+        document = catalogue.get_page(offset, limit).render(http_utils.get_base_url(request))
         if format == ogc_api_config.ReturnFormat.html:
             html = ogc_api_config.templates.RESPONSE.TemplateResponse(
                 request=request,
                 name="collections.html",
                 context= {
-                    "collections": pre_rendered_collections.json_data,
+                    "collections": orjson.loads(document.content),
                 }
             )
             return html
         
-        return ORJSONResponse(content=pre_rendered_collections.json_data, status_code=200)
+        return document.response(request)
 
     async def get_conformance_declaration(
         self,
+        request: Request,
         format: ogc_api_config.ReturnFormat,
     ) -> ConfClasses:
         """Return information about specifications that this API conforms to."""
         
-        pre_rendered_conformance_declaration: Union[models.PreRenderedJson, None] = Database.select_sqlite_db(table_model=models.PreRenderedJson, primary_key_value="conformance_declaration")
-        if not pre_rendered_conformance_declaration:
+        pre_rendered_conformance_declaration = static.documents.PRE_RENDERED_DOCUMENTS.get("conformance_declaration")
+        if pre_rendered_conformance_declaration is None:
             generated_conformance_declaration = static.conformance.generate_object()
-            pre_rendered_conformance_declaration = models.PreRenderedJson(key="conformance_declaration", json_data=generated_conformance_declaration.model_dump_json(by_alias=True, exclude_unset=True, exclude_none=True))
-            Database.insert_sqlite_db(data_object=pre_rendered_conformance_declaration)
+            conformance_declaration_object = models.PreRenderedJson(key="conformance_declaration", json_data=generated_conformance_declaration.model_dump_json(by_alias=True, exclude_unset=True, exclude_none=True))
+            Database.insert_sqlite_db(data_object=conformance_declaration_object)
+            pre_rendered_conformance_declaration = static.documents.PRE_RENDERED_DOCUMENTS.set(conformance_declaration_object)
 
+        document = pre_rendered_conformance_declaration.render(http_utils.get_base_url(request))
         if format == ogc_api_config.ReturnFormat.html:
             html = ogc_api_config.templates.render("conformance_declaration.html",
-                conf_classes=pre_rendered_conformance_declaration.json_data,
+                conf_classes=orjson.loads(document.content),
             )
             return HTMLResponse(status_code=200, content=html)
         
-        return ORJSONResponse(content=pre_rendered_conformance_declaration.json_data, status_code=200)
+        return document.response(request)
 
     async def get_landing_page(
         self, 
@@ -96,15 +102,15 @@ class CapabilitiesApi(BaseCapabilitiesApi):
     ) -> str:
         """Return the landing page for the API."""
         
-        pre_rendered_landing_page: Union[models.PreRenderedJson, None] = Database.select_sqlite_db(table_model=models.PreRenderedJson, primary_key_value="landing_page")
-        if not pre_rendered_landing_page:
-            base_url = str(request.base_url)
-            pre_rendered_landing_page = static.landing_page.update_database_object(app_base_url=base_url)
+        pre_rendered_landing_page = static.documents.PRE_RENDERED_DOCUMENTS.get("landing_page")
+        if pre_rendered_landing_page is None:
+            pre_rendered_landing_page = static.documents.PRE_RENDERED_DOCUMENTS.set(static.landing_page.update_database_object())
         
+        document = pre_rendered_landing_page.render(http_utils.get_base_url(request))
         if format == ogc_api_config.ReturnFormat.html:
             html = ogc_api_config.templates.render("landing_page.html",
-                landing_page=pre_rendered_landing_page.json_data,
+                landing_page=orjson.loads(document.content),
             )
             return HTMLResponse(status_code=200, content=html)
         
-        return ORJSONResponse(content=pre_rendered_landing_page.json_data, status_code=200)
\ No newline at end of file
+        return document.response(request)
\ No newline at end of file
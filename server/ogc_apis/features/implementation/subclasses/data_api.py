@@ -1,9 +1,12 @@
 import datetime as dt
 from typing import ClassVar, Dict, List, Tuple  # noqa: F401
 
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from psycopg_pool import PoolTimeout
 from pydantic import BeforeValidator, Field, StrictFloat, StrictInt, StrictStr
 from typing import Any, List, Optional, Union
+import orjson
 import sqlmodel
 from typing_extensions import Annotated
 from server.database import models
@@ -14,7 +17,8 @@ from server.ogc_apis.features.models.feature_geo_json import FeatureGeoJSON
 
 from server.ogc_apis import ogc_api_config
 from server.ogc_apis.features.implementation import dynamic
-from server.utils import gdal_utils
+from server.ogc_apis.features.implementation.dynamic import generalized_geometry
+from server.utils import gdal_utils, http_utils, worker_pool
 
 
 class DataApi(BaseDataApi):
@@ -23,35 +27,64 @@ class DataApi(BaseDataApi):
         collectionId: Annotated[StrictStr, Field(description="local identifier of a collection")],
         featureId: Annotated[StrictStr, Field(description="local identifier of a feature")],
         crs: Annotated[Optional[StrictStr], Field(description="The optional `crs` parameter is used to specify the coordinate reference system of the geometries in the response document. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system  http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used.")],
+        properties: Annotated[Optional[StrictStr], Field(description="The optional `properties` parameter is a comma-separated list of the properties, which are included in the features of the response document. The names have to be properties of the collection. If the parameter is empty, no properties are included. If the parameter is omitted, all properties are included.")],
+        skip_geometry: Annotated[Optional[bool], Field(description="The optional `skipGeometry` parameter excludes the geometries from the features of the response document, if it is `true`. Default = false.")],
+        coordinate_precision: Annotated[Optional[Annotated[int, Field(ge=0, le=ogc_api_config.params.COORDINATE_PRECISION_MAXIMUM)]], Field(description="The optional `coordinate-precision` parameter sets the number of decimal places of the coordinates in the response document. If the parameter is omitted, the setting of the collection or the default for the unit of the response CRS (degrees or metres) is used.")],
         format: ogc_api_config.ReturnFormat,
         request: Request,
         session: sqlmodel.Session,
     ) -> FeatureGeoJSON:
         """Fetch the feature with id `featureId` in the feature collection with id `collectionId`.  Use content negotiation to request HTML or GeoJSON."""
         
-        collections: list[models.CollectionTable] = dynamic.collection_impl.get_collection_by_id(id=collectionId, session=session)
-        if len(collections) == 0:
+        collection = await dynamic.collection_impl.COLLECTION_REGISTRY.get_async(collectionId)
+        if collection is None:
             raise HTTPException(status_code=404, detail="The requested resource does not exist on the server. For example, a path parameter had an incorrect value.")
-        collection = collections[0]
         
         if crs is None:
             crs = "http://www.opengis.net/def/crs/OGC/1.3/CRS84" if not collection.is_3D else "http://www.opengis.net/def/crs/OGC/0/CRS84h"
         
-        if crs not in collection.crs_json:
+        if crs not in collection.crs_set:
             raise HTTPException(status_code=400, detail="The requested CRS is not applicable to this collection. List of supported CRSs: " + ", ".join(collection.crs_json))
         
-        dataset_wrapper = gdal_utils.get_dataset_from_collection_table(collection, session)
+        properties = _get_properties(collection, properties)
+        skip_geometry = bool(skip_geometry)
+        precision = dynamic.feature_impl.get_coordinate_precision(crs, collection.coordinate_precision, coordinate_precision)
+        
         try:
             featureId = int(featureId)
-            feature = dynamic.feature_impl.get_feature_by_id(dataset_wrapper, collection.layer_name, featureId)
         except ValueError:
             raise HTTPException(status_code=404, detail="The requested resource does not exist on the server. For example, a path parameter had an incorrect value.")
         
-        if crs != collection.storage_crs:
-            dynamic.feature_impl.transform_feature(feature, crs)
+        links = dynamic.feature_impl.generate_feature_links(base_url=request.base_url._url, collection_id=collectionId, feature_id=featureId)
+        
+        if dynamic.feature_postgis_impl.is_applicable(collection, crs):
+            try:
+                feature_bytes = await dynamic.feature_postgis_impl.get_feature_by_id(collection.dataset, collection.layer_name, featureId, crs, collection.layer_metadata, collectionId, properties, skip_geometry, precision)
+            except ValueError:
+                raise HTTPException(status_code=404, detail="The requested resource does not exist on the server. For example, a path parameter had an incorrect value.")
+            except PoolTimeout as error:
+                raise HTTPException(status_code=503, detail="The server is currently busy. Please try again later.", headers={"Retry-After": "1"}) from error
+        else:
+            dataset_wrapper = gdal_utils.get_dataset_from_collection_table(collection, session)
+            
+            def read_feature() -> bytes:
+                feature = dynamic.feature_impl.get_feature_by_id(dataset_wrapper, collection.layer_name, featureId, properties, skip_geometry)
+                geom = feature.GetGeometryRef()
+                source_srs = geom.GetSpatialReference() if geom is not None and crs != collection.storage_crs else None
+                
+                fields, _ = dynamic.feature_impl.get_property_fields(feature.GetDefnRef(), properties=properties)
+                return dynamic.feature_impl.encode_features([feature], fields, precision=precision, source_srs=source_srs, t_srs_res=crs, skip_geometry=skip_geometry)[0]
+            
+            # GDAL blocks, so it runs in the bounded worker pool to keep the event loop responsive
+            try:
+                feature_bytes = await worker_pool.FEATURE_WORKER_POOL.run(collectionId, read_feature)
+            except ValueError:
+                raise HTTPException(status_code=404, detail="The requested resource does not exist on the server. For example, a path parameter had an incorrect value.")
+            except worker_pool.WorkerPoolOverloaded as error:
+                raise HTTPException(status_code=503, detail="The server is currently busy. Please try again later.", headers={"Retry-After": str(error.retry_after)}) from error
         
-        feature_json = feature.ExportToJson(as_object=True)
-        feature_json["links"] = dynamic.feature_impl.generate_feature_links(base_url=request.base_url._url, collection_id=collectionId, feature_id=featureId)
+        feature_bytes = dynamic.feature_impl.add_members(feature_bytes, {"links": links})
+        feature_json = orjson.loads(feature_bytes) if format == ogc_api_config.ReturnFormat.html else feature_bytes
         
         headers = {
             "Content-Crs": "<" + crs + ">",
@@ -80,33 +113,74 @@ class DataApi(BaseDataApi):
         collectionId: Annotated[StrictStr, Field(description="local identifier of a collection")],
         limit: Annotated[Optional[Annotated[int, Field(le=ogc_api_config.params.LIMIT_MAXIMUM, ge=1), BeforeValidator(ogc_api_config.params.validate_limit)]], Field(description=f"The optional limit parameter limits the number of items that are presented in the response document.  Only items are counted that are on the first level of the collection in the response document. Nested objects contained within the explicitly requested items shall not be counted.  Minimum = 1. Maximum = {ogc_api_config.params.LIMIT_MAXIMUM}. Default = 100.")],
         offset: Annotated[Optional[Annotated[int, Field(default=0, ge=0)]], Field(description="The optional offset parameter is used to skip the specified number of items in the result set. The offset is applied after the limit parameter. The first element has the index 0.")],
+        cursor: Annotated[Optional[StrictStr], Field(description="The optional cursor parameter is an opaque token, which is provided by the server in the `next` link of a response. It continues the result set after the last feature of the previous page and takes precedence over the `offset` parameter.")],
         bbox: Annotated[Optional[Annotated[List[Union[StrictFloat, StrictInt]], BeforeValidator(ogc_api_config.params.validate_bbox)]], Field(description="Only features that have a geometry that intersects the bounding box are selected. The bounding box is provided as four or six numbers, depending on whether the coordinate reference system includes a vertical axis (height or depth):  * Lower left corner, coordinate axis 1 * Lower left corner, coordinate axis 2 * Minimum value, coordinate axis 3 (optional) * Upper right corner, coordinate axis 1 * Upper right corner, coordinate axis 2 * Maximum value, coordinate axis 3 (optional)  If the value consists of four numbers, the coordinate reference system is WGS 84 longitude/latitude (http://www.opengis.net/def/crs/OGC/1.3/CRS84) unless a different coordinate reference system is specified in the parameter `bbox-crs`.  If the value consists of six numbers, the coordinate reference system is WGS 84 longitude/latitude/ellipsoidal height (http://www.opengis.net/def/crs/OGC/0/CRS84h) unless a different coordinate reference system is specified in the parameter `bbox-crs`.  The query parameter `bbox-crs` is specified in OGC API - Features - Part 2: Coordinate Reference Systems by Reference.  For WGS 84 longitude/latitude the values are in most cases the sequence of minimum longitude, minimum latitude, maximum longitude and maximum latitude. However, in cases where the box spans the antimeridian the first value (west-most box edge) is larger than the third value (east-most box edge).  If the vertical axis is included, the third and the sixth number are the bottom and the top of the 3-dimensional bounding box.  If a feature has multiple spatial geometry properties, it is the decision of the server whether only a single spatial geometry property is used to determine the extent or all relevant geometries.")],
         datetime: Annotated[Optional[StrictStr], Field(description="Either a date-time or an interval. Date and time expressions adhere to RFC 3339. Intervals may be bounded or half-bounded (double-dots at start or end).  Examples:  * A date-time: \"2018-02-12T23:20:50Z\" * A bounded interval: \"2018-02-12T00:00:00Z/2018-03-18T12:31:12Z\" * Half-bounded intervals: \"2018-02-12T00:00:00Z/..\" or \"../2018-03-18T12:31:12Z\"  Only features that have a temporal property that intersects the value of `datetime` are selected.  If a feature has multiple temporal properties, it is the decision of the server whether only a single temporal property is used to determine the extent or all relevant temporal properties.")],
         bbox_crs: Annotated[Optional[StrictStr], Field(description="The optional `bbox-crs` parameter is used to specify the coordinate reference system of the bounding box. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used.")],
         crs: Annotated[Optional[StrictStr], Field(description="The optional `crs` parameter is used to specify the coordinate reference system of the geometries in the response document. The value of the parameter is a URI identifying the coordinate reference system.  If the parameter is omitted, the default coordinate reference system  http://www.opengis.net/def/crs/OGC/1.3/CRS84 for 2D or http://www.opengis.net/def/crs/OGC/0/CRS84h for 3D is used.")],
+        number_matched: Annotated[Optional[ogc_api_config.params.NumberMatched], Field(description="The optional `number-matched` parameter controls how the `numberMatched` member of the response is determined. If the parameter is omitted, the default of the collection is used.")],
+        properties: Annotated[Optional[StrictStr], Field(description="The optional `properties` parameter is a comma-separated list of the properties, which are included in the features of the response document. The names have to be properties of the collection. If the parameter is empty, no properties are included. If the parameter is omitted, all properties are included.")],
+        skip_geometry: Annotated[Optional[bool], Field(description="The optional `skipGeometry` parameter excludes the geometries from the features of the response document, if it is `true`. Default = false.")],
+        coordinate_precision: Annotated[Optional[Annotated[int, Field(ge=0, le=ogc_api_config.params.COORDINATE_PRECISION_MAXIMUM)]], Field(description="The optional `coordinate-precision` parameter sets the number of decimal places of the coordinates in the response document. If the parameter is omitted, the setting of the collection or the default for the unit of the response CRS (degrees or metres) is used.")],
+        scale_denominator: Annotated[Optional[Annotated[float, Field(gt=0)]], Field(description="The optional `scale-denominator` parameter is the scale denominator of the map, on which the features are displayed. If the collection has generalized geometries for an equal or smaller scale denominator, the features are returned with the geometries of the coarsest of them. If the parameter is omitted, the geometries are returned in full resolution.")],
+        zoom_level: Annotated[Optional[Annotated[int, Field(ge=0, le=ogc_api_config.params.ZOOM_LEVEL_MAXIMUM)]], Field(description="The optional `zoom-level` parameter is the zoom level of the WebMercatorQuad tile matrix set of the map, on which the features are displayed. It is converted to its scale denominator and can't be combined with the `scale-denominator` parameter.")],
         format: ogc_api_config.ReturnFormat,
         request: Request,
         session: sqlmodel.Session,
     ) -> FeatureCollectionGeoJSON:
         """Fetch features of the feature collection with id `collectionId`.  Every feature in a dataset belongs to a collection. A dataset may consist of multiple feature collections. A feature collection is often a collection of features of a similar type, based on a common schema.  Use content negotiation to request HTML or GeoJSON."""
         
-        collections: list[models.CollectionTable] = dynamic.collection_impl.get_collection_by_id(id=collectionId, session=session)
-        if len(collections) == 0:
+        collection = await dynamic.collection_impl.COLLECTION_REGISTRY.get_async(collectionId)
+        if collection is None:
             raise HTTPException(status_code=404, detail="The requested resource does not exist on the server. For example, a path parameter had an incorrect value.")
-        collection = collections[0]
         
         if crs is None:
             crs = "http://www.opengis.net/def/crs/OGC/1.3/CRS84" if not collection.is_3D else "http://www.opengis.net/def/crs/OGC/0/CRS84h"
         
-        if crs not in collection.crs_json:
+        if crs not in collection.crs_set:
             raise HTTPException(status_code=400, detail="The requested CRS is not applicable to this collection. List of supported CRSs: " + ", ".join(collection.crs_json))
         
-        if bbox_crs is not None and bbox_crs not in collection.crs_json:
+        if bbox_crs is not None and bbox_crs not in collection.crs_set:
             raise HTTPException(status_code=400, detail="The BBOX-CRS is not applicable to this collection. List of supported BBOX-CRSs: " + ", ".join(collection.crs_json))
             
         if bbox_crs is None and bbox is not None:
             bbox_crs = "http://www.opengis.net/def/crs/OGC/1.3/CRS84" if not collection.is_3D else "http://www.opengis.net/def/crs/OGC/0/CRS84h"
         
+        # The projection is pushed into the queries, so unrequested columns and geometries are neither read nor encoded
+        properties = _get_properties(collection, properties)
+        skip_geometry = bool(skip_geometry)
+        precision = dynamic.feature_impl.get_coordinate_precision(crs, collection.coordinate_precision, coordinate_precision)
+        
+        # Overview requests read the pre-generalized copy of the layer of the coarsest suitable level (full resolution, if there is none)
+        try:
+            generalization_level = generalized_geometry.select_level(collection.generalization_ready_json, generalized_geometry.get_scale_denominator(scale_denominator, zoom_level))
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error)) from error
+        
+        # The cursor is bound to the filter it was created with, so a changed filter can't continue at a foreign position
+        filter_hash = dynamic.feature_impl.get_filter_hash(collectionId, bbox, bbox_crs, datetime)
+        after_fid = None
+        if cursor is not None:
+            try:
+                after_fid, offset = dynamic.feature_impl.parse_cursor(cursor, filter_hash)
+            except ValueError as error:
+                raise HTTPException(status_code=400, detail=str(error)) from error
+        
+        if number_matched is None:
+            number_matched = ogc_api_config.params.NumberMatched(collection.number_matched)
+        
+        # Counts are stored per collection, so they can be invalidated together with the cached responses
+        # The generalized geometries may match other bounding boxes, so their counts are stored per level
+        count_cache_key = (collectionId, filter_hash) if generalization_level is None else (collectionId, filter_hash, generalization_level)
+        
+        # Identical GeoJSON requests are answered from the encoded response of the first one (HTML pages aren't cached)
+        items_cache_key = None
+        if format != ogc_api_config.ReturnFormat.html:
+            items_cache_key = dynamic.feature_impl.get_items_cache_key(collectionId, request.base_url._url, bbox, bbox_crs, datetime, crs, limit, offset, cursor, number_matched, format, properties, skip_geometry, precision, generalization_level)
+            cached_response = dynamic.feature_impl.ITEMS_RESPONSE_CACHE.get(items_cache_key)
+            if cached_response is not None:
+                return _cached_geojson_response(request, *cached_response)
+        
         datetime_interval = None
         if datetime is not None:
             parts = datetime.split("/")
@@ -127,46 +201,133 @@ class DataApi(BaseDataApi):
                 raise HTTPException(status_code=400, detail="The datetime parameter is not in the correct format. It must adhere to RFC 3339 and the OGC specification.") from error
 
         dataset_wrapper = gdal_utils.get_dataset_from_collection_table(collection, session)
+        layer_metadata = collection.layer_metadata
         
-        try:
-            features, total_feature_count, returned_feature_count = dynamic.feature_impl.get_features(dataset_wrapper, collection.layer_name, bbox, bbox_crs, datetime_interval, collection.date_time_field, crs, limit, offset)
-        except ValueError as error:
-            raise HTTPException(status_code=400, detail=str(error)) from error
+        layer_name = collection.layer_name
+        if generalization_level is not None:
+            layer_name = generalized_geometry.get_layer_name(collection.layer_name, collection.dataset.type, generalization_level)
+            layer_metadata = generalized_geometry.get_layer_metadata(layer_metadata, collection.dataset.type)
+            if collection.dataset.type != models.Dataset.Type.DB:
+                dataset_wrapper = gdal_utils.DatasetWrapper(generalized_geometry.get_file_path(collection.uuid), {})
         
-        next_page = returned_feature_count + offset < total_feature_count
-
         cur_url = request.url.remove_query_params("f")
-        cur_url = cur_url.include_query_params(limit=limit, offset=offset)
-        next_url = cur_url.include_query_params(offset=min(offset + limit, total_feature_count - 1))._url if next_page else None
-        prev_url = cur_url.include_query_params(offset=max(offset - limit, 0))._url if offset > 0 else None
-        
-        links = dynamic.feature_impl.generate_features_links(request.base_url._url, cur_url._url, next_url, prev_url)
+        if cursor is None:
+            cur_url = cur_url.include_query_params(limit=limit, offset=offset)
+        else:
+            cur_url = cur_url.include_query_params(limit=limit)
         
-        if "crs" in features:
-            del features["crs"]
-        
-        features["timeStamp"] = dt.datetime.now().replace(microsecond=0).isoformat()
-        features["numberMatched"] = total_feature_count
-        features["numberReturned"] = returned_feature_count
-        features["links"] = links
+        def generate_links(returned_feature_count: int, next_page: bool, last_fid: Optional[int]) -> list[dict]:
+            # The next page continues after the last returned FID (keyset pagination), so deep pages are as cheap as the first one
+            next_url = None
+            if next_page:
+                next_cursor = dynamic.feature_impl.generate_cursor(last_fid, offset + returned_feature_count, filter_hash)
+                next_url = cur_url.remove_query_params("offset").include_query_params(cursor=next_cursor)._url
+            prev_url = cur_url.remove_query_params("cursor").include_query_params(offset=max(offset - limit, 0))._url if offset > 0 else None
+            
+            return dynamic.feature_impl.generate_features_links(request.base_url._url, cur_url._url, next_url, prev_url)
         
         headers = {
             "Content-Crs": "<" + crs + ">",
             "Cache-Control": "max-age=60",
         }
+        
+        # The PostGIS engine builds the GeoJSON inside the database, CRSs without SRID are left to GDAL
+        if dynamic.feature_postgis_impl.is_applicable(collection, crs, bbox_crs):
+            # The feature cache only holds features in full resolution
+            fragment_cache_id = collectionId if generalization_level is None else None
+            try:
+                features_bytes, total_feature_count, returned_feature_count, next_page, last_fid = await dynamic.feature_postgis_impl.get_features(collection.dataset, layer_name, bbox, bbox_crs, datetime_interval, collection.date_time_field, crs, limit, offset, after_fid, number_matched, count_cache_key, layer_metadata, fragment_cache_id, properties, skip_geometry, precision)
+            except ValueError as error:
+                raise HTTPException(status_code=400, detail=str(error)) from error
+            except PoolTimeout as error:
+                raise HTTPException(status_code=503, detail="The server is currently busy. Please try again later.", headers={"Retry-After": "1"}) from error
+        else:
+            # Large GeoJSON pages are written feature by feature, so the page is never held in memory as a whole
+            streaming_threshold = ogc_api_config.params.STREAMING_LIMIT_THRESHOLD
+            if format != ogc_api_config.ReturnFormat.html and streaming_threshold > 0 and limit >= streaming_threshold:
+                time_stamp = dt.datetime.now().replace(microsecond=0).isoformat()
+            
+                def generate_trailer(returned_feature_count: int, next_page: bool, last_fid: Optional[int]) -> dict:
+                    trailer = {"timeStamp": time_stamp}
+                    if total_feature_count is not None:
+                        trailer["numberMatched"] = total_feature_count
+                    trailer["numberReturned"] = returned_feature_count
+                    trailer["links"] = generate_links(returned_feature_count, next_page, last_fid)
+                    return trailer
+            
+                try:
+                    chunks, total_feature_count = await worker_pool.FEATURE_WORKER_POOL.run(collectionId, dynamic.feature_impl.stream_features, dataset_wrapper, layer_name, bbox, bbox_crs, datetime_interval, collection.date_time_field, crs, limit, offset, generate_trailer, after_fid, number_matched, count_cache_key, layer_metadata, precision, properties, skip_geometry)
+                except ValueError as error:
+                    raise HTTPException(status_code=400, detail=str(error)) from error
+                except worker_pool.WorkerPoolOverloaded as error:
+                    raise HTTPException(status_code=503, detail="The server is currently busy. Please try again later.", headers={"Retry-After": str(error.retry_after)}) from error
+            
+                return StreamingResponse(
+                    content=worker_pool.FEATURE_WORKER_POOL.iterate(collectionId, chunks),
+                    status_code=200,
+                    media_type=ogc_api_config.formats.GeoJSONResponse.media_type,
+                    headers=headers,
+                )
+        
+            try:
+                # GDAL blocks, so it runs in the bounded worker pool to keep the event loop responsive
+                features_bytes, total_feature_count, returned_feature_count, next_page, last_fid = await worker_pool.FEATURE_WORKER_POOL.run(collectionId, dynamic.feature_impl.get_features, dataset_wrapper, layer_name, bbox, bbox_crs, datetime_interval, collection.date_time_field, crs, limit, offset, after_fid, number_matched, count_cache_key, layer_metadata, precision, properties, skip_geometry)
+            except ValueError as error:
+                raise HTTPException(status_code=400, detail=str(error)) from error
+            except worker_pool.WorkerPoolOverloaded as error:
+                raise HTTPException(status_code=503, detail="The server is currently busy. Please try again later.", headers={"Retry-After": str(error.retry_after)}) from error
+
+        # The encoded features are spliced into the envelope, only the members of the envelope are encoded per request
+        members = {"timeStamp": dt.datetime.now().replace(microsecond=0).isoformat()}
+        if total_feature_count is not None:
+            members["numberMatched"] = total_feature_count
+        members["numberReturned"] = returned_feature_count
+        members["links"] = generate_links(returned_feature_count, next_page, last_fid)
+
+        content = dynamic.feature_impl.build_feature_collection(features_bytes, members)
         if format == ogc_api_config.ReturnFormat.html:
             return ogc_api_config.templates.response("features.html",
                 request=request,
                 context={
-                    "features": features,
+                    "features": orjson.loads(content),
                     "collection": collection,
                     "crs_wkt": gdal_utils.get_wkt_from_uri(crs),
                 },
                 headers=headers
             )
 
-        return ogc_api_config.formats.GeoJSONResponse(
-            status_code=200,
-            content=features, 
-            headers=headers,
-        )
\ No newline at end of file
+        return _store_geojson_response(request, items_cache_key, content, headers)
+
+def _get_properties(collection: Any, properties: Optional[str]) -> Optional[list[str]]:
+    """Parse the properties parameter and check it against the fields of the collection (None selects all properties)"""
+    
+    properties = ogc_api_config.params.parse_properties(properties)
+    if properties is not None and collection.fields_json:
+        try:
+            dynamic.feature_impl.validate_properties([field["name"] for field in collection.fields_json], properties)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error)) from error
+    
+    return properties
+
+def _cached_geojson_response(request: Request, content: bytes, etag: str, headers: dict[str, str]) -> Response:
+    """Answer with the encoded GeoJSON, or with 304 if the client already has this version of it."""
+    
+    headers = {**headers, "ETag": etag}
+    if http_utils.etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return ogc_api_config.formats.GeoJSONResponse(
+        status_code=200,
+        content=content,
+        headers=headers,
+    )
+
+def _store_geojson_response(request: Request, items_cache_key: Optional[tuple], content: bytes, headers: dict[str, str]) -> Response:
+    """Cache the encoded GeoJSON of an items request and answer with it."""
+    
+    etag = http_utils.get_etag(content)
+    if items_cache_key is not None:
+        dynamic.feature_impl.ITEMS_RESPONSE_CACHE.set(items_cache_key, (content, etag, headers))
+    
+    return _cached_geojson_response(request, content, etag, headers)
\ No newline at end of file
@@ -63,6 +63,7 @@ def init_api_server() -> FastAPI:
     @app.exception_handler(HTTPException)
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: Exception) -> OGCException:
+        headers = None
         if isinstance(exc, RequestValidationError):
             error = exc.errors()[0]
             param = error["loc"][1]
@@ -71,17 +72,20 @@ def init_api_server() -> FastAPI:
             exception = OGCException(code="400", description=f"Input for parameter '{param}' of type '{param_type}' is invalid. {msg}")
         elif isinstance(exc, HTTPException):
             exception = OGCException(code=str(exc.status_code), description=exc.detail)
+            # e.g. Retry-After of 503 responses
+            headers = exc.headers
         else:
             exception = OGCException(code="500", description="Internal server error")
         
         accept = request.headers.get("accept", "application/json")
         if "text/html" in accept:
             html = ogc_api_config.templates.render("exception.html", **exception.to_dict())
-            return HTMLResponse(html, status_code=int(exception.code))
+            return HTMLResponse(html, status_code=int(exception.code), headers=headers)
         
         return JSONResponse(
             status_code=int(exception.code),
             content=jsonable_encoder(exception),
+            headers=headers,
         )
 
     api_responses = _get_api_responses()
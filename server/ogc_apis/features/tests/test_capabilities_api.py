@@ -118,6 +118,32 @@ def test_get_collections(client: TestClient, headers: httpx.Headers):
     # Test different formats
     conftest.formats("GET", "/collections", headers, client)
             
+def test_get_collections_paginated(client: TestClient, headers: httpx.Headers):
+    """Test case for limit and offset of get_collections"""
+
+    response = client.request(
+       "GET",
+       "/collections",
+       headers=headers,
+    )
+    assert response.status_code == 200
+    all_ids = [collection["id"] for collection in response.json()["collections"]]
+    
+    response = client.request(
+       "GET",
+       "/collections",
+       headers=headers,
+       params={"limit": 1, "offset": 1},
+    )
+    assert response.status_code == 200
+    json = response.json()
+    assert Collections.model_validate(json)
+    assert [collection["id"] for collection in json["collections"]] == all_ids[1:2]
+    
+    rels = [link["rel"] for link in json["links"]]
+    assert "prev" in rels
+    assert ("next" in rels) == (len(all_ids) > 2)
+
 def test_get_conformance_declaration(client: TestClient, headers: httpx.Headers):
     """Test case for get_conformance_declaration
 
@@ -172,6 +198,35 @@ def test_get_landing_page(client: TestClient, headers: httpx.Headers):
     # Test different formats
     conftest.formats("GET", "/", headers, client)
 
+def test_get_landing_page_conditional(client: TestClient, headers: httpx.Headers):
+    """Test case for the ETag and Last-Modified of the pre-rendered landing page"""
+
+    response = client.request(
+       "GET",
+       "/",
+       headers=headers,
+    )
+
+    assert response.status_code == 200
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    assert etag is not None and last_modified is not None
+    assert "Accept-Encoding" in response.headers.get("Vary", "")
+    
+    response = client.request(
+       "GET",
+       "/",
+       headers={**headers, "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    
+    response = client.request(
+       "GET",
+       "/",
+       headers={**headers, "If-Modified-Since": last_modified},
+    )
+    assert response.status_code == 304
+
 def test_get_api(client: TestClient, headers: httpx.Headers):
     """Test case for get_api in both formats
 
@@ -4,6 +4,8 @@ from fastapi.testclient import TestClient
 
 
 import httpx, datetime
+import orjson
+import pytest
 from pydantic import Field, StrictFloat, StrictInt, StrictStr  # noqa: F401
 from typing import Any, List, Optional, Union  # noqa: F401
 from sqlmodel import select
@@ -103,6 +105,25 @@ def help_get_features(response: httpx.Response, collection_id: str, correct_matc
     assert len(feature_collection_model.features) <= limit and len(feature_collection_model.features) <= ogc_api_config.params.LIMIT_MAXIMUM
     assert len(feature_collection_model.features) == correct_return
     
+def flatten_coordinates(coordinates: Any) -> list[float]:
+    """The coordinate values of a GeoJSON geometry as flat list"""
+    
+    if isinstance(coordinates, list) and coordinates and isinstance(coordinates[0], list):
+        return [value for part in coordinates for value in flatten_coordinates(part)]
+    return coordinates
+
+def set_feature_engine(collection_id: str, engine: str) -> None:
+    """Switch the feature engine of a collection and drop its cached responses, whose key doesn't contain the engine"""
+    
+    from server.ogc_apis.features.implementation.dynamic import feature as feature_impl
+    
+    with DatabaseSession() as session:
+        collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+        collection.feature_engine = engine
+        session.add(collection)
+        session.commit()
+    feature_impl.invalidate_collection_caches(collection_id)
+
 def test_get_features(client: TestClient, headers: httpx.Headers):
     """Test case for get_features
 
@@ -207,4 +228,411 @@ def test_get_features(client: TestClient, headers: httpx.Headers):
                 params=[("amount", "get_all")],
             )
             
-            assert response.status_code == 400
\ No newline at end of file
+            assert response.status_code == 400
+
+
+def test_get_features_cursor(client: TestClient, headers: httpx.Headers):
+    """Test case for get_features with keyset pagination
+
+    follow the cursor based next links and compare them with offset based pages
+    """
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    limit = 50
+    
+    url = f"/collections/{collection_id}/items?limit={limit}"
+    cursor_ids = []
+    while url is not None:
+        response = client.request("GET", url, headers=headers)
+        assert response.status_code == 200
+        
+        feature_collection_json = response.json()
+        cursor_ids.extend(feature["id"] for feature in feature_collection_json["features"])
+        
+        next_links = [link for link in feature_collection_json["links"] if link["rel"] == "next" and "f=json" in link["href"]]
+        url = next_links[0]["href"] if len(next_links) > 0 else None
+        if url is not None:
+            assert "cursor=" in url
+            assert "offset=" not in url
+            url = url.replace("http://testserver", "")
+    
+    offset_ids = []
+    for offset in range(0, len(cursor_ids), limit):
+        response = client.request(
+            "GET",
+            f"/collections/{collection_id}/items",
+            headers=headers,
+            params=[("limit", limit), ("offset", offset)],
+        )
+        assert response.status_code == 200
+        offset_ids.extend(feature["id"] for feature in response.json()["features"])
+    
+    assert cursor_ids == offset_ids
+    assert len(cursor_ids) == 237
+    
+    # Cursor used with a different filter
+    response = client.request("GET", f"/collections/{collection_id}/items?limit={limit}", headers=headers)
+    next_link = [link for link in response.json()["links"] if link["rel"] == "next"][0]["href"]
+    response = client.request(
+        "GET",
+        next_link.replace("http://testserver", "") + "&bbox=11.646199,52.089114,11.657634,52.096041",
+        headers=headers,
+    )
+    assert response.status_code == 400
+    
+    # Malformed cursor
+    response = client.request("GET", f"/collections/{collection_id}/items?cursor=abc", headers=headers)
+    assert response.status_code == 400
+
+def test_get_features_streaming(client: TestClient, headers: httpx.Headers):
+    """Test case for get_features with a streamed response
+
+    Pages with a limit above the streaming threshold are equal to built pages
+    """
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    limit = ogc_api_config.params.STREAMING_LIMIT_THRESHOLD
+    if limit <= 0:
+        pytest.skip("Streaming is disabled (APP_FEATURES_STREAMING_LIMIT <= 0)")
+    
+    response = client.request("GET", f"/collections/{collection_id}/items?limit={limit}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/geo+json")
+    streamed_json = response.json()
+    help_get_features(response, collection_id, 237, limit)
+    
+    response = client.request("GET", f"/collections/{collection_id}/items?limit={limit - 1}", headers=headers)
+    assert response.status_code == 200
+    built_json = response.json()
+    
+    assert [feature["id"] for feature in streamed_json["features"]] == [feature["id"] for feature in built_json["features"]]
+    assert streamed_json["features"][0]["properties"] == built_json["features"][0]["properties"]
+    assert streamed_json["numberMatched"] == built_json["numberMatched"]
+    
+    # The streamed geometries are encoded from WKB, the built ones by the GeoJSON driver of GDAL, both rounded to the default coordinate precision
+    for streamed_feature, built_feature in zip(streamed_json["features"][:10], built_json["features"][:10]):
+        assert streamed_feature["geometry"]["type"] == built_feature["geometry"]["type"]
+        assert flatten_coordinates(streamed_feature["geometry"]["coordinates"]) == pytest.approx(flatten_coordinates(built_feature["geometry"]["coordinates"]), abs=1e-7)
+
+def test_get_features_streaming_abandoned(client: TestClient, headers: httpx.Headers):
+    """Test case for streams, which are abandoned before their first chunk (e.g. the client disconnected)
+
+    The dataset of the stream is returned to the pool anyway
+    """
+    
+    from server.utils import gdal_utils
+    from server.ogc_apis.features.implementation import dynamic
+    
+    collection_id = "verwaltungsgrenzen"
+    with DatabaseSession() as session:
+        collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+        dataset_wrapper = gdal_utils.get_dataset_from_collection_table(collection, session)
+        layer_name = collection.layer_name
+    
+    crs = "http://www.opengis.net/def/crs/OGC/1.3/CRS84"
+    checked_out_before = gdal_utils.DATASET_POOL.get_stats()["checked_out"]
+    
+    # Closed stream
+    chunks, _ = dynamic.feature_impl.stream_features(dataset_wrapper, layer_name, None, None, None, None, crs, 10, 0, lambda *args: {})
+    assert gdal_utils.DATASET_POOL.get_stats()["checked_out"] == checked_out_before + 1
+    chunks.close()
+    assert gdal_utils.DATASET_POOL.get_stats()["checked_out"] == checked_out_before
+    chunks.close()
+    assert gdal_utils.DATASET_POOL.get_stats()["checked_out"] == checked_out_before
+    
+    # Dropped stream
+    chunks, _ = dynamic.feature_impl.stream_features(dataset_wrapper, layer_name, None, None, None, None, crs, 10, 0, lambda *args: {})
+    del chunks
+    assert gdal_utils.DATASET_POOL.get_stats()["checked_out"] == checked_out_before
+    
+    # Exhausted stream
+    chunks, _ = dynamic.feature_impl.stream_features(dataset_wrapper, layer_name, None, None, None, None, crs, 10, 0, lambda *args: {})
+    assert len(orjson.loads(b"".join(chunks))["features"]) == 10
+    assert gdal_utils.DATASET_POOL.get_stats()["checked_out"] == checked_out_before
+
+def test_get_features_postgis_engine(client: TestClient, headers: httpx.Headers):
+    """Test case for get_features with the native PostGIS engine
+
+    The PostGIS engine returns the same pages as the GDAL engine
+    """
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    queries = [
+        [("limit", 50)],
+        [("limit", 50), ("offset", 200)],
+        [("bbox", "11.646199,52.089114,11.657634,52.096041")],
+        [("crs", "http://www.opengis.net/def/crs/EPSG/0/25832"), ("limit", 10)],
+    ]
+    
+    def get_pages() -> list[dict]:
+        pages = []
+        for query in queries:
+            response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params=query)
+            assert response.status_code == 200
+            pages.append(response.json())
+        return pages
+    
+    with DatabaseSession() as session:
+        collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+        if collection.dataset.type != models.Dataset.Type.DB:
+            pytest.skip("The PostGIS engine needs a PostgreSQL dataset")
+        previous_engine = collection.feature_engine
+    
+    try:
+        set_feature_engine(collection_id, models.CollectionTable.FeatureEngine.GDAL.value)
+        gdal_pages = get_pages()
+        set_feature_engine(collection_id, models.CollectionTable.FeatureEngine.POSTGIS.value)
+        postgis_pages = get_pages()
+    finally:
+        set_feature_engine(collection_id, previous_engine)
+    
+    for gdal_page, postgis_page in zip(gdal_pages, postgis_pages):
+        assert [feature["id"] for feature in gdal_page["features"]] == [feature["id"] for feature in postgis_page["features"]]
+        assert gdal_page["numberMatched"] == postgis_page["numberMatched"]
+        assert gdal_page["numberReturned"] == postgis_page["numberReturned"]
+        assert [link["rel"] for link in gdal_page["links"]] == [link["rel"] for link in postgis_page["links"]]
+
+def test_get_features_fragment_cache(client: TestClient, headers: httpx.Headers):
+    """Test case for overlapping pages of the PostGIS engine, which are assembled from cached features"""
+    
+    from server.ogc_apis.features.implementation.dynamic import feature as feature_impl
+    
+    collection_id = "verwaltungsgrenzen"
+    with DatabaseSession() as session:
+        collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+        if collection.dataset.type != models.Dataset.Type.DB or not feature_impl.FEATURE_FRAGMENT_CACHE.enabled:
+            pytest.skip("The fragment cache needs a PostgreSQL dataset and APP_FEATURE_FRAGMENT_CACHE_SIZE > 0")
+        previous_engine = collection.feature_engine
+    
+    try:
+        set_feature_engine(collection_id, models.CollectionTable.FeatureEngine.POSTGIS.value)
+        first_page = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 20, "offset": 0})
+        assert first_page.status_code == 200
+        
+        hits_before = feature_impl.FEATURE_FRAGMENT_CACHE.get_stats()["hits"]
+        second_page = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 20, "offset": 10})
+        assert second_page.status_code == 200
+        hits_after = feature_impl.FEATURE_FRAGMENT_CACHE.get_stats()["hits"]
+    finally:
+        set_feature_engine(collection_id, previous_engine)
+    
+    assert hits_after - hits_before >= 10
+    assert first_page.json()["features"][10:] == second_page.json()["features"][:10]
+
+def test_get_features_materialized_crs(client: TestClient, headers: httpx.Headers):
+    """Test case for items of a PostgreSQL collection, whose geometries are read from a materialized view of the requested CRS"""
+    
+    from server.web.collections.collections import _run_materialization_job, update_materialized_crs
+    from server.ogc_apis.features.implementation.dynamic import feature as feature_impl
+    
+    collection_id = "verwaltungsgrenzen"
+    crs = "http://www.opengis.net/def/crs/OGC/1.3/CRS84"
+    with DatabaseSession() as session:
+        collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+        if collection.dataset.type != models.Dataset.Type.DB or crs not in collection.crs_json or crs == collection.storage_crs:
+            pytest.skip("Materialized CRSs need a PostgreSQL dataset, which offers CRS84 besides its storage CRS")
+        previous_engine = collection.feature_engine
+    
+    def get_pages() -> list[dict]:
+        pages = []
+        for engine in [models.CollectionTable.FeatureEngine.GDAL.value, models.CollectionTable.FeatureEngine.POSTGIS.value]:
+            set_feature_engine(collection_id, engine)
+            response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"crs": crs, "limit": 10})
+            assert response.status_code == 200
+            pages.append(response.json())
+        return pages
+    
+    def set_materialized_crs(materialized_crs: list[str]) -> None:
+        with DatabaseSession() as session:
+            collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+            previous_materialized_crs = list(collection.materialized_crs_json or [])
+            assert update_materialized_crs(collection, materialized_crs) is None
+            # Added CRSs aren't joined, until their views are built
+            assert all(ready_crs in previous_materialized_crs for ready_crs in collection.materialized_crs_ready_json or [])
+            collection.feature_engine = previous_engine
+            session.add(collection)
+            session.commit()
+            collection_uuid = collection.uuid
+        
+        # The job, which is started by the web admin after the collection is saved
+        _run_materialization_job(collection_uuid, materialized_crs, [crs for crs in previous_materialized_crs if crs not in materialized_crs])
+        with DatabaseSession() as session:
+            assert session.get(models.CollectionTable, collection_uuid).materialized_crs_ready_json == (materialized_crs or None)
+        feature_impl.invalidate_collection_caches(collection_id)
+    
+    try:
+        transformed_pages = get_pages()
+        set_materialized_crs([crs])
+        materialized_pages = get_pages()
+    finally:
+        set_materialized_crs([])
+    
+    for transformed_page, materialized_page in zip(transformed_pages, materialized_pages):
+        assert [feature["id"] for feature in transformed_page["features"]] == [feature["id"] for feature in materialized_page["features"]]
+        for transformed_feature, materialized_feature in zip(transformed_page["features"], materialized_page["features"]):
+            assert transformed_feature["geometry"] == materialized_feature["geometry"]
+
+def test_get_features_properties(client: TestClient, headers: httpx.Headers):
+    """Test case for get_features with the properties and skipGeometry parameters"""
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10})
+    assert response.status_code == 200
+    features = response.json()["features"]
+    property_name = next(iter(features[0]["properties"]))
+    
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10, "properties": property_name, "skipGeometry": "true"})
+    assert response.status_code == 200
+    projected_features = response.json()["features"]
+    assert [feature["id"] for feature in projected_features] == [feature["id"] for feature in features]
+    for feature, projected_feature in zip(features, projected_features):
+        assert projected_feature["geometry"] is None
+        assert projected_feature["properties"] == {property_name: feature["properties"][property_name]}
+    
+    response = client.request("GET", f"/collections/{collection_id}/items/{features[0]['id']}", headers=headers, params={"properties": property_name, "skipGeometry": "true"})
+    assert response.status_code == 200
+    assert response.json()["geometry"] is None
+    assert response.json()["properties"] == {property_name: features[0]["properties"][property_name]}
+    
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"properties": "unknown_property"})
+    assert response.status_code == 400
+
+def test_get_features_coordinate_precision(client: TestClient, headers: httpx.Headers):
+    """Test case for get_features and get_feature with the coordinate-precision parameter"""
+    
+    headers.update({
+    })
+    
+    def count_decimals(value: float) -> int:
+        text = repr(value)
+        return len(text.split(".", 1)[1]) if "." in text and "e" not in text else 0
+    
+    collection_id = "verwaltungsgrenzen"
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10})
+    assert response.status_code == 200
+    full_features = response.json()["features"]
+    
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10, "coordinate-precision": 2})
+    assert response.status_code == 200
+    rounded_features = response.json()["features"]
+    
+    for full_feature, rounded_feature in zip(full_features, rounded_features):
+        rounded_coordinates = flatten_coordinates(rounded_feature["geometry"]["coordinates"])
+        assert all(count_decimals(value) <= 2 for value in rounded_coordinates)
+        assert rounded_coordinates == pytest.approx(flatten_coordinates(full_feature["geometry"]["coordinates"]), abs=0.01)
+    
+    response = client.request("GET", f"/collections/{collection_id}/items/{full_features[0]['id']}", headers=headers, params={"coordinate-precision": 2})
+    assert response.status_code == 200
+    assert all(count_decimals(value) <= 2 for value in flatten_coordinates(response.json()["geometry"]["coordinates"]))
+    
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"coordinate-precision": 16})
+    assert response.status_code == 400
+
+def test_get_features_generalization(client: TestClient, headers: httpx.Headers):
+    """Test case for get_features with the scale-denominator and zoom-level parameters, which select a pre-generalized level of the collection"""
+    
+    from server.ogc_apis.features.implementation.dynamic import feature as feature_impl, generalized_geometry
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    level = 1000000.0
+    with DatabaseSession() as session:
+        collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+        collection_uuid, dataset_path, dataset_type, layer_name = collection.uuid, collection.dataset.path, collection.dataset.type, collection.layer_name
+    
+    def set_levels(levels: Optional[list[float]]) -> None:
+        with DatabaseSession() as session:
+            collection = session.exec(select(models.CollectionTable).where(models.CollectionTable.id == collection_id)).one()
+            collection.generalization_json = levels
+            collection.generalization_ready_json = levels
+            session.add(collection)
+            session.commit()
+        feature_impl.invalidate_collection_caches(collection_id)
+    
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10})
+    assert response.status_code == 200
+    full_features = response.json()["features"]
+    
+    try:
+        generalized_geometry.build_level(dataset_path, dataset_type, layer_name, collection_uuid, level)
+        set_levels([level])
+        
+        response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10, "scale-denominator": 5 * level})
+        assert response.status_code == 200
+        generalized_features = response.json()["features"]
+        
+        # Requests at a finer scale than the level are answered in full resolution
+        response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"limit": 10, "scale-denominator": level / 2})
+        assert response.status_code == 200
+        assert response.json()["features"] == full_features
+    finally:
+        set_levels(None)
+        generalized_geometry.drop_levels(dataset_path, dataset_type, layer_name, collection_uuid, [level])
+    
+    assert [feature["id"] for feature in generalized_features] == [feature["id"] for feature in full_features]
+    for full_feature, generalized_feature in zip(full_features, generalized_features):
+        assert generalized_feature["properties"] == full_feature["properties"]
+        assert len(flatten_coordinates(generalized_feature["geometry"]["coordinates"])) <= len(flatten_coordinates(full_feature["geometry"]["coordinates"]))
+    assert len(orjson.dumps(generalized_features)) < len(orjson.dumps(full_features))
+    
+    response = client.request("GET", f"/collections/{collection_id}/items", headers=headers, params={"scale-denominator": level, "zoom-level": 5})
+    assert response.status_code == 400
+
+def test_get_features_dataset_pool(client: TestClient, headers: httpx.Headers):
+    """Test case for the reuse of opened datasets between requests"""
+    
+    from server.utils import gdal_utils
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    response = client.request("GET", f"/collections/{collection_id}/items?limit=10", headers=headers)
+    assert response.status_code == 200
+    
+    stats_before = gdal_utils.DATASET_POOL.get_stats()
+    # Different pages, so the requests aren't answered from the response cache
+    for offset in range(1, 4):
+        response = client.request("GET", f"/collections/{collection_id}/items?limit=10&offset={offset}", headers=headers)
+        assert response.status_code == 200
+    stats_after = gdal_utils.DATASET_POOL.get_stats()
+    
+    assert stats_after["checked_out"] == 0
+    assert stats_after["reused"] - stats_before["reused"] >= 3
+    assert stats_after["idle"] + stats_after["checked_out"] <= stats_after["max_handles"]
+
+def test_get_features_etag(client: TestClient, headers: httpx.Headers):
+    """Test case for the ETag of cached items responses"""
+    
+    headers.update({
+    })
+    
+    collection_id = "verwaltungsgrenzen"
+    response = client.request("GET", f"/collections/{collection_id}/items?limit=5", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    
+    response = client.request("GET", f"/collections/{collection_id}/items?limit=5", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+    
+    response = client.request("GET", f"/collections/{collection_id}/items?limit=5", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    
+    response = client.request("GET", f"/collections/{collection_id}/items?limit=5", headers={**headers, "If-None-Match": '"outdated"'})
+    assert response.status_code == 200
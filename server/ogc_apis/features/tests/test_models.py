@@ -0,0 +1,130 @@
+# coding: utf-8
+
+import copy
+import uuid
+
+import orjson
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, text
+
+from server.database import models
+from server.utils import cache_utils
+
+
+@pytest.fixture
+def session():
+    # An in-memory database, so the tests don't depend on (or change) the collections of the server
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+    engine.dispose()
+
+def create_collection(session: Session) -> models.CollectionTable:
+    dataset = models.Dataset(name="dataset", type=models.Dataset.Type.GPKG, path="/vsimem/dataset.gpkg")
+    session.add(dataset)
+    session.commit()
+
+    collection = models.CollectionTable(
+        id="collection",
+        layer_name="layer",
+        title="Collection",
+        links_json=[],
+        crs_json=["http://www.opengis.net/def/crs/OGC/1.3/CRS84"],
+        extent_json={"spatial": {"bbox": [[5.8, 47.2, 15.1, 55.1]]}},
+        dataset_uuid=dataset.uuid,
+    )
+    session.add(collection)
+    session.commit()
+    return collection
+
+def update_crs_json(session: Session, collection: models.CollectionTable, crs_list: list[str]) -> None:
+    # Changes the row behind the back of the instance (e.g. like another process)
+    session.execute(
+        text(f"UPDATE {models.CollectionTable.__tablename__} SET crs_json = :crs_json WHERE uuid = :uuid"),
+        {"crs_json": orjson.dumps(crs_list).decode("utf-8"), "uuid": collection.uuid.hex},
+    )
+
+def test_json_field_memoized(session: Session):
+    """Test case for the decoded value of a JSON field, which is decoded once and decoded again after it was set"""
+
+    collection = create_collection(session)
+    crs_list = collection.crs_json
+    assert crs_list == ["http://www.opengis.net/def/crs/OGC/1.3/CRS84"]
+    assert collection.crs_json is crs_list
+
+    collection.crs_json = ["http://www.opengis.net/def/crs/EPSG/0/4326"]
+    assert collection.crs_json == ["http://www.opengis.net/def/crs/EPSG/0/4326"]
+    assert collection.crs_json is collection.crs_json
+
+    # Strings are stored as they are
+    collection.crs_json = '["http://www.opengis.net/def/crs/EPSG/0/3857"]'
+    assert collection.crs_json == ["http://www.opengis.net/def/crs/EPSG/0/3857"]
+
+@pytest.mark.parametrize("reload", ["refresh", "expire"])
+def test_json_field_reloaded(session: Session, reload: str):
+    """Test case for the decoded value of a JSON field, which is decoded again after the instance was refreshed or expired"""
+
+    collection = create_collection(session)
+    assert collection.crs_json == ["http://www.opengis.net/def/crs/OGC/1.3/CRS84"]
+
+    update_crs_json(session, collection, ["http://www.opengis.net/def/crs/EPSG/0/25832"])
+    getattr(session, reload)(collection)
+    assert collection.crs_json == ["http://www.opengis.net/def/crs/EPSG/0/25832"]
+
+def test_json_field_frozen(session: Session):
+    """Test case for the decoded value of a JSON field, which is shared by all readers and thus read-only"""
+
+    collection = create_collection(session)
+    with pytest.raises(TypeError):
+        collection.crs_json.append("http://www.opengis.net/def/crs/EPSG/0/4326")
+    with pytest.raises(TypeError):
+        collection.extent_json["temporal"] = {}
+    with pytest.raises(TypeError):
+        collection.extent_json["spatial"]["bbox"][0][0] = 0.0
+
+    assert collection.crs_json == ["http://www.opengis.net/def/crs/OGC/1.3/CRS84"]
+    assert collection.extent_json == {"spatial": {"bbox": [[5.8, 47.2, 15.1, 55.1]]}}
+
+def test_freeze():
+    """Test case for cache_utils.freeze, whose values reject changes and are still serialized like dicts and lists"""
+
+    value = {"links": [{"href": "http://localhost"}], "count": 1}
+    frozen = cache_utils.freeze(value)
+    assert isinstance(frozen, dict) and isinstance(frozen["links"], list) and isinstance(frozen["links"][0], dict)
+    assert frozen == value
+    assert orjson.dumps(frozen) == orjson.dumps(value)
+
+    for change in [
+        lambda: frozen.update(count=2),
+        lambda: frozen.pop("count"),
+        lambda: frozen.setdefault("title", ""),
+        lambda: frozen.__setitem__("count", 2),
+        lambda: frozen.__delitem__("count"),
+        lambda: frozen["links"].append({}),
+        lambda: frozen["links"].extend([{}]),
+        lambda: frozen["links"].sort(),
+        lambda: frozen["links"][0].clear(),
+    ]:
+        with pytest.raises(TypeError):
+            change()
+
+    assert frozen == value
+
+def test_freeze_copy():
+    """Test case for copies of frozen values, which are mutable again"""
+
+    frozen = cache_utils.freeze({"links": [{"href": "http://localhost"}], "id": str(uuid.uuid4())})
+
+    mutable = copy.deepcopy(frozen)
+    assert mutable == frozen
+    assert type(mutable) is dict and type(mutable["links"]) is list and type(mutable["links"][0]) is dict
+    mutable["links"].append({"href": "http://localhost/items"})
+    mutable["links"][0]["rel"] = "self"
+    assert frozen["links"] == [{"href": "http://localhost"}]
+
+    shallow = copy.copy(frozen)
+    assert type(shallow) is dict
+    shallow["title"] = "Title"
+    assert "title" not in frozen
@@ -2,14 +2,17 @@ from contextlib import asynccontextmanager
 import os, time, logging
 
 import uvicorn
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.wsgi import WSGIMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 
 from server.database.db import Database
+from server.database import models, pg_pool
 import server.ogc_apis.features.main as features_api
+from server.ogc_apis.features.implementation.dynamic import collection_impl, materialized_geometry
 from server.config import get_logger_config
 from server.ogc_apis import ogc_api_config
+from server.utils import gdal_utils, metrics, worker_pool
 
 _LOGGER = logging.getLogger("server.api")
 
@@ -25,8 +28,18 @@ def init_main_api_server() -> FastAPI:
             logger.setLevel(logging.ERROR)
         
         Database.init_sqlite_db(False)
+        # Resolve the CRSs of all collections once, instead of on the first requests. The objects are kept per thread, so they are resolved
+        # in the event loop and in every GDAL worker, the WKTs are only resolved once.
+        collections = Database.select_sqlite_db(table_model=models.CollectionTable) or []
+        gdal_utils.warm_spatial_ref_registry(collections)
+        worker_pool.FEATURE_WORKER_POOL.run_on_all_workers(gdal_utils.warm_spatial_ref_registry, collections)
+        # Keeps the materialized views of the reprojected geometries up to date
+        refresh_task = materialized_geometry.start_refresh_task(collection_impl.COLLECTION_REGISTRY.get_all)
         yield
         _LOGGER.info("Stopping FastAPI server")
+        if refresh_task is not None:
+            refresh_task.cancel()
+        await pg_pool.close_pools()
     
     app = FastAPI(
         title="Implementation for the new OGC APIs",
@@ -62,6 +75,11 @@ def init_main_api_server() -> FastAPI:
             }
         ]
     
+    # Metrics in the Prometheus text format (e.g. saturation of the connection pools)
+    @app.get("/metrics", include_in_schema=False)
+    def get_metrics():
+        return Response(content=metrics.render_text(), media_type="text/plain; version=0.0.4")
+    
     if os.getenv("APP_DEBUG_MODE", "False") == "True":
         _LOGGER.warning("Disabling CORS")
         app.add_middleware(
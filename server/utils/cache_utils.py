@@ -0,0 +1,125 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+class LRUCache(object):
+    """
+    Thread-safe least recently used cache with an optional time to live for the entries.\n
+    The cache is bounded by the number of entries and optionally by the summed size of the entries (see size_of).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, max_size: Optional[int] = None, size_of: Optional[Callable[[Any], int]] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be greater than 0")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size_of = size_of if size_of is not None else (lambda value: 1)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        # key -> (value, size, expires_at)
+        self._entries: OrderedDict[Hashable, tuple[Any, int, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.size_of(value)
+        # Values bigger than the whole cache are never stored
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, size, expires_at)
+            self.size += size
+
+            while len(self._entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Remove all entries or only the entries, whose key matches the predicate. Returns the number of removed entries."""
+
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                self._remove(key)
+
+            return len(keys)
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+def _raise_frozen(self, *args, **kwargs):
+    raise TypeError(f"'{type(self).__name__}' is read-only, since it is shared by all readers of the cached value")
+
+class FrozenDict(dict):
+    """Read-only dict for cached values, which are handed out to several callers. Serializers treat it like a dict."""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _raise_frozen
+    clear = pop = popitem = setdefault = update = _raise_frozen
+
+    def __reduce__(self):
+        # Copies (copy.copy, copy.deepcopy) are mutable again
+        return (dict, (dict(self),))
+
+class FrozenList(list):
+    """Read-only list for cached values, which are handed out to several callers. Serializers treat it like a list."""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _raise_frozen
+    append = extend = insert = remove = pop = clear = sort = reverse = _raise_frozen
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+def freeze(value: Any) -> Any:
+    """Convert decoded JSON recursively into FrozenDict and FrozenList. Use copy.deepcopy for a mutable copy."""
+
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+
+    return value
@@ -1,10 +1,16 @@
+from collections import OrderedDict
 from enum import Enum
+import os
 import re
+import threading
+import time
+from typing import Optional
 from osgeo import gdal, osr
 import pyproj
 import sqlmodel
 
 from server.database.models import CollectionTable
+from server.utils import cache_utils, metrics
 
 gdal.UseExceptions()
 
@@ -32,50 +38,247 @@ def get_urn_of_spatial_ref(spatial_ref: osr.SpatialReference) -> str:
     
     return f"urn:ogc:def:crs:{authority}::{code}"
 
+def _resolve_wkt(ressource: str) -> str:
+    if ressource.startswith("http"):
+        try:
+            authority, code = re.findall(r"http://www.opengis.net/def/crs/(\w+)/[\d.]+/(.+)", ressource)[0]
+            return pyproj.CRS.from_authority(authority, code).to_wkt()
+        except Exception:
+            raise ValueError("URI format is invalid or does not contain authority and code")
+    elif ressource.startswith("urn"):
+        try:
+            authority, code = re.findall(r"urn:ogc:def:crs:(\w+):[\d.]*:(.+)", ressource)[0]
+            return pyproj.CRS.from_authority(authority, code).to_wkt()
+        except Exception:
+            raise ValueError("URN format is invalid or does not contain authority and code")
+    else:
+        raise ValueError("Resource must be a valid URI or URN")
+
+class BulkTransformation(object):
+    """
+    pyproj Transformer between two spatial references, which transforms the coordinates of a whole page with one call.\n
+    The coordinates are given in the data axis order of the source (e.g. the traditional GIS order of an OGR layer). They are reordered
+    to the axis order of the source CRS for PROJ and afterwards into the data axis order of the target, like osr.CoordinateTransformation does.
+    """
+
+    __slots__ = ("transformer", "source_axes", "target_axes", "epoch")
+
+    def __init__(self, transformer: pyproj.Transformer, source_axes: list[int], target_axes: list[int], epoch: Optional[float] = None):
+        self.transformer = transformer
+        # 1-based CRS axis of every data axis, negative for inverted axes (see osr.SpatialReference.GetDataAxisToSRSAxisMapping)
+        self.source_axes = source_axes
+        self.target_axes = target_axes
+        self.epoch = epoch
+
+    def transform(self, coordinates) -> None:
+        """Transform the positions of a (n, 3) NumPy array (x, y, z per row) in place."""
+
+        if len(coordinates) == 0:
+            return
+
+        # Data axis order of the source -> axis order of the source CRS
+        axes = [coordinates[:, 0], coordinates[:, 1], coordinates[:, 2]]
+        crs_axes = axes.copy()
+        for data_axis, crs_axis in enumerate(self.source_axes[:3]):
+            crs_axes[abs(crs_axis) - 1] = axes[data_axis] if crs_axis > 0 else -axes[data_axis]
+
+        time = None
+        if self.epoch:
+            time = crs_axes[0].copy()
+            time.fill(self.epoch)
+
+        crs_axes = self.transformer.transform(*crs_axes, time, errcheck=False)[:3]
+
+        # Axis order of the target CRS -> data axis order of the target
+        for data_axis, crs_axis in enumerate(self.target_axes[:3]):
+            values = crs_axes[abs(crs_axis) - 1]
+            coordinates[:, data_axis] = values if crs_axis > 0 else -values
+
+class SpatialRefRegistry(object):
+    """
+    Memoized resolution of coordinate reference systems (URI or URN) and their transformations.\n
+    The WKT of a CRS is shared by all threads. SpatialReference and CoordinateTransformation objects aren't thread-safe,
+    so they are kept per thread (e.g. per GDAL worker) and must not be modified by the caller.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._wkt_cache = cache_utils.LRUCache(max_entries=max_entries)
+        # WKT as exported by GDAL (e.g. shown on the HTML pages), which differs from the WKT of PROJ
+        self._exported_wkt_cache = cache_utils.LRUCache(max_entries=max_entries)
+        self._local = threading.local()
+
+    def _get_local_cache(self, name: str) -> OrderedDict:
+        cache = getattr(self._local, name, None)
+        if cache is None:
+            cache = OrderedDict()
+            setattr(self._local, name, cache)
+        return cache
+
+    def _put_local(self, cache: OrderedDict, key: tuple | str, value: object) -> None:
+        cache[key] = value
+        if len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def get_wkt(self, ressource: str) -> str:
+        """Get the WKT of a coordinate reference system URI or URN.
+
+        Raises:
+            ValueError: If the resource is no valid URI or URN or the CRS is unknown.
+        """
+
+        if ressource is None:
+            raise ValueError("Resource is None")
+
+        wkt = self._wkt_cache.get(ressource)
+        if wkt is None:
+            wkt = _resolve_wkt(ressource)
+            self._wkt_cache.set(ressource, wkt)
+
+        return wkt
+
+    def get_exported_wkt(self, ressource: str) -> str:
+        """Get the WKT of the SpatialReference of a coordinate reference system URI or URN (same errors as `get_wkt`)."""
+
+        wkt = self._exported_wkt_cache.get(ressource)
+        if wkt is None:
+            wkt = self.get_spatial_ref(ressource).ExportToWkt()
+            self._exported_wkt_cache.set(ressource, wkt)
+
+        return wkt
+
+    def get_spatial_ref(self, ressource: str) -> osr.SpatialReference:
+        """Get the SpatialReference of a coordinate reference system URI or URN (same errors as `get_wkt`)."""
+
+        cache = self._get_local_cache("spatial_refs")
+        spatial_ref = cache.get(ressource)
+        if spatial_ref is None:
+            spatial_ref = osr.SpatialReference(self.get_wkt(ressource))
+            self._put_local(cache, ressource, spatial_ref)
+        else:
+            cache.move_to_end(ressource)
+
+        return spatial_ref
+
+    @staticmethod
+    def _get_key(spatial_ref: osr.SpatialReference | str) -> tuple | str:
+        if isinstance(spatial_ref, str):
+            return spatial_ref
+
+        # The axis mapping and epoch are part of the key, since a layer may use another axis order than the WKT of its CRS
+        return (spatial_ref.ExportToWkt(), spatial_ref.GetAxisMappingStrategy(), tuple(spatial_ref.GetDataAxisToSRSAxisMapping()), spatial_ref.GetCoordinateEpoch())
+
+    def get_transformation(self, source: osr.SpatialReference | str, target: osr.SpatialReference | str) -> osr.CoordinateTransformation:
+        """Get the transformation between two spatial references, given as SpatialReference or URI/URN."""
+
+        key = (self._get_key(source), self._get_key(target))
+        cache = self._get_local_cache("transformations")
+        transformation = cache.get(key)
+        if transformation is None:
+            source_spatial_ref = self.get_spatial_ref(source) if isinstance(source, str) else source
+            target_spatial_ref = self.get_spatial_ref(target) if isinstance(target, str) else target
+            transformation = osr.CoordinateTransformation(source_spatial_ref, target_spatial_ref)
+            self._put_local(cache, key, transformation)
+        else:
+            cache.move_to_end(key)
+
+        return transformation
+
+    def get_bulk_transformation(self, source: osr.SpatialReference | str, target: osr.SpatialReference | str) -> BulkTransformation:
+        """Get the pyproj transformation of whole coordinate arrays between two spatial references, given as SpatialReference or URI/URN."""
+
+        key = (self._get_key(source), self._get_key(target))
+        cache = self._get_local_cache("bulk_transformations")
+        transformation = cache.get(key)
+        if transformation is None:
+            source_spatial_ref = self.get_spatial_ref(source) if isinstance(source, str) else source
+            target_spatial_ref = self.get_spatial_ref(target) if isinstance(target, str) else target
+
+            def to_crs(spatial_ref: osr.SpatialReference, ressource: osr.SpatialReference | str) -> pyproj.CRS:
+                wkt = self.get_wkt(ressource) if isinstance(ressource, str) else spatial_ref.ExportToWkt(["FORMAT=WKT2_2019"])
+                return pyproj.CRS.from_wkt(wkt)
+
+            # Without always_xy, PROJ expects and returns the axis order of the CRS definitions
+            transformer = pyproj.Transformer.from_crs(to_crs(source_spatial_ref, source), to_crs(target_spatial_ref, target), always_xy=False)
+            transformation = BulkTransformation(
+                transformer,
+                list(source_spatial_ref.GetDataAxisToSRSAxisMapping()),
+                list(target_spatial_ref.GetDataAxisToSRSAxisMapping()),
+                source_spatial_ref.GetCoordinateEpoch() or None,
+            )
+            self._put_local(cache, key, transformation)
+        else:
+            cache.move_to_end(key)
+
+        return transformation
+
+    def warm(self, ressources: list[str], pairs: Optional[list[tuple[str, str]]] = None) -> None:
+        """Resolve the coordinate reference systems and transformations in advance (e.g. of all collections at startup). \n
+        Only the WKTs are shared with all threads, the SpatialReference and CoordinateTransformation objects are only kept for the calling thread,
+        so it is called in every thread, which serves requests (see WorkerPool.run_on_all_workers). Invalid resources are skipped.
+        """
+
+        for ressource in ressources:
+            try:
+                self.get_spatial_ref(ressource)
+            except ValueError:
+                continue
+
+        for source, target in pairs or []:
+            try:
+                self.get_transformation(source, target)
+            except (ValueError, RuntimeError):
+                continue
+
+SPATIAL_REF_REGISTRY = SpatialRefRegistry(max_entries=int(os.getenv("APP_CRS_REGISTRY_SIZE", "256")))
+
+metrics.register_cache("crs_wkt", SPATIAL_REF_REGISTRY._wkt_cache)
+
 def get_spatial_ref_from_uri(uri: str) -> osr.SpatialReference:
     if uri is None:
         raise TypeError("URI is None")
     
-    try:
-        authority, code = re.findall(r"http://www.opengis.net/def/crs/(\w+)/[\d.]+/(.+)", uri)[0]
-        wkt = pyproj.CRS.from_authority(authority, code).to_wkt()
-        spatial_ref = osr.SpatialReference(wkt)
-
-        return spatial_ref
-    except Exception:
+    if not uri.startswith("http"):
         raise ValueError("URI format is invalid or does not contain authority and code")
+    
+    return SPATIAL_REF_REGISTRY.get_spatial_ref(uri)
 
 def get_spatial_ref_from_ressource(ressource: str) -> osr.SpatialReference:
     if ressource is None:
         raise ValueError("Resource is None")
 
-    if ressource.startswith("http"):
-        return get_spatial_ref_from_uri(ressource)
-    elif ressource.startswith("urn"):
-        return get_spatial_ref_from_urn(ressource)
-    else:
-        raise ValueError("Resource must be a valid URI or URN")
+    return SPATIAL_REF_REGISTRY.get_spatial_ref(ressource)
 
 def get_spatial_ref_from_urn(urn: str) -> osr.SpatialReference:
     if urn is None:
         raise TypeError("URN is None")
     
-    try:
-        authority, code = re.findall(r"urn:ogc:def:crs:(\w+):[\d.]*:(.+)", urn)[0]
-        wkt = pyproj.CRS.from_authority(authority, code).to_wkt()
-        spatial_ref = osr.SpatialReference(wkt)
-
-        return spatial_ref
-    except Exception:
+    if not urn.startswith("urn"):
         raise ValueError("URN format is invalid or does not contain authority and code")
+    
+    return SPATIAL_REF_REGISTRY.get_spatial_ref(urn)
 
 def get_wkt_from_uri(uri: str) -> str:
     if uri is None:
         raise TypeError("URI is None")
     
-    spatial_ref = get_spatial_ref_from_uri(uri)
+    if not uri.startswith("http"):
+        raise ValueError("URI format is invalid or does not contain authority and code")
     
-    return spatial_ref.ExportToWkt()
+    return SPATIAL_REF_REGISTRY.get_exported_wkt(uri)
+
+def warm_spatial_ref_registry(collections: list[CollectionTable]) -> None:
+    """Resolve the CRSs of all collections and the transformations from their storage CRS in advance."""
+    
+    ressources = set()
+    pairs = set()
+    for collection in collections:
+        crs_list = collection.crs_json or []
+        ressources.update(crs_list)
+        ressources.add(collection.storage_crs)
+        pairs.update((collection.storage_crs, crs) for crs in crs_list if crs != collection.storage_crs)
+    
+    SPATIAL_REF_REGISTRY.warm(sorted(ressources), sorted(pairs))
     
 def transform_extent(source_spatial_ref: osr.SpatialReference | str, target_spatial_ref: osr.SpatialReference | str, extent: list[float], input_gdal_format: bool = True, return_gdal_format: bool = True) -> list[float]:
     """
@@ -131,11 +334,248 @@ def transform_extent(source_spatial_ref: osr.SpatialReference | str, target_spat
     else:
         return extent_transformed
 
+class _PooledHandle(object):
+    __slots__ = ("key", "dataset", "modified_time", "last_used", "generation")
+    
+    def __init__(self, key: tuple, dataset: gdal.Dataset, modified_time: Optional[float], generation: tuple[int, int]):
+        self.key = key
+        self.dataset = dataset
+        self.modified_time = modified_time
+        self.last_used = time.monotonic()
+        self.generation = generation
+
+class DatasetPool(object):
+    """
+    Pool of opened GDAL datasets keyed by (dataset path, open options, flags).\n
+    A handle is lent to exactly one thread at a time (instead of OF_SHARED, whose handles aren't safe across threads), so opening the dataset, 
+    the connection and the catalog introspection of databases are paid only once per handle. Idle handles are evicted least recently used first 
+    or after the idle timeout. Handles, which were idle longer than the health check interval, are health-checked before they are lent again,
+    recently used ones are trusted (a failing request discards its handle).
+    """
+    
+    def __init__(self, max_handles: int = 32, idle_timeout: float = 300, checkout_timeout: float = 30, health_check_interval: float = 30):
+        self.max_handles = max_handles
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        
+        # Least recently used idle handle first
+        self._idle: OrderedDict[int, _PooledHandle] = OrderedDict()
+        self._checked_out: dict[int, _PooledHandle] = {}
+        self._condition = threading.Condition()
+        # Raised by `clear`, so handles, which were lent during a clear, are closed on checkin instead of being lent again
+        self._generation = 0
+        self._dataset_generations: dict[str, int] = {}
+        
+        self.opened = 0
+        self.reused = 0
+        self.evicted = 0
+        self.discarded = 0
+        self.waits = 0
+    
+    @staticmethod
+    def _get_modified_time(dataset_desc: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(dataset_desc)
+        except (OSError, TypeError):
+            return None
+    
+    def _is_healthy(self, handle: _PooledHandle) -> bool:
+        dataset_desc = handle.key[0]
+        # Files, which were changed after opening, are opened again
+        if handle.modified_time is not None and self._get_modified_time(dataset_desc) != handle.modified_time:
+            return False
+        
+        # The check costs a round trip to databases, so it's skipped for recently used handles
+        if time.monotonic() - handle.last_used < self.health_check_interval:
+            return True
+        
+        try:
+            if handle.dataset.GetDriver().GetName() == "PostgreSQL":
+                result = handle.dataset.ExecuteSQL("SELECT 1")
+                handle.dataset.ReleaseResultSet(result)
+            else:
+                handle.dataset.GetLayerCount()
+        except RuntimeError:
+            return False
+        
+        return True
+    
+    def _get_generation(self, dataset_desc: str) -> tuple[int, int]:
+        return (self._generation, self._dataset_generations.get(dataset_desc, 0))
+    
+    def _remove_expired(self) -> list[_PooledHandle]:
+        expired_before = time.monotonic() - self.idle_timeout
+        expired = [handle for handle in self._idle.values() if handle.last_used < expired_before]
+        for handle in expired:
+            del self._idle[id(handle)]
+        
+        self.evicted += len(expired)
+        return expired
+    
+    def checkout(self, dataset_desc: str, dataset_open_options: dict[str, str], flags: int) -> gdal.Dataset:
+        """Lend an opened dataset to the calling thread. It has to be returned with `checkin`.
+
+        Raises:
+            RuntimeError: If no handle became available within the checkout timeout or the dataset can't be opened.
+        """
+        
+        key = (dataset_desc, tuple(sorted(dataset_open_options.items())), flags)
+        deadline = time.monotonic() + self.checkout_timeout
+        
+        while True:
+            closing = []
+            handle = None
+            with self._condition:
+                closing.extend(self._remove_expired())
+                
+                # Most recently used handle of the key first, since it most likely still has a warm connection
+                for candidate in reversed(self._idle.values()):
+                    if candidate.key == key:
+                        handle = candidate
+                        break
+                
+                if handle is not None:
+                    del self._idle[id(handle)]
+                    self._checked_out[id(handle)] = handle
+                elif len(self._idle) + len(self._checked_out) < self.max_handles or len(self._idle) > 0:
+                    # Make room by closing the least recently used idle handle of another dataset
+                    if len(self._idle) + len(self._checked_out) >= self.max_handles:
+                        _, evicted_handle = self._idle.popitem(last=False)
+                        closing.append(evicted_handle)
+                        self.evicted += 1
+                    
+                    # Reserve the slot, while the dataset is opened outside of the lock
+                    handle = _PooledHandle(key, None, self._get_modified_time(dataset_desc), self._get_generation(dataset_desc))
+                    self._checked_out[id(handle)] = handle
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RuntimeError(f"No dataset handle available within {self.checkout_timeout} seconds (maximum {self.max_handles} handles)")
+                    
+                    self.waits += 1
+                    self._condition.wait(remaining)
+                    continue
+            
+            # Closing the datasets happens without the lock, since it can take some time (e.g. closing database connections)
+            for closing_handle in closing:
+                closing_handle.dataset = None
+            
+            if handle.dataset is None:
+                try:
+                    handle.dataset = gdal.OpenEx(dataset_desc, flags, open_options=dataset_open_options)
+                except Exception:
+                    self._release(handle)
+                    raise
+                
+                with self._condition:
+                    self.opened += 1
+                return handle.dataset
+            
+            if self._is_healthy(handle):
+                with self._condition:
+                    self.reused += 1
+                return handle.dataset
+            
+            # Discard the broken handle and try again
+            with self._condition:
+                self.discarded += 1
+            self._release(handle)
+    
+    def checkin(self, dataset: gdal.Dataset) -> None:
+        """Return a lent dataset to the pool."""
+        
+        with self._condition:
+            handle = next((handle for handle in self._checked_out.values() if handle.dataset is dataset), None)
+            if handle is None:
+                return
+            
+            del self._checked_out[id(handle)]
+            self._condition.notify()
+            
+            # The dataset was cleared while it was lent, so it may still have the old layer definitions
+            is_stale = handle.generation != self._get_generation(handle.key[0])
+            if not is_stale:
+                handle.last_used = time.monotonic()
+                self._idle[id(handle)] = handle
+        
+        if is_stale:
+            handle.dataset = None
+    
+    def discard(self, dataset: gdal.Dataset) -> None:
+        """Close a lent dataset instead of returning it to the pool (e.g. after it failed, so its state is unknown)."""
+        
+        with self._condition:
+            handle = next((handle for handle in self._checked_out.values() if handle.dataset is dataset), None)
+            if handle is None:
+                return
+            
+            self.discarded += 1
+        self._release(handle)
+    
+    def _release(self, handle: _PooledHandle) -> None:
+        with self._condition:
+            self._checked_out.pop(id(handle), None)
+            self._condition.notify()
+        
+        handle.dataset = None
+    
+    def clear(self, dataset_desc: Optional[str] = None) -> None:
+        """Close all handles or only the handles of a dataset (e.g. after the dataset was changed). Lent handles are closed on checkin."""
+        
+        with self._condition:
+            if dataset_desc is None:
+                self._generation += 1
+            else:
+                self._dataset_generations[dataset_desc] = self._dataset_generations.get(dataset_desc, 0) + 1
+            
+            closing = [handle for handle in self._idle.values() if dataset_desc is None or handle.key[0] == dataset_desc]
+            for handle in closing:
+                del self._idle[id(handle)]
+        
+        for handle in closing:
+            handle.dataset = None
+    
+    def get_stats(self) -> dict[str, int]:
+        with self._condition:
+            return {
+                "idle": len(self._idle),
+                "checked_out": len(self._checked_out),
+                "max_handles": self.max_handles,
+                "opened": self.opened,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "discarded": self.discarded,
+                "waits": self.waits,
+            }
+
+DATASET_POOL = DatasetPool(
+    max_handles=int(os.getenv("APP_GDAL_POOL_MAX_HANDLES", "32")),
+    idle_timeout=float(os.getenv("APP_GDAL_POOL_IDLE_TIMEOUT", "300")),
+    checkout_timeout=float(os.getenv("APP_GDAL_POOL_CHECKOUT_TIMEOUT", "30")),
+    health_check_interval=float(os.getenv("APP_GDAL_POOL_HEALTH_CHECK_INTERVAL", "30")),
+)
+
+def _collect_dataset_pool_metrics() -> list[metrics.MetricFamily]:
+    stats = DATASET_POOL.get_stats()
+    return [
+        ("mapsage_gdal_pool_handles_idle", "gauge", "Number of opened GDAL datasets waiting in the pool", [({}, stats["idle"])]),
+        ("mapsage_gdal_pool_handles_checked_out", "gauge", "Number of GDAL datasets currently lent to requests", [({}, stats["checked_out"])]),
+        ("mapsage_gdal_pool_max_handles", "gauge", "Maximum number of opened GDAL datasets", [({}, stats["max_handles"])]),
+        ("mapsage_gdal_pool_opened_total", "counter", "Number of opened GDAL datasets", [({}, stats["opened"])]),
+        ("mapsage_gdal_pool_reused_total", "counter", "Number of checkouts served by an already opened GDAL dataset", [({}, stats["reused"])]),
+        ("mapsage_gdal_pool_evicted_total", "counter", "Number of idle GDAL datasets closed by LRU eviction or idle timeout", [({}, stats["evicted"])]),
+        ("mapsage_gdal_pool_discarded_total", "counter", "Number of GDAL datasets closed by a failed health check or request", [({}, stats["discarded"])]),
+        ("mapsage_gdal_pool_waits_total", "counter", "Number of checkouts, which had to wait for a free handle", [({}, stats["waits"])]),
+    ]
+
+metrics.register_collector("gdal_pool", _collect_dataset_pool_metrics)
+
 class DatasetWrapper(object):    
     dataset_desc: gdal.Dataset
     dataset_open_options: dict[str, str]
     dataset_type = Enum("DatasetType", "VECTOR RASTER")
-    _flags = gdal.OF_VERBOSE_ERROR | gdal.OF_SHARED | gdal.OF_READONLY
+    _flags = gdal.OF_VERBOSE_ERROR | gdal.OF_READONLY
     
     def __init__(self, dataset_desc: str, dataset_open_options: dict[str, str], dataset_type: dataset_type = dataset_type.VECTOR):
         self.dataset_desc = dataset_desc
@@ -144,11 +584,17 @@ class DatasetWrapper(object):
         
     def __enter__(self):
         self._flags |= gdal.OF_VECTOR if self.dataset_type == self.dataset_type.VECTOR else gdal.OF_RASTER
-        self.ds: gdal.Dataset = gdal.OpenEx(self.dataset_desc, self._flags, open_options=self.dataset_open_options)
+        self.ds: gdal.Dataset = DATASET_POOL.checkout(self.dataset_desc, self.dataset_open_options, self._flags)
         return self.ds
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # Close dataset with garbage collection, by removing reference
+        # Return the dataset to the pool instead of closing it, the health check on the next checkout catches broken handles
+        # The layers keep their state (filters, ignored fields, read cursor) between requests, so datasets, which failed in the middle of a
+        # request, are closed instead. Invalid parameters (ValueError) are rejected before the layers are changed.
+        if exc_type is not None and not issubclass(exc_type, ValueError):
+            DATASET_POOL.discard(self.ds)
+        else:
+            DATASET_POOL.checkin(self.ds)
         self.ds = None
         return False
 
@@ -0,0 +1,173 @@
+from email.utils import formatdate, parsedate_to_datetime
+import gzip
+import hashlib
+import threading
+import time
+from typing import Optional
+
+from fastapi import Request, Response
+import orjson
+
+from server.utils import cache_utils
+
+# Brotli is optional, without it only gzip variants are offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# Rendered documents per template, one per base URL (host) the server is accessed with
+MAX_BASE_URLS = 16
+
+def get_etag(content: bytes) -> str:
+    """Strong ETag of an encoded response body"""
+
+    return '"' + hashlib.blake2b(content, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether the ETag matches one of the entity tags of an If-None-Match header (weak comparison as required by RFC 9110)"""
+
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def get_base_url(request: Request) -> str:
+    """Base URL of the request without trailing slash, which replaces the base URL placeholder of the pre-rendered documents"""
+
+    return str(request.base_url).rstrip("/")
+
+def get_accepted_encodings(accept_encoding: Optional[str]) -> set[str]:
+    """The content codings of an Accept-Encoding header, which are not excluded with q=0"""
+
+    if not accept_encoding:
+        return set()
+
+    encodings = set()
+    for part in accept_encoding.split(","):
+        coding, _, parameters = part.strip().partition(";")
+        parameters = parameters.replace(" ", "")
+        if parameters.startswith("q=") and parameters[2:].strip("0.") == "":
+            continue
+
+        encodings.add(coding.strip().lower())
+
+    return encodings
+
+class RenderedDocument(object):
+    """
+    Final bytes of a document, which is served unchanged until it is rendered again (e.g. the pre-rendered landing page).\n
+    The ETag and Last-Modified are computed once, the gzip and brotli variants on first request and then kept with the document.
+    """
+
+    __slots__ = ("content", "media_type", "etag", "last_modified", "_encoded", "_lock")
+
+    def __init__(self, content: bytes, media_type: str = "application/json", last_modified: Optional[float] = None):
+        self.content = content
+        self.media_type = media_type
+        self.etag = get_etag(content)
+        # HTTP dates have a resolution of seconds
+        self.last_modified = int(last_modified if last_modified is not None else time.time())
+        self._encoded: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get_encoded(self, encoding: str) -> bytes:
+        encoded = self._encoded.get(encoding, None)
+        if encoded is not None:
+            return encoded
+
+        with self._lock:
+            encoded = self._encoded.get(encoding, None)
+            if encoded is None:
+                if encoding == "br":
+                    encoded = brotli.compress(self.content, quality=BROTLI_QUALITY)
+                elif encoding == "gzip":
+                    encoded = gzip.compress(self.content, compresslevel=GZIP_LEVEL, mtime=0)
+                else:
+                    raise ValueError(f"Unsupported content coding '{encoding}'")
+
+                self._encoded[encoding] = encoded
+
+        return encoded
+
+    def select_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        if len(self.content) < COMPRESSION_MIN_SIZE:
+            return None
+
+        accepted = get_accepted_encodings(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+
+        return None
+
+    def is_not_modified(self, request: Request, etag: str) -> bool:
+        """Whether the client already has this version, If-Modified-Since is only evaluated without If-None-Match (RFC 9110)"""
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since is None:
+            return False
+
+        try:
+            return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def response(self, request: Request, headers: Optional[dict[str, str]] = None) -> Response:
+        """Answer with the variant accepted by the client, or with 304 if the client already has this version."""
+
+        encoding = self.select_encoding(request.headers.get("Accept-Encoding"))
+        # Every variant needs its own strong ETag
+        etag = self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+        headers = {
+            **(headers or {}),
+            "ETag": etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Vary": "Accept-Encoding",
+        }
+
+        if self.is_not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding is None:
+            return Response(status_code=200, content=self.content, media_type=self.media_type, headers=headers)
+
+        headers["Content-Encoding"] = encoding
+        return Response(status_code=200, content=self.get_encoded(encoding), media_type=self.media_type, headers=headers)
+
+class DocumentTemplate(object):
+    """
+    Document with a placeholder for the base URL, which is rendered into a RenderedDocument per base URL.\n
+    The document is split at the placeholder once, so rendering only joins the parts with the base URL.
+    The rendered documents are kept in a small LRU cache, so each host keeps its ETag and compressed variants.
+    """
+
+    __slots__ = ("content", "media_type", "last_modified", "_parts", "_documents")
+
+    def __init__(self, content: bytes, placeholder: str, media_type: str = "application/json", last_modified: Optional[float] = None):
+        self.content = content
+        self.media_type = media_type
+        self.last_modified = last_modified if last_modified is not None else time.time()
+        self._parts = content.split(orjson.dumps(placeholder)[1:-1])
+        self._documents = cache_utils.LRUCache(max_entries=MAX_BASE_URLS)
+
+    def render(self, base_url: str) -> RenderedDocument:
+        document = self._documents.get(base_url, None)
+        if document is None:
+            # The base URL is escaped for a JSON string like the placeholder
+            document = RenderedDocument(orjson.dumps(base_url)[1:-1].join(self._parts), self.media_type, self.last_modified)
+            self._documents.set(base_url, document)
+
+        return document
@@ -0,0 +1,69 @@
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+# A collector returns metric families as (name, type, help, samples), where samples are (labels, value) tuples
+MetricFamily = tuple[str, str, str, list[tuple[dict[str, str], float]]]
+
+_COLLECTORS: dict[str, Callable[[], Iterable[MetricFamily]]] = {}
+_LOCK = threading.Lock()
+
+def register_collector(name: str, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+    """Register (or replace) a collector, which is called every time the metrics are rendered."""
+
+    with _LOCK:
+        _COLLECTORS[name] = collector
+
+def unregister_collector(name: str) -> None:
+    with _LOCK:
+        _COLLECTORS.pop(name, None)
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_sample(name: str, labels: Optional[dict[str, str]], value: float) -> str:
+    if labels:
+        label_string = ",".join(f'{key}="{_escape_label_value(label_value)}"' for key, label_value in labels.items())
+        return f"{name}{{{label_string}}} {value}"
+
+    return f"{name} {value}"
+
+def render_text() -> str:
+    """Render the metrics of all registered collectors in the Prometheus text exposition format."""
+
+    with _LOCK:
+        collectors = list(_COLLECTORS.values())
+
+    families: dict[str, MetricFamily] = {}
+    for collector in collectors:
+        for name, metric_type, help_text, samples in collector():
+            if name in families:
+                families[name][3].extend(samples)
+            else:
+                families[name] = (name, metric_type, help_text, list(samples))
+
+    lines = []
+    for name, metric_type, help_text, samples in families.values():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            lines.append(_format_sample(name, labels, value))
+
+    return "\n".join(lines) + "\n"
+
+def register_cache(name: str, cache: Any) -> None:
+    """Register the hit, miss and eviction counters of a cache with a `get_stats` method (e.g. cache_utils.LRUCache)."""
+
+    def collect() -> list[MetricFamily]:
+        stats = cache.get_stats()
+        lookups = stats["hits"] + stats["misses"]
+        labels = {"cache": name}
+        return [
+            ("mapsage_cache_entries", "gauge", "Number of entries in the cache", [(labels, stats["entries"])]),
+            ("mapsage_cache_size", "gauge", "Summed size of the entries in the cache", [(labels, stats["size"])]),
+            ("mapsage_cache_hits_total", "counter", "Number of cache hits", [(labels, stats["hits"])]),
+            ("mapsage_cache_misses_total", "counter", "Number of cache misses", [(labels, stats["misses"])]),
+            ("mapsage_cache_evictions_total", "counter", "Number of entries evicted from the cache", [(labels, stats["evictions"])]),
+            ("mapsage_cache_hit_ratio", "gauge", "Share of the lookups, which were hits, since the start", [(labels, stats["hits"] / lookups if lookups > 0 else 0.0)]),
+        ]
+
+    register_collector(f"cache:{name}", collect)
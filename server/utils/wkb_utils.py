@@ -0,0 +1,206 @@
+import math
+import struct
+from typing import Any, Optional
+
+import orjson
+
+# NumPy comes with the GDAL Python bindings, without it the geometries are encoded one by one by OGR
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GEOMETRY_TYPES = {
+    1: "Point",
+    2: "LineString",
+    3: "Polygon",
+    4: "MultiPoint",
+    5: "MultiLineString",
+    6: "MultiPolygon",
+    7: "GeometryCollection",
+}
+
+# Flags of the geometry type in EWKB (PostGIS) and the old OGC WKB with 2.5D types
+_EWKB_Z = 0x80000000
+_EWKB_M = 0x40000000
+_EWKB_SRID = 0x20000000
+
+def _get_positions(coordinates: Any, parts: Any) -> Any:
+    """The rows of a row range or the nested lists of rows of nested row ranges"""
+
+    if isinstance(parts, tuple):
+        return coordinates[parts[0]:parts[1]]
+
+    return [_get_positions(coordinates, part) for part in parts]
+
+class GeometryBatch(object):
+    """
+    WKB geometries of a page, whose coordinates are parsed into one contiguous array.\n
+    Every row of the array is a position (x, y, z), z is 0 for 2D geometries. The array can be rounded (or transformed) as a whole,
+    before every geometry is encoded as GeoJSON from the rows of its positions. Only the headers of the geometries are read
+    in Python, the coordinates of a part (ring, line string, ...) are copied at once.
+
+    Raises:
+        ValueError: If a WKB is invalid or contains curves, surfaces or other types, which GeoJSON doesn't know.
+    """
+
+    __slots__ = ("geometries", "coordinates", "_chunks", "_position_count")
+
+    def __init__(self, wkbs: list[Optional[bytes]]):
+        if numpy is None:
+            raise RuntimeError("NumPy is not installed")
+
+        self._chunks: list[tuple[Any, int]] = []
+        self._position_count = 0
+        # Per geometry: None or (type, has_z, parts), the parts are row ranges of the coordinates or nested parts
+        try:
+            self.geometries = [self._parse(memoryview(wkb), 0)[0] if wkb is not None else None for wkb in wkbs]
+        except struct.error as error:
+            raise ValueError("WKB is truncated") from error
+
+        self.coordinates = numpy.zeros((self._position_count, 3), dtype=numpy.float64)
+        start = 0
+        points = []
+        for chunk, columns in self._chunks:
+            # Consecutive points are copied together, since a copy per point costs more than the parsing
+            if columns == 0:
+                points.append(chunk)
+                continue
+            if points:
+                self.coordinates[start:start + len(points)] = points
+                start += len(points)
+                points = []
+
+            self.coordinates[start:start + len(chunk), :columns] = chunk[:, :columns]
+            start += len(chunk)
+        if points:
+            self.coordinates[start:start + len(points)] = points
+        del self._chunks, self._position_count
+
+    def _read_positions(self, wkb: memoryview, offset: int, count: int, byte_order: str, dimensions: int, has_z: bool) -> tuple[tuple[int, int], int]:
+        end = offset + count * dimensions * 8
+        if end > len(wkb):
+            raise ValueError("WKB is truncated")
+
+        chunk = numpy.frombuffer(wkb, dtype=byte_order + "f8", count=count * dimensions, offset=offset).reshape(count, dimensions)
+        # M values are dropped, since GeoJSON has no measures
+        self._chunks.append((chunk, 3 if has_z else 2))
+        start = self._position_count
+        self._position_count += count
+        return (start, start + count), end
+
+    def _parse(self, wkb: memoryview, offset: int) -> tuple[tuple, int]:
+        if offset + 5 > len(wkb):
+            raise ValueError("WKB is truncated")
+
+        byte_order = "<" if wkb[offset] == 1 else ">"
+        raw_type, = struct.unpack_from(byte_order + "I", wkb, offset + 1)
+        offset += 5
+
+        has_z = bool(raw_type & _EWKB_Z)
+        has_m = bool(raw_type & _EWKB_M)
+        if raw_type & _EWKB_SRID:
+            offset += 4
+        code = raw_type & 0x0FFFFFFF
+        # ISO WKB: 1000 Z, 2000 M, 3000 ZM
+        dimension_code, code = divmod(code, 1000)
+        has_z = has_z or dimension_code in (1, 3)
+        has_m = has_m or dimension_code in (2, 3)
+        dimensions = 2 + has_z + has_m
+
+        geometry_type = GEOMETRY_TYPES.get(code, None)
+        if geometry_type is None:
+            raise ValueError(f"WKB geometry type {raw_type} can't be encoded as GeoJSON")
+
+        if geometry_type == "Point":
+            position = struct.unpack_from(byte_order + "d" * dimensions, wkb, offset)
+            offset += dimensions * 8
+            # Empty points are written with NaN coordinates
+            if math.isnan(position[0]):
+                return (geometry_type, has_z, None), offset
+
+            # Points are kept as (x, y, z) tuples (marked with 0 columns) and copied together
+            self._chunks.append((position[:3] if has_z else (position[0], position[1], 0.0), 0))
+            self._position_count += 1
+            return (geometry_type, has_z, (self._position_count - 1, self._position_count)), offset
+
+        count, = struct.unpack_from(byte_order + "I", wkb, offset)
+        offset += 4
+
+        if geometry_type == "LineString":
+            rows, offset = self._read_positions(wkb, offset, count, byte_order, dimensions, has_z)
+            return (geometry_type, has_z, rows), offset
+
+        if geometry_type == "Polygon":
+            rings = []
+            for _ in range(count):
+                ring_count, = struct.unpack_from(byte_order + "I", wkb, offset)
+                rows, offset = self._read_positions(wkb, offset + 4, ring_count, byte_order, dimensions, has_z)
+                rings.append(rows)
+            return (geometry_type, has_z, rings), offset
+
+        parts = []
+        for _ in range(count):
+            part, offset = self._parse(wkb, offset)
+            parts.append(part)
+
+        if geometry_type == "MultiPoint":
+            # The points are consecutive rows, empty points can't be represented in GeoJSON and are left out
+            points = [part[2] for part in parts if part[2] is not None]
+            rows = (points[0][0], points[-1][1]) if points and all(points[i][1] == points[i + 1][0] for i in range(len(points) - 1)) else None
+            return (geometry_type, has_z, rows if rows is not None else points), offset
+        if geometry_type in ("MultiLineString", "MultiPolygon"):
+            return (geometry_type, has_z, [part[2] for part in parts]), offset
+
+        return (geometry_type, has_z, parts), offset
+
+    def round(self, precision: Optional[int]) -> None:
+        """Round the coordinates to the number of decimal places (None keeps the full precision)"""
+
+        if precision is not None:
+            numpy.round(self.coordinates, precision, out=self.coordinates)
+
+    def encode(self) -> list[bytes]:
+        """Encode every geometry as GeoJSON geometry object (null for missing geometries)"""
+
+        # Rows of a C-contiguous array are contiguous, the columns x and y are copied once for all 2D geometries
+        coordinates_3d = self.coordinates
+        coordinates_2d = numpy.ascontiguousarray(self.coordinates[:, :2])
+
+        def build(geometry: tuple) -> dict:
+            geometry_type, has_z, parts = geometry
+            coordinates = coordinates_3d if has_z else coordinates_2d
+
+            if geometry_type == "GeometryCollection":
+                return {"type": geometry_type, "geometries": [build(part) for part in parts]}
+            if geometry_type == "Point":
+                # A single position is cheaper to encode as list than as array
+                return {"type": geometry_type, "coordinates": coordinates[parts[0]].tolist() if parts is not None else []}
+            if geometry_type == "MultiPoint" and isinstance(parts, list):
+                return {"type": geometry_type, "coordinates": [coordinates[rows[0]].tolist() for rows in parts]}
+
+            return {"type": geometry_type, "coordinates": _get_positions(coordinates, parts)}
+
+        return [orjson.dumps(build(geometry), option=orjson.OPT_SERIALIZE_NUMPY) if geometry is not None else b"null" for geometry in self.geometries]
+
+def encode_geometries(wkbs: list[Optional[bytes]], precision: Optional[int] = None, transformation: Optional[Any] = None) -> list[bytes]:
+    """Encode the WKB geometries of a page as GeoJSON geometry objects in one pass.
+
+    Args:
+        wkbs (list[Optional[bytes]]): The geometries as (ISO, OGC or extended) WKB, None for features without geometry.
+        precision (Optional[int]): The number of decimal places of the coordinates (after the transformation). None keeps the full precision.
+        transformation (Optional[Any]): Transforms the coordinate array of the page in place before it is rounded (e.g. gdal_utils.BulkTransformation).
+
+    Raises:
+        RuntimeError: If NumPy is not installed.
+        ValueError: If a geometry can't be encoded as GeoJSON (e.g. curves).
+
+    Returns:
+        list[bytes]: The encoded geometries in the order of the WKBs.
+    """
+
+    batch = GeometryBatch(wkbs)
+    if transformation is not None:
+        transformation.transform(batch.coordinates)
+    batch.round(precision)
+    return batch.encode()
@@ -0,0 +1,207 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import math
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from server.utils import metrics
+
+class WorkerPoolOverloaded(Exception):
+    """Raised, if a task is rejected, since too many tasks are already waiting for a worker"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many queued requests, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+class WorkerPool(object):
+    """
+    Bounded thread pool for blocking (GDAL) work with admission control.\n
+    At most `max_workers` tasks run at once and at most `max_collection_tasks` tasks of one collection run or wait for a worker, so a single
+    expensive collection can't occupy all workers. If more than `max_queue` tasks are waiting, new tasks are rejected immediately
+    instead of letting the latency of all requests grow.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, max_collection_tasks: int, cpu_budget: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_collection_tasks = max_collection_tasks
+        # Threads GDAL may use per task (GDAL_NUM_THREADS), so all workers together stay within the CPU budget
+        self.threads_per_task = max(1, cpu_budget // max_workers)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gdal-worker")
+        self._lock = threading.Lock()
+        # Semaphores are bound to the event loop, in which they are used first
+        self._semaphores: dict[tuple[asyncio.AbstractEventLoop, str], asyncio.Semaphore] = {}
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_sum = 0.0
+        self.run_seconds_sum = 0.0
+
+    def _get_semaphore(self, collection_id: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get((loop, collection_id))
+            if semaphore is None:
+                # Drop the semaphores of closed loops (e.g. of finished test clients)
+                for key in [key for key in self._semaphores if key[0].is_closed()]:
+                    del self._semaphores[key]
+
+                semaphore = asyncio.Semaphore(self.max_collection_tasks)
+                self._semaphores[(loop, collection_id)] = semaphore
+
+            return semaphore
+
+    def get_retry_after(self) -> int:
+        """Estimate the seconds until the queue has room again, from the average run time of the tasks"""
+
+        with self._lock:
+            average_run_seconds = self.run_seconds_sum / self.completed if self.completed > 0 else 1.0
+            queued = self.queued
+
+        return max(1, math.ceil(average_run_seconds * queued / self.max_workers))
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                admitted = False
+            else:
+                self.queued += 1
+                admitted = True
+
+        if not admitted:
+            raise WorkerPoolOverloaded(self.get_retry_after())
+
+    def _finish(self, started_at: float) -> None:
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.run_seconds_sum += time.monotonic() - started_at
+
+    async def run(self, collection_id: str, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking function in the pool.
+
+        Raises:
+            WorkerPoolOverloaded: If too many tasks are already waiting.
+        """
+
+        self._admit()
+        queued_at = time.monotonic()
+        # "queued" until a worker picks the task up, "cancelled" if the request was cancelled before that
+        state = ["queued"]
+
+        def task() -> Any:
+            with self._lock:
+                if state[0] == "cancelled":
+                    return None
+                state[0] = "started"
+                self.queued -= 1
+                self.wait_seconds_sum += time.monotonic() - queued_at
+                self.running += 1
+
+            started_at = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                self._finish(started_at)
+
+        try:
+            async with self._get_semaphore(collection_id):
+                return await asyncio.get_running_loop().run_in_executor(self._executor, task)
+        finally:
+            with self._lock:
+                if state[0] == "queued":
+                    state[0] = "cancelled"
+                    self.queued -= 1
+
+    async def iterate(self, collection_id: str, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """Iterate a blocking iterator of an already admitted task in the pool (e.g. a streamed response). \n
+        The stream counts as one task of the collection, until it is exhausted. The iterator is closed, when the iteration ends or is abandoned.
+        """
+
+        sentinel = object()
+        pending: Optional[Future] = None
+        try:
+            async with self._get_semaphore(collection_id):
+                while True:
+                    with self._lock:
+                        self.running += 1
+                    try:
+                        pending = self._executor.submit(next, iterator, sentinel)
+                        chunk = await asyncio.wrap_future(pending)
+                    finally:
+                        with self._lock:
+                            self.running -= 1
+
+                    if chunk is sentinel:
+                        break
+
+                    yield chunk
+        finally:
+            # Abandoned streams (e.g. the client disconnected) release their resources right away instead of whenever they are garbage collected.
+            # The iterator is closed in the pool, after a chunk, which is still being produced, is finished, since it can't be closed meanwhile.
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                if pending is not None:
+                    pending.add_done_callback(lambda _: self._executor.submit(close))
+                else:
+                    self._executor.submit(close)
+
+    def run_on_all_workers(self, func: Callable[..., Any], *args: Any, timeout: float = 10.0) -> None:
+        """Run a blocking function once in every worker thread and wait for it (e.g. to fill thread-local caches at startup). \n
+        The tasks wait for each other, so every worker picks up one of them, as long as no other tasks occupy the workers.
+        """
+
+        barrier = threading.Barrier(self.max_workers)
+
+        def task() -> None:
+            try:
+                barrier.wait(timeout)
+            except threading.BrokenBarrierError:
+                # Busy workers: The function may run twice in some threads and not at all in others
+                pass
+            func(*args)
+
+        for future in [self._executor.submit(task) for _ in range(self.max_workers)]:
+            future.result()
+
+    def get_stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_seconds_sum": self.wait_seconds_sum,
+                "run_seconds_sum": self.run_seconds_sum,
+            }
+
+_CPU_COUNT = os.cpu_count() or 1
+_MAX_WORKERS = int(os.getenv("APP_GDAL_WORKERS", str(min(32, _CPU_COUNT + 4))))
+
+FEATURE_WORKER_POOL = WorkerPool(
+    max_workers=_MAX_WORKERS,
+    max_queue=int(os.getenv("APP_GDAL_MAX_QUEUE", str(_MAX_WORKERS * 4))),
+    max_collection_tasks=int(os.getenv("APP_GDAL_MAX_COLLECTION_TASKS", str(max(1, _MAX_WORKERS // 2)))),
+    cpu_budget=int(os.getenv("APP_GDAL_CPU_BUDGET", str(_CPU_COUNT))),
+)
+
+def _collect_worker_pool_metrics() -> list[metrics.MetricFamily]:
+    stats = FEATURE_WORKER_POOL.get_stats()
+    return [
+        ("mapsage_gdal_workers_max", "gauge", "Number of GDAL worker threads", [({}, stats["max_workers"])]),
+        ("mapsage_gdal_workers_queue_depth", "gauge", "Number of feature queries waiting for a worker", [({}, stats["queued"])]),
+        ("mapsage_gdal_workers_running", "gauge", "Number of feature queries running on a worker", [({}, stats["running"])]),
+        ("mapsage_gdal_workers_completed_total", "counter", "Number of finished feature queries", [({}, stats["completed"])]),
+        ("mapsage_gdal_workers_rejected_total", "counter", "Number of feature queries rejected with 503, since the queue was full", [({}, stats["rejected"])]),
+        ("mapsage_gdal_workers_wait_seconds_total", "counter", "Total time feature queries waited for a worker in seconds", [({}, stats["wait_seconds_sum"])]),
+        ("mapsage_gdal_workers_run_seconds_total", "counter", "Total time feature queries ran on a worker in seconds", [({}, stats["run_seconds_sum"])]),
+    ]
+
+metrics.register_collector("gdal_workers", _collect_worker_pool_metrics)
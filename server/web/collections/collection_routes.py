@@ -1,10 +1,8 @@
 import os
 from flask import Blueprint, request, Response, current_app
 
-from server.ogc_apis.features.implementation import static
-from server.web.collections.collections import create_collection, create_collections, delete_collections, get_all_collections, get_collection_details, update_collection
+from server.web.collections.collections import create_collection, create_collections, delete_collections, get_all_collections, get_collection_details, refresh_collections, update_collection
 from server.web.collections.licenses import get_licenses
-from server.web.flask_utils import get_app_url_root
 
 def create_collections_endpoints(main_endpoint: str) -> Blueprint:
     bp_url_prefix = main_endpoint + "/collections"
@@ -30,7 +28,6 @@ def create_collections_endpoints(main_endpoint: str) -> Blueprint:
                     response = create_collection(request_data, return_object=False)
                 else:
                     response = create_collections(request_data)
-                static.collections.update_database_object(app_base_url=get_app_url_root())
                 return response
             
             if request.method == "DELETE":
@@ -38,7 +35,6 @@ def create_collections_endpoints(main_endpoint: str) -> Blueprint:
                     return Response(status=400, response="Bad request")
                 
                 response = delete_collections(request_data)
-                static.collections.update_database_object(app_base_url=get_app_url_root())
                 return response
             
         except Exception as e:
@@ -48,6 +44,18 @@ def create_collections_endpoints(main_endpoint: str) -> Blueprint:
         # Send HTTP Error 501 (Not implemented), when method is not GET, POST or DELETE
         return Response(status=501, response="Method not implemented")
     
+    @bp.route('/refresh', methods=["POST"])
+    def refresh() -> Response:
+        request_data = request.get_json() if request.data else None
+        if request_data is None:
+            return Response(status=400, response="Bad request")
+        
+        try:
+            return refresh_collections(request_data)
+        except Exception as e:
+            current_app.logger.error(msg=f"Error while processing request: {e}", exc_info=True)
+            return Response(status=500, response="Internal server error")
+    
     @bp.route('/<collection_uuid>', methods=["GET", "PATCH"])
     def get_collection(collection_uuid: str) -> Response:
         request_data = request.get_json() if request.data else None
@@ -61,7 +69,6 @@ def create_collections_endpoints(main_endpoint: str) -> Blueprint:
                     return Response(status=400, response="Bad request")
                 
                 response = update_collection(collection_uuid, request_data)
-                static.collections.update_database_object(app_base_url=get_app_url_root())
                 return response
         except Exception as e:
             current_app.logger.error(msg=f"Error while processing request: {e}", exc_info=True)
@@ -1,5 +1,7 @@
+import logging
 import os
-from typing import Optional
+import threading
+from typing import Iterable, Optional
 from uuid import UUID
 import orjson
 from sqlmodel import select, text
@@ -9,11 +11,22 @@ from server.database import models
 
 from osgeo import gdal, ogr
 
-from server.ogc_apis.features.implementation.dynamic import collection_impl
+from server.ogc_apis.features.implementation.dynamic import collection_impl, feature_impl, generalized_geometry, materialized_geometry, postgis_query
+from server.ogc_apis.config.params import COORDINATE_PRECISION_MAXIMUM, NumberMatched
 from server.web.flask_utils import get_app_url_root
+from server.utils import gdal_utils
     
 gdal.UseExceptions()
 
+_LOGGER = logging.getLogger("server.web")
+
+# The generalized layers are built one level at a time, since every level reads and writes the whole layer
+_GENERALIZATION_LOCK = threading.Lock()
+_QUEUED_GENERALIZATION_LEVELS: set[tuple[UUID, float]] = set()
+# The materialized views are built one CRS at a time, since every view reads and transforms the whole table
+_MATERIALIZATION_LOCK = threading.Lock()
+_QUEUED_MATERIALIZED_CRS: set[tuple[UUID, str]] = set()
+
 # FIXME: Only return a page worth of collections at a time (handle pagination)
 def get_all_collections():
     # Not pretty, since we normally use the Database class to interact, but otherwise it would be more complicated
@@ -73,6 +86,13 @@ def get_collection_details(collection_uuid: str):
         "crs": collection.crs_json,
         "storage_crs": collection.storage_crs,
         "storage_crs_coordinate_epoch": collection.storage_crs_coordinate_epoch,
+        "number_matched": collection.number_matched,
+        "feature_engine": collection.feature_engine,
+        "coordinate_precision": collection.coordinate_precision,
+        "materialized_crs": collection.materialized_crs_json or [],
+        "materialized_crs_ready": collection.materialized_crs_ready_json or [],
+        "generalization": collection.generalization_json or [],
+        "generalization_ready": collection.generalization_ready_json or [],
     }
     
     return json_data
@@ -86,13 +106,11 @@ def create_collection(form: dict, connection_string: str = None, gdal_dataset: g
     if count_existing_collection is not None and count_existing_collection[0] > 0:
         return Response(status=409, response="Collection already exists")
     
-    app_url_root = get_app_url_root()
-    
     if gdal_dataset is None:
         with gdal.OpenEx(connection_string) as gdal_dataset:
-            new_collection = collection_impl.generate_collection_table_object(form["layer_name"], form["uuid"], gdal_dataset, app_url_root)
+            new_collection = collection_impl.generate_collection_table_object(form["layer_name"], form["uuid"], gdal_dataset)
     else:
-        new_collection = collection_impl.generate_collection_table_object(form["layer_name"], form["uuid"], gdal_dataset, app_url_root)
+        new_collection = collection_impl.generate_collection_table_object(form["layer_name"], form["uuid"], gdal_dataset)
     
     new_collection = Database.insert_sqlite_db(new_collection)
     
@@ -134,32 +152,260 @@ def create_collections(form: dict):
     else:
         return Response(status=207, response=orjson.dumps({"message": "Some collections created", "successful_layers": successful_layers, "failed_layers": failed_layers}))
 
+def drop_materialized_views(collection: models.CollectionTable) -> None:
+    """Drop the materialized views of the reprojected geometries of a collection (see materialized_geometry)"""
+    
+    srids = materialized_geometry.get_materialized_srids(collection.materialized_crs_json)
+    if collection.dataset.type != models.Dataset.Type.DB or not srids:
+        return
+    
+    with gdal.OpenEx(collection.dataset.path) as gdal_dataset:
+        materialized_geometry.apply_views(gdal_dataset, collection.layer_name, collection.fid_column, collection.geometry_column, [], srids)
+
+def update_materialized_crs(collection: models.CollectionTable, materialized_crs: Optional[list]) -> Optional[Response]:
+    """Validate the CRSs, whose reprojected geometries are materialized. The views of added CRSs are built and those of removed CRSs dropped
+    by `start_materialization_job`, after the collection is saved. Returns an error response, if the CRSs can't be materialized.
+    """
+    
+    materialized_crs = materialized_crs or []
+    if not isinstance(materialized_crs, list) or any(crs not in collection.crs_json for crs in materialized_crs):
+        return Response(status=400, response="Materialized CRS must be a list of CRS of the collection")
+    if len(materialized_crs) > 0 and collection.dataset.type != models.Dataset.Type.DB:
+        return Response(status=400, response="Geometries can only be materialized for PostgreSQL datasets")
+    if len(materialized_crs) > 0 and collection.storage_crs_coordinate_epoch:
+        return Response(status=400, response="Geometries of a dynamic storage CRS with coordinate epoch can't be materialized")
+    
+    for crs in materialized_crs:
+        try:
+            srid, _ = postgis_query.get_srid_from_ressource(crs)
+        except ValueError as error:
+            return Response(status=400, response=f"CRS {crs} can't be materialized: {error}")
+        if srid == collection.srid:
+            return Response(status=400, response=f"CRS {crs} has the SRID of the storage CRS and doesn't need to be materialized")
+    
+    collection.materialized_crs_json = materialized_crs if len(materialized_crs) > 0 else None
+    ready_crs = [crs for crs in collection.materialized_crs_ready_json or [] if crs in materialized_crs]
+    collection.materialized_crs_ready_json = ready_crs if len(ready_crs) > 0 else None
+    return None
+
+def start_materialization_job(collection_uuid: UUID, materialized_crs: Iterable[str], removed_crs: Iterable[str] = ()) -> None:
+    """Build the materialized views of the CRSs and drop the views of the removed CRSs of a collection in a background thread.
+    A view is joined by items requests, once its CRS is marked as ready.
+    """
+    
+    materialized_crs = [crs for crs in materialized_crs if (collection_uuid, crs) not in _QUEUED_MATERIALIZED_CRS]
+    removed_crs = list(removed_crs)
+    if not materialized_crs and not removed_crs:
+        return
+    
+    _QUEUED_MATERIALIZED_CRS.update((collection_uuid, crs) for crs in materialized_crs)
+    threading.Thread(target=_run_materialization_job, args=(collection_uuid, materialized_crs, removed_crs), name="materialization-job", daemon=True).start()
+
+def _run_materialization_job(collection_uuid: UUID, materialized_crs: list[str], removed_crs: list[str]) -> None:
+    with _MATERIALIZATION_LOCK:
+        with DatabaseSession() as session:
+            collection: Optional[models.CollectionTable] = session.get(models.CollectionTable, collection_uuid)
+            if collection is not None and removed_crs:
+                # A removed CRS could have been added again (or share its SRID with a remaining one), while the job was queued
+                removed_srids = materialized_geometry.get_materialized_srids(removed_crs) - materialized_geometry.get_materialized_srids(collection.materialized_crs_json)
+                try:
+                    with gdal.OpenEx(collection.dataset.path) as gdal_dataset:
+                        materialized_geometry.apply_views(gdal_dataset, collection.layer_name, collection.fid_column, collection.geometry_column, [], removed_srids)
+                except Exception as error:
+                    _LOGGER.error(msg=f"Dropping the materialized views of collection '{collection.id}' failed: {error}", exc_info=True)
+        
+        for crs in materialized_crs:
+            try:
+                with DatabaseSession() as session:
+                    collection: Optional[models.CollectionTable] = session.get(models.CollectionTable, collection_uuid)
+                    # The CRS could have been removed (or the collection deleted), while the job was queued
+                    if collection is None or crs not in (collection.materialized_crs_json or []):
+                        continue
+                    dataset_path, layer_name = collection.dataset.path, collection.layer_name
+                    fid_column, geometry_column = collection.fid_column, collection.geometry_column
+                
+                srids = materialized_geometry.get_materialized_srids([crs])
+                with gdal.OpenEx(dataset_path) as gdal_dataset:
+                    if not fid_column or not geometry_column:
+                        layer: ogr.Layer = gdal_dataset.GetLayerByName(layer_name)
+                        if layer is None:
+                            raise ValueError(f"Layer {layer_name} not found in dataset")
+                        
+                        layer_metadata = collection_impl.resolve_layer_metadata(gdal_dataset, layer)
+                        fid_column, geometry_column = layer_metadata.fid_column, layer_metadata.geometry_column
+                    
+                    materialized_geometry.apply_views(gdal_dataset, layer_name, fid_column, geometry_column, srids)
+                
+                with DatabaseSession() as session:
+                    collection = session.get(models.CollectionTable, collection_uuid)
+                    if collection is None or crs not in (collection.materialized_crs_json or []):
+                        with gdal.OpenEx(dataset_path) as gdal_dataset:
+                            remaining_srids = materialized_geometry.get_materialized_srids(collection.materialized_crs_json) if collection is not None else frozenset()
+                            materialized_geometry.apply_views(gdal_dataset, layer_name, fid_column, geometry_column, [], srids - remaining_srids)
+                        continue
+                    collection.materialized_crs_ready_json = sorted(set(collection.materialized_crs_ready_json or []) | {crs})
+                
+                Database.update_sqlite_db(collection, collection.uuid)
+                feature_impl.invalidate_collection_caches(collection.id)
+                _LOGGER.info(msg=f"Built the materialized view of CRS {crs} of collection '{collection.id}'")
+            except Exception as error:
+                _LOGGER.error(msg=f"Building the materialized view of CRS {crs} of collection '{collection_uuid}' failed: {error}", exc_info=True)
+            finally:
+                _QUEUED_MATERIALIZED_CRS.discard((collection_uuid, crs))
+
+def update_generalization(collection: models.CollectionTable, levels: Optional[list]) -> Optional[Response]:
+    """Validate the generalization levels (scale denominators) and drop the generalized layers of removed levels.
+    The layers of added levels are built by `start_generalization_job`, after the collection is saved. Returns an error response, if the levels are invalid.
+    """
+    
+    if levels is not None and not isinstance(levels, list):
+        return Response(status=400, response="Generalization levels must be a list of scale denominators")
+    try:
+        levels = generalized_geometry.parse_levels(levels)
+    except ValueError as error:
+        return Response(status=400, response=str(error))
+    
+    removed_levels = [level for level in collection.generalization_json or [] if level not in levels]
+    generalized_geometry.drop_levels(collection.dataset.path, collection.dataset.type, collection.layer_name, collection.uuid, removed_levels)
+    
+    collection.generalization_json = levels if len(levels) > 0 else None
+    ready_levels = [level for level in collection.generalization_ready_json or [] if level in levels]
+    collection.generalization_ready_json = ready_levels if len(ready_levels) > 0 else None
+    return None
+
+def start_generalization_job(collection_uuid: UUID, levels: Iterable[float]) -> None:
+    """Build the generalized layers of the levels of a collection in a background thread. A level is used by items requests, once it is marked as ready."""
+    
+    levels = [level for level in levels if (collection_uuid, level) not in _QUEUED_GENERALIZATION_LEVELS]
+    if not levels:
+        return
+    
+    _QUEUED_GENERALIZATION_LEVELS.update((collection_uuid, level) for level in levels)
+    threading.Thread(target=_run_generalization_job, args=(collection_uuid, levels), name="generalization-job", daemon=True).start()
+
+def _run_generalization_job(collection_uuid: UUID, levels: list[float]) -> None:
+    with _GENERALIZATION_LOCK:
+        for level in levels:
+            try:
+                with DatabaseSession() as session:
+                    collection: Optional[models.CollectionTable] = session.get(models.CollectionTable, collection_uuid)
+                    # The level could have been removed (or the collection deleted), while the job was queued
+                    if collection is None or level not in (collection.generalization_json or []):
+                        continue
+                    dataset_path, dataset_type, layer_name = collection.dataset.path, collection.dataset.type, collection.layer_name
+                
+                generalized_geometry.build_level(dataset_path, dataset_type, layer_name, collection_uuid, level)
+                
+                with DatabaseSession() as session:
+                    collection = session.get(models.CollectionTable, collection_uuid)
+                    if collection is None or level not in (collection.generalization_json or []):
+                        generalized_geometry.drop_levels(dataset_path, dataset_type, layer_name, collection_uuid, [level])
+                        continue
+                    collection.generalization_ready_json = sorted(set(collection.generalization_ready_json or []) | {level})
+                
+                Database.update_sqlite_db(collection, collection.uuid)
+                feature_impl.invalidate_collection_caches(collection.id)
+                # Pooled datasets could still hold the definition of a previous build
+                gdal_utils.DATASET_POOL.clear(dataset_path)
+                _LOGGER.info(msg=f"Built generalization level 1:{int(level)} of collection '{collection.id}'")
+            except Exception as error:
+                _LOGGER.error(msg=f"Building generalization level 1:{int(level)} of collection '{collection_uuid}' failed: {error}", exc_info=True)
+            finally:
+                _QUEUED_GENERALIZATION_LEVELS.discard((collection_uuid, level))
+
 def delete_collections(form: dict):
     collection_ids = form.get("uuids", None)
     if not collection_ids:
         return Response(status=400, response="Bad request")
     
+    # The views are owned by the collection, the table stays as it is
+    with DatabaseSession() as session:
+        for collection_id in collection_ids:
+            collection: Optional[models.CollectionTable] = session.get(models.CollectionTable, UUID(collection_id))
+            if collection is not None:
+                drop_materialized_views(collection)
+                generalized_geometry.drop_levels(collection.dataset.path, collection.dataset.type, collection.layer_name, collection.uuid, collection.generalization_json or [])
+    
     collections = Database.delete_sqlite_db(models.CollectionTable, collection_ids)
     if not collections:
         return Response(status=404, response="Collections not found")
     
+    for collection in collections if type(collections) is list else [collections]:
+        feature_impl.invalidate_collection_caches(collection.id)
+    
     return Response(status=204, response="Collections successfully deleted")
 
+def refresh_collections(form: dict):
+    """Resolve the layer metadata (FID and geometry column, SRID, fields) of the collections again, e.g. after the table was altered."""
+    
+    collection_ids = form.get("uuids", None)
+    if not collection_ids:
+        return Response(status=400, response="Bad request")
+    
+    refreshed_collections = []
+    with DatabaseSession() as session:
+        for collection_id in collection_ids:
+            collection: models.CollectionTable = session.get(models.CollectionTable, UUID(collection_id))
+            if not collection:
+                return Response(status=404, response="Collection not found")
+            
+            with gdal.OpenEx(collection.dataset.path) as gdal_dataset:
+                layer: ogr.Layer = gdal_dataset.GetLayerByName(collection.layer_name)
+                if layer is None:
+                    return Response(status=404, response=f"Layer {collection.layer_name} not found in dataset")
+                
+                collection_impl.apply_layer_metadata(collection, collection_impl.resolve_layer_metadata(gdal_dataset, layer))
+            
+            # The generalized layers are copies of the previous data, they are served in full resolution until they are rebuilt
+            collection.generalization_ready_json = None
+            refreshed_collections.append((collection, collection.dataset.path))
+    
+    for collection, dataset_path in refreshed_collections:
+        Database.update_sqlite_db(collection, collection.uuid)
+        feature_impl.invalidate_collection_caches(collection.id)
+        # Pooled datasets could still hold the old layer definition
+        gdal_utils.DATASET_POOL.clear(dataset_path)
+        start_generalization_job(collection.uuid, collection.generalization_json or [])
+    
+    return Response(status=204, response="Collections successfully refreshed")
+
 def update_collection(uuid: str, form: dict):
+    if "number_matched" in form and form["number_matched"] not in [mode.value for mode in NumberMatched]:
+        return Response(status=400, response=f"Number matched must be one of {', '.join(mode.value for mode in NumberMatched)}")
+    if "feature_engine" in form and form["feature_engine"] not in [engine.value for engine in models.CollectionTable.FeatureEngine]:
+        return Response(status=400, response=f"Feature engine must be one of {', '.join(engine.value for engine in models.CollectionTable.FeatureEngine)}")
+    if form.get("coordinate_precision") is not None and (type(form["coordinate_precision"]) != int or not 0 <= form["coordinate_precision"] <= COORDINATE_PRECISION_MAXIMUM):
+        return Response(status=400, response=f"Coordinate precision must be a number of decimal places between 0 and {COORDINATE_PRECISION_MAXIMUM}")
+    
     with DatabaseSession() as session:
         collection: models.CollectionTable = session.get(models.CollectionTable, UUID(uuid))
         if not collection:
             return Response(status=404, response="Collection not found")
         
-        app_url_root = get_app_url_root()
+        previous_id = collection.id
+        previous_materialized_crs = list(collection.materialized_crs_json or [])
+        if "materialized_crs" in form:
+            error_response = update_materialized_crs(collection, form.pop("materialized_crs"))
+            if error_response is not None:
+                return error_response
+        
+        if "generalization" in form:
+            error_response = update_generalization(collection, form.pop("generalization"))
+            if error_response is not None:
+                return error_response
+        
         if "selected_date_time_field" in form:
             form.setdefault("uuid", collection.uuid)
             form.setdefault("id", collection.id)
             form.setdefault("title", collection.title)
             form.setdefault("description", collection.description)
             form.setdefault("license_title", collection.license_title)
+            form.setdefault("materialized_crs_json", list(collection.materialized_crs_json) if collection.materialized_crs_json else None)
+            form.setdefault("materialized_crs_ready_json", list(collection.materialized_crs_ready_json) if collection.materialized_crs_ready_json else None)
+            form.setdefault("generalization_json", list(collection.generalization_json) if collection.generalization_json else None)
+            form.setdefault("generalization_ready_json", list(collection.generalization_ready_json) if collection.generalization_ready_json else None)
             with gdal.OpenEx(collection.dataset.path) as gdal_dataset:
-                collection = collection_impl.generate_collection_table_object(collection.layer_name, collection.dataset.uuid, gdal_dataset, app_url_root, form)
+                collection = collection_impl.generate_collection_table_object(collection.layer_name, collection.dataset.uuid, gdal_dataset, form)
         else:
             for key, value in form.items():
                 if key in ["uuid", "id"]:
@@ -168,9 +414,19 @@ def update_collection(uuid: str, form: dict):
                 if hasattr(collection, key):
                     setattr(collection, key, value)
             
-            collection.pre_render(app_base_url=app_url_root)
+            collection.pre_render()
         
     Database.update_sqlite_db(collection, collection.uuid)
+    # Cached responses and feature counts of the collection may no longer match its settings
+    feature_impl.invalidate_collection_caches(previous_id)
+    feature_impl.invalidate_collection_caches(collection.id)
+    # Views and levels, which aren't built yet (e.g. added or failed before)
+    start_materialization_job(
+        collection.uuid,
+        [crs for crs in collection.materialized_crs_json or [] if crs not in (collection.materialized_crs_ready_json or [])],
+        [crs for crs in previous_materialized_crs if crs not in (collection.materialized_crs_json or [])],
+    )
+    start_generalization_job(collection.uuid, [level for level in collection.generalization_json or [] if level not in (collection.generalization_ready_json or [])])
     
     collection_information = get_collection_details(collection.uuid.__str__())
     return Response(status=200, response=orjson.dumps(collection_information))
\ No newline at end of file
@@ -2,8 +2,9 @@ from typing import Union
 from flask import Response
 import orjson
 
-from server.database import models
+from server.database import models, pg_pool
 from server.database.db import Database
+from server.utils import gdal_utils
 
 from osgeo import gdal, ogr
 
@@ -33,7 +34,11 @@ def create_new_connection(form: dict) -> Response:
     
     if test_successful:
         form["type"] = models.Dataset.Type.DB
-        new_connection: models.Dataset = models.Dataset.from_dict(form)       
+        try:
+            new_connection: models.Dataset = models.Dataset.from_dict(form)
+        except ValueError as error:
+            return Response(status=400, response=str(error))
+        
         new_connection = Database.insert_sqlite_db(data_object=new_connection)
         if new_connection is None:
             return Response(status=500, response="Error while inserting connection into database")
@@ -49,6 +54,9 @@ def delete_connection(uuid: str) -> Response:
     if not connection:
         return Response(status=404, response="Connection not found")
     
+    gdal_utils.DATASET_POOL.clear(connection.path)
+    pg_pool.close_pool(connection.uuid)
+    
     return Response(status=204, response="Connection successfully deleted")
 
 def get_dataset_layers_information(dataset_uuid: str) -> Response:
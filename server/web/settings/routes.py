@@ -2,7 +2,6 @@ import os
 from flask import Blueprint, request, Response, current_app
 
 from server.ogc_apis.features.implementation import static
-from server.web.flask_utils import get_app_url_root
 from server.web.settings.general import get_general_options, update_general_options
 
 def create_settings_endpoints(main_endpoint: str) -> Blueprint:
@@ -24,7 +23,7 @@ def create_settings_endpoints(main_endpoint: str) -> Blueprint:
             
             if request.method == "PATCH":
                 response = update_general_options(request_data)
-                static.landing_page.update_database_object(app_base_url=get_app_url_root())
+                static.landing_page.update_database_object()
                 return response
             
         except Exception as e: